@@ -1,22 +1,169 @@
 """
 This is Python script to build a Server for Library application
 """
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
+import atexit
+import base64
+import bisect
+import csv
 import enum
+import functools
+import gzip
+import hashlib
+import io
+import itertools
+import json
 import logging
-from flask import Flask, request, jsonify, send_file
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+import zlib
+import click
+from flask import Flask, Response, g, request, jsonify, has_request_context, stream_with_context
 from flask_cors import CORS
-import pytz
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from werkzeug.exceptions import BadRequest
-from sqlalchemy import func
+from sqlalchemy import Select, bindparam, case, column, create_engine, event, func, literal, select, table, text, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from serializers import (format_date, format_datetime, customer_row, book_row, loan_row, late_loan_row,
+                         returned_book_row, log_entry_row, log_event_row)
+from audit_events import EVENTS, TEXT_EVENT, encode_params, parse_action
+from search_queries import SearchStatements
 
 
 app = Flask(__name__)
-CORS(app,resources={r"/*":{"origins":"*","methods":["GET","POST","PUT","DELETE"],"allow_headers":"*"}})
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///library.db'
+CORS(app,resources={r"/*":{"origins":"*","methods":["GET","POST","PUT","DELETE"],"allow_headers":"*",
+                            "expose_headers":["X-Alert-Message","X-Next-Cursor","X-Tail-Cursor","X-Total-Count","ETag"]}})
+# The database file can be changed with the LIBRARY_DATABASE_URI environment variable (the benchmarks use a throwaway one):
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('LIBRARY_DATABASE_URI', 'sqlite:///library.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+# SQLite settings applied to every new connection - WAL lets readers and the writer work at the same time:
+app.config['SQLITE_PRAGMAS'] = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',   # with WAL only the checkpoints wait for the disk
+    'busy_timeout': 5000,      # ms to wait for the write lock before "database is locked"
+    'mmap_size': 268435456,    # 256MB of the file read through memory mapping
+    'cache_size': -64000,      # 64MB page cache per connection (negative = KB)
+    'temp_store': 'MEMORY' }
+# GET routes read through a seperate query_only engine so they never take the write lock:
+app.config['SQLITE_READ_ENGINE'] = True
+# Audit log writer settings - 'batched' buffers the log rows and inserts them from a background thread,
+# 'sync' commits every log row inside the request like it used to:
+app.config['AUDIT_LOG_DURABILITY'] = 'batched'
+app.config['AUDIT_LOG_QUEUE_SIZE'] = 10000
+app.config['AUDIT_LOG_BATCH_SIZE'] = 200
+app.config['AUDIT_LOG_FLUSH_INTERVAL'] = 1.0  # seconds
+# How long every worker keeps the earliest loan due date before it reads it again, to see loans made or returned by the other workers:
+app.config['OVERDUE_TRACKER_REFRESH_SECONDS'] = 5
+# Page sizes for the log entries API:
+app.config['LOG_ENTRIES_PAGE_SIZE'] = 200
+app.config['LOG_ENTRIES_MAX_PAGE_SIZE'] = 1000
+# Page sizes of the search routes (/search_customers, /search_books, /search_loans, /search_late_loans, /Returned_Books_list):
+app.config['SEARCH_PAGE_SIZE'] = 200
+app.config['SEARCH_MAX_PAGE_SIZE'] = 1000
+# How long a worker may answer /stats from its cache before reading the tables again (changes made in other workers):
+app.config['STATS_CACHE_SECONDS'] = 5
+# Longest range of days one /stats/history call may ask for:
+app.config['STATS_HISTORY_MAX_DAYS'] = 3660
+# Most (customer, book) pairs one call to /loan_books or /return_books may hold:
+app.config['BATCH_MAX_ITEMS'] = 500
+# Bulk import - rows per duplicate check + insert + commit, and how many row errors the report lists:
+app.config['IMPORT_CHUNK_SIZE'] = 1000
+app.config['IMPORT_MAX_REPORTED_ERRORS'] = 1000
+# Exports - rows read from the database per fetch, and bytes collected before sending a piece of the response:
+app.config['EXPORT_FETCH_SIZE'] = 1000
+app.config['EXPORT_FLUSH_BYTES'] = 65536
+# Log retention - entries older than this move to monthly gzipped NDJSON files (flask --app app archive-logs),
+# deleted from the table in chunks with a short pause between them so writers get the lock:
+app.config['LOG_RETENTION_DAYS'] = 180
+app.config['LOG_ARCHIVE_DIR'] = None # None = <instance folder>/log_archive
+app.config['LOG_ARCHIVE_CHUNK_SIZE'] = 5000
+app.config['LOG_ARCHIVE_PAUSE_SECONDS'] = 0.05
+# Request metrics (/metrics) - every worker writes its counters to a file in this folder at most once per interval,
+# use a folder on local disk that all the workers of one server share:
+app.config['METRICS_DIR'] = None # None = <instance folder>/metrics
+app.config['METRICS_WRITE_INTERVAL'] = 1.0  # seconds
+# Cache of the search routes answers (per worker), dropped when the tables they read change:
+app.config['RESPONSE_CACHE_ENABLED'] = True
+app.config['RESPONSE_CACHE_MAX_ENTRIES'] = 256
+app.config['RESPONSE_CACHE_MAX_BYTES'] = 33554432 # 32MB
+# Write admission control - requests of one worker that write at the same time (SQLite has one writer anyway), how many may wait,
+# how long a request may wait (counted from its start) before a 503 with Retry-After, and the long routes that dont queue:
+app.config['WRITE_QUEUE_ENABLED'] = True
+app.config['WRITE_CONCURRENCY'] = 1
+app.config['WRITE_QUEUE_MAX_WAITING'] = 32
+app.config['WRITE_QUEUE_TIMEOUT'] = 2.0 # seconds
+app.config['WRITE_QUEUE_RETRY_AFTER'] = 1 # seconds
+app.config['WRITE_QUEUE_EXEMPT_ENDPOINTS'] = {'import_rows'} # commits in chunks for minutes, it would hold the queue the whole time
+
+# ------------ DATABASE ENGINE PROFILE ===========================
+# ===============================================================
+@event.listens_for(Engine, 'connect')
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+# Runs for every new connection of both engines:
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+class ReadEngine:
+    """
+    Second engine on the same database file, its connections are 'query_only' so a read can never take the write lock.
+    Its made on first use because it needs the resolved path of the main engine.
+    """
+    def __init__(self):
+        self._engine = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._engine = create_engine(db.engine.url)
+                    event.listen(self._engine, 'connect', self._set_query_only)
+                    self._pid = os.getpid()
+        return self._engine
+
+    def dispose(self, close=True):
+# close=False after a fork - the connections belong to the parent process, the child only forgets them:
+        if self._engine is not None:
+            self._engine.dispose(close=close)
+        self._engine = None
+        self._pid = None
+
+    @staticmethod
+    def _set_query_only(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA query_only = ON")
+
+read_engine = ReadEngine()
+
+def use_read_engine():
+# Only the GET routes read from the read engine, and only for file databases (a memory database cant be shared):
+    return (app.config['SQLITE_READ_ENGINE']
+            and has_request_context()
+            and request.method in ('GET', 'HEAD')
+            and db.engine.url.database not in (None, '', ':memory:'))
+
+class RoutingSession(Session):
+    """
+    Session that sends the SELECTs of GET requests to the read engine, everything else (flushes, inserts, DDL) to the main engine.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and isinstance(clause, Select) and use_read_engine():
+            return read_engine.get()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={"class_": RoutingSession})
 
 
 # Logging setup:
@@ -25,10 +172,122 @@ logger = app.logger
 
 
 #---- Function to enterData into DataBase table so the User admin can track his employess actions --------
-def log_action(action):
-    log_entry = LogEntry(action=action)
-    db.session.add(log_entry)
-    db.session.commit()
+# The row keeps only the event code and its parameters, the HTML of the log card is made from the templates in audit_events.py when its read:
+def log_action(event, **params):
+# The response cache keeps the log rows of a route to write them again when it serves the cached answer:
+    if has_request_context() and 'logged_actions' in g:
+        g.logged_actions.append((event, params))
+# Requests that arent actions of a user (the worker warm up) keep their rows for the response cache above but dont write them:
+    if has_request_context() and g.get('suppress_audit'):
+        return
+# In 'sync' mode write and commit the row right away (the old behaviour):
+    if app.config['AUDIT_LOG_DURABILITY'] == 'sync':
+        log_entry = LogEntry(event=event, params=encode_params(params))
+        db.session.add(log_entry)
+        db.session.commit()
+        return
+# Otherwise hand it to the batched writer so the request doesnt pay for an extra commit:
+    audit_log_writer.write(event, params)
+
+class AuditLogWriter:
+    """
+    Buffers audit log rows in a bounded queue and inserts them with a background thread,
+    one transaction per batch (when the batch size is reached or the flush interval passed).
+    """
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._wake = None
+        self._stopping = None
+# Serializes flushes between the background thread and inline flushes (full queue, shutdown, readers):
+        self._flush_lock = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+# A forked gunicorn worker doesnt inherit the thread, so every process starts its own:
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.app.config['AUDIT_LOG_QUEUE_SIZE'])
+            self._wake = threading.Event()
+            self._stopping = threading.Event()
+            self._flush_lock = threading.Lock()
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def write(self, event, params):
+# Keep the time of the action itself and not the time of the insert:
+        row = {"event": event, "params": encode_params(params), "timestamp": datetime.now()}
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+# Queue is full - write the buffered rows from the request thread instead of losing them:
+            logging.info(" Outcome Activated -> Audit log queue is full, flushing inline")
+            with self._flush_lock:
+                self._insert_batch(self._drain() + [row])
+            return
+# Wake the writer thread as soon as a full batch is waiting:
+        if self._queue.qsize() >= self.app.config['AUDIT_LOG_BATCH_SIZE']:
+            self._wake.set()
+
+    def _drain(self):
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def flush(self):
+# Write everything that is waiting in the queue right now:
+        if self._pid != os.getpid():
+            return
+        batch_size = self.app.config['AUDIT_LOG_BATCH_SIZE']
+        with self._flush_lock:
+            rows = self._drain()
+            for start in range(0, len(rows), batch_size):
+                self._insert_batch(rows[start:start + batch_size])
+
+    def shutdown(self):
+        if self._pid != os.getpid():
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout=self.app.config['AUDIT_LOG_FLUSH_INTERVAL'] * 2)
+        self.flush()
+
+    def _run(self):
+        while not self._stopping.is_set():
+# Sleep until a batch is full or the flush interval passed:
+            self._wake.wait(timeout=self.app.config['AUDIT_LOG_FLUSH_INTERVAL'])
+            self._wake.clear()
+            self.flush()
+
+    def _insert_batch(self, rows, attempts=3):
+        if not rows:
+            return
+# A new app context gives the writer its own session, seperate from the request session:
+        with self.app.app_context():
+            for attempt in range(1, attempts + 1):
+                try:
+                    db.session.execute(LogEntry.__table__.insert(), rows)
+                    db.session.commit()
+                    return
+                except Exception as e:
+                    db.session.rollback()
+                    logging.info(f" Outcome Activated -> Error writing {len(rows)} audit log rows (attempt {attempt}): {str(e)}")
+                    time.sleep(0.1 * attempt)
+        logging.error(f" Outcome Activated -> Audit log rows were dropped after {attempts} attempts: {len(rows)} rows")
+
+audit_log_writer = AuditLogWriter(app)
+# Write whatever is still in the queue when the process exits:
+atexit.register(audit_log_writer.shutdown)
 # ----------------------------------------------------------------------------------------
 
 # Enums:
@@ -37,6 +296,9 @@ class BookType(enum.Enum):
     TYPE_2 = 2  # up to 5 days
     TYPE_3 = 3  # up to 2 days
 
+# Loan length in days for every book type:
+LOAN_DAYS = {BookType.TYPE_1: 10, BookType.TYPE_2: 5, BookType.TYPE_3: 2}
+
 class BookCategory(enum.Enum):
     SCIFI = 'Science Fiction'
     HORROR = 'Horror'
@@ -57,13 +319,17 @@ class Book(db.Model):
     category = db.Column(db.Enum(BookCategory), nullable=False)
     is_out_of_stock = db.Column(db.Boolean, default=False)
     book_quantity = db.Column(db.Integer, default=1)
+# Backs the case-insensitive "book already exists" check in add_book:
+db.Index('ix_book_name_lower', func.lower(Book.name))
+# Backs the /search_books pages by category (SQLite keeps the id at the end of every index, so they come in id order):
+db.Index('ix_book_category', Book.category)
 
 class Customer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(30), nullable=False)
     city = db.Column(db.String(30), nullable=False)
     age = db.Column(db.Integer, nullable=False)
-    phone_number = db.Column(db.String(11), nullable=False)
+    phone_number = db.Column(db.String(11), nullable=False, index=True)
     is_deactivated = db.Column(db.Boolean, default=False)
 
 class Loan(db.Model):
@@ -73,62 +339,1064 @@ class Loan(db.Model):
     cust_phonenumber = db.Column(db.String(11), db.ForeignKey('customer.phone_number'), nullable=False)
     book_name = db.Column(db.String(30), db.ForeignKey('book.name'), nullable=False)
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
-    loan_date = db.Column(db.DateTime, nullable=False,  default=datetime.now)
-    return_due_date = db.Column(db.DateTime, nullable=False)
+    loan_date = db.Column(db.DateTime, nullable=False,  default=datetime.now, index=True)
+    return_due_date = db.Column(db.DateTime, nullable=False, index=True)
+# Backs the customer+book loan lookups (and their newest loan first order) in loan_book and return_book,
+# and the /search_loans pages by customer or by book in their (loan_date, id) order:
+    __table_args__ = (db.Index('ix_loan_cust_book_date', 'cust_id', 'book_id', 'loan_date'),
+                      db.Index('ix_loan_cust_date', 'cust_id', 'loan_date'),
+                      db.Index('ix_loan_book_date', 'book_id', 'loan_date'))
 
 class LogEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    action = db.Column(db.String(100), nullable=False)
+    event = db.Column(db.String(40), nullable=False)   # code of the template in audit_events.EVENTS
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON of the template parameters
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.now)
+# Backs the newest-first paging by (timestamp, id) cursor:
+    __table_args__ = (db.Index('ix_log_entry_timestamp_id', 'timestamp', 'id'),)
 
 class ReturnedBooks(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     book_name = db.Column(db.String, nullable=False)
     cust_name = db.Column(db.String, nullable=False)
-    cust_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    cust_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False, index=True)
     loan_id = db.Column(db.Integer, db.ForeignKey('loan.id'), nullable=False)
     cust_phonenumber = db.Column(db.String(11), db.ForeignKey('customer.phone_number'), nullable=False)
     loan_date = db.Column(db.DateTime, nullable=False, default=datetime.now)
     returned_date = db.Column(db.DateTime)
 
+class CustomerStats(db.Model):
+# Read model of the customer activity - kept by the loan and return routes in their own transaction (count_customer_activity):
+    cust_id = db.Column(db.Integer, db.ForeignKey('customer.id'), primary_key=True)
+    active_loans = db.Column(db.Integer, nullable=False, default=0)
+    total_loans = db.Column(db.Integer, nullable=False, default=0)
+    total_returns = db.Column(db.Integer, nullable=False, default=0)
+    late_returns = db.Column(db.Integer, nullable=False, default=0)
+    last_activity = db.Column(db.DateTime)
+
+class DailyLoanStats(db.Model):
+# Rollup of the loans and returns by day and book category - kept by the loan and return routes in their own transaction (count_daily_activity):
+    day = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.Enum(BookCategory), primary_key=True)
+    loans = db.Column(db.Integer, nullable=False, default=0)
+    returns = db.Column(db.Integer, nullable=False, default=0)
+    late_returns = db.Column(db.Integer, nullable=False, default=0)
+
 # Ensure the database tables are created before the first request
 # wont erase existing Data if it is already existing
+# Only for 'flask run' - gunicorn (wsgi.py) and 'python app.py' prepare the database on start and remove this hook, see start_server():
 @app.before_request
 def create_tables_once():
     if not hasattr(app, 'tables_created'):
-        db.create_all()
+        prepare_database()
         app.tables_created = True
+        app.worker_ready = True
+
+# ------------ OVERDUE LOANS TRACKING ============================
+# ===============================================================
+class OverdueTracker:
+    """
+    Knows if any loan is late from the earliest due date of the open loans - MIN(return_due_date) is one seek in the
+    ix_loan_return_due_date index, kept for a few seconds so the page loads dont read it again on every request.
+    """
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self._earliest = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def reload(self):
+        earliest = db.session.query(func.min(Loan.return_due_date)).scalar()
+        with self._lock:
+            self._earliest = earliest
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def loan_created(self, return_due_date):
+# A new loan can only move the earliest due date back:
+        with self._lock:
+            if self._loaded_at is not None and (self._earliest is None or return_due_date < self._earliest):
+                self._earliest = return_due_date
+
+    def loan_returned(self):
+# The returned loan might have been the earliest one, read it again on the next check:
+        self.invalidate()
+
+    def earliest_due_date(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.app.config['OVERDUE_TRACKER_REFRESH_SECONDS']:
+            self.reload()
+        return self._earliest
+
+    def has_overdue_loans(self, current_date):
+        earliest = self.earliest_due_date()
+        return earliest is not None and earliest < current_date
+
+overdue_tracker = OverdueTracker(app)
+
+# ------------ FULL TEXT SEARCH ==================================
+# ===============================================================
+class SearchIndex:
+    """
+    SQLite FTS5 shadow tables for the searched text columns of Book and Customer.
+    The trigram tokenizer keeps the old '%term%' (case insensitive substring) results but answers them from an index,
+    and triggers on the real tables keep the shadow tables in sync on insert, update and delete.
+    """
+    TABLES = {
+        'book': ('book_fts', ('name', 'author')),
+        'customer': ('customer_fts', ('name', 'phone_number')) }
+    MIN_TERM_LENGTH = 3 # trigram index can only answer terms of 3 characters or more
+
+    def __init__(self):
+        self.available = False
+
+    def ensure(self, rebuild=False):
+# Create the shadow tables and triggers if missing, fill them from the real tables when they are new:
+        try:
+            for source, (fts_name, columns) in self.TABLES.items():
+                is_new = db.session.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name=:name"), {"name": fts_name}).first() is None
+                cols = ', '.join(columns)
+                new_cols = ', '.join(f'new.{c}' for c in columns)
+                old_cols = ', '.join(f'old.{c}' for c in columns)
+                db.session.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_name} USING fts5({cols}, content='{source}', content_rowid='id', tokenize='trigram')"))
+                db.session.execute(text(f"""CREATE TRIGGER IF NOT EXISTS {fts_name}_ai AFTER INSERT ON {source} BEGIN
+                    INSERT INTO {fts_name}(rowid, {cols}) VALUES (new.id, {new_cols}); END"""))
+                db.session.execute(text(f"""CREATE TRIGGER IF NOT EXISTS {fts_name}_ad AFTER DELETE ON {source} BEGIN
+                    INSERT INTO {fts_name}({fts_name}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END"""))
+                db.session.execute(text(f"""CREATE TRIGGER IF NOT EXISTS {fts_name}_au AFTER UPDATE OF {cols} ON {source} BEGIN
+                    INSERT INTO {fts_name}({fts_name}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+                    INSERT INTO {fts_name}(rowid, {cols}) VALUES (new.id, {new_cols}); END"""))
+                if is_new or rebuild:
+                    db.session.execute(text(f"INSERT INTO {fts_name}({fts_name}) VALUES ('rebuild')"))
+            db.session.commit()
+            self.available = True
+# SQLite builds without FTS5 (or older than 3.34 without trigram) keep using the LIKE scans:
+        except OperationalError as e:
+            db.session.rollback()
+            self.available = False
+            logging.info(f" Outcome Activated -> Full text search is not available, searches would scan the tables: {str(e)}")
+
+    @staticmethod
+    def _phrase(term):
+# A trailing '*' means "starts with", everything else is a substring search like the old '%term%':
+        prefix = term.endswith('*')
+        term = term.rstrip('*')
+        quoted = '"' + term.replace('"', '""') + '"'
+        return ('^' + quoted) if prefix else quoted, term
+
+    def apply(self, search, filters):
+# Adds the terms to a search of search_queries.py - indexed terms are matched (ranked by bm25), terms the index cant answer stay as LIKE filters:
+        for column_name, term in filters.items():
+            if not term:
+                continue
+            phrase, bare_term = self._phrase(term)
+            if self.available and len(bare_term) >= self.MIN_TERM_LENGTH:
+                search.match(f'{column_name} : {phrase}')
+            elif term.endswith('*'):
+                search.where(column_name, 'like', f'{bare_term}%')
+            else:
+                search.where(column_name, 'like', f'%{bare_term}%')
+        return search
+
+search_index = SearchIndex()
+
+# The cached statements of the search routes, one per combination of filters (see search_queries.py):
+customer_searches = SearchStatements(Customer.__table__, SearchIndex.TABLES['customer'][0])
+book_searches = SearchStatements(Book.__table__, SearchIndex.TABLES['book'][0])
+loan_searches = SearchStatements(Loan.__table__, order=('loan_date', 'id'))
+late_loan_searches = SearchStatements(Loan.__table__, order=('return_due_date', 'id'))
+returned_book_searches = SearchStatements(ReturnedBooks.__table__)
+
+# ------------ STORE STATISTICS CACHE ============================
+# ===============================================================
+class StatsCache:
+    """
+    Holds the /stats counters, computed with one aggregate query per table.
+    The routes that change books, customers or loans drop it through data_changed().
+    """
+    TABLES = {'book', 'customer', 'loan'}
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self._counts = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._counts = None
+
+    def _compute(self):
+        books = db.session.query(
+            func.count(Book.id),
+            func.count(Book.id).filter(Book.is_out_of_stock == True),
+            func.count(Book.id).filter(Book.is_out_of_stock == False),
+            func.sum(Book.book_quantity)).one()
+        customers = db.session.query(
+            func.count(Customer.id).filter(Customer.is_deactivated == False),
+            func.count(Customer.id).filter(Customer.is_deactivated == True)).one()
+        total_loans = db.session.query(func.count(Loan.id)).scalar()
+        return {
+            "total_different_books": books[0],
+            "books_out_of_stock": books[1],
+            "books_on_stock": books[2],
+            "total_book_pieces_in_the_store": books[3],
+            "total_activated_customers": customers[0],
+            "total_deactivated_customers": customers[1],
+            "total_loans_and_total_books_loaned": total_loans }
+
+    def get(self):
+        with self._lock:
+            if self._counts is not None and time.monotonic() - self._loaded_at <= self.app.config['STATS_CACHE_SECONDS']:
+                return dict(self._counts)
+        counts = self._compute()
+        with self._lock:
+            self._counts = counts
+            self._loaded_at = time.monotonic()
+        return dict(counts)
+
+stats_cache = StatsCache(app)
+
+# ------------ CUSTOMER STATISTICS ===============================
+# ===============================================================
+def count_customer_activity(cust_id, when, loaned=0, returned=0, late=0): # ADDS A LOAN OR A RETURN TO THE CUSTOMER STATS ROW - CALLED BEFORE THE ROUTE COMMITS SO ITS THE SAME TRANSACTION
+# One upsert, the row is made on the first activity of the customer:
+    statement = sqlite_insert(CustomerStats).values(cust_id=cust_id,
+                                                    active_loans=loaned - returned,
+                                                    total_loans=loaned,
+                                                    total_returns=returned,
+                                                    late_returns=late,
+                                                    last_activity=when)
+    new = statement.excluded
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[CustomerStats.cust_id],
+        set_={"active_loans": CustomerStats.active_loans + new.active_loans,
+              "total_loans": CustomerStats.total_loans + new.total_loans,
+              "total_returns": CustomerStats.total_returns + new.total_returns,
+              "late_returns": CustomerStats.late_returns + new.late_returns,
+              "last_activity": func.max(func.coalesce(CustomerStats.last_activity, new.last_activity), new.last_activity)}))
+
+def rebuild_customer_stats(): # A METHOD TO BUILD ALL THE CUSTOMER STATS AGAIN FROM THE LOAN AND RETURNED BOOKS TABLES, RETURNS HOW MANY CUSTOMERS HAVE STATS
+    stats = {}
+    def customer_entry(cust_id, when):
+        entry = stats.setdefault(cust_id, {"cust_id": cust_id, "active_loans": 0, "total_loans": 0, "total_returns": 0, "late_returns": 0, "last_activity": None})
+        if when is not None and (entry["last_activity"] is None or when > entry["last_activity"]):
+            entry["last_activity"] = when
+        return entry
+# The open loans, counted by the database:
+    for cust_id, count, last_loan_date in db.session.query(Loan.cust_id, func.count(Loan.id), func.max(Loan.loan_date)).group_by(Loan.cust_id):
+        entry = customer_entry(cust_id, last_loan_date)
+        entry["active_loans"] += count
+        entry["total_loans"] += count
+# The returned books dont keep the due date - it was the loan date plus the loan days of the book type, the book is found by its name (lower name index):
+    book_type = (select(Book.type).where(func.lower(Book.name) == func.lower(ReturnedBooks.book_name))
+                 .limit(1).scalar_subquery())
+    returns = (db.session.query(ReturnedBooks.cust_id, ReturnedBooks.loan_date, ReturnedBooks.returned_date, book_type)
+               .yield_per(app.config['EXPORT_FETCH_SIZE']))
+    for cust_id, loan_date, returned_date, loan_type in returns:
+        entry = customer_entry(cust_id, max(filter(None, (loan_date, returned_date)), default=None))
+        entry["total_loans"] += 1
+        entry["total_returns"] += 1
+        if loan_type is not None and returned_date is not None and returned_date > loan_date + timedelta(days=LOAN_DAYS[BookType(loan_type)]):
+            entry["late_returns"] += 1
+# Replace the old rows in one transaction:
+    CustomerStats.query.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(CustomerStats, list(stats.values()))
+    db.session.commit()
+    return len(stats)
+
+def ensure_customer_stats(): # FILLS THE CUSTOMER STATS THE FIRST TIME A DATABASE WITH LOAN HISTORY RUNS THIS VERSION
+    if db.session.query(CustomerStats.query.exists()).scalar():
+        return
+    if db.session.query(Loan.query.exists()).scalar() or db.session.query(ReturnedBooks.query.exists()).scalar():
+        rebuild_customer_stats()
+
+# ------------ DAILY STATISTICS ==================================
+# ===============================================================
+# How /stats/history groups the days - the first day of every bucket (weeks start on Monday):
+HISTORY_GRANULARITIES = {
+    'day': lambda day: day,
+    'week': lambda day: day - timedelta(days=day.weekday()),
+    'month': lambda day: day.replace(day=1) }
+HISTORY_BUCKET_SQL = {
+    'day': lambda day: func.date(day),
+    'week': lambda day: func.date(day, 'weekday 0', '-6 days'),
+    'month': lambda day: func.strftime('%Y-%m-01', day) }
+
+def count_daily_activity(category, when, loaned=0, returned=0, late=0): # ADDS A LOAN OR A RETURN TO THE ROLLUP ROW OF ITS DAY AND CATEGORY - CALLED BEFORE THE ROUTE COMMITS SO ITS THE SAME TRANSACTION
+    statement = sqlite_insert(DailyLoanStats).values(day=when.date(), category=category, loans=loaned, returns=returned, late_returns=late)
+    new = statement.excluded
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[DailyLoanStats.day, DailyLoanStats.category],
+        set_={"loans": DailyLoanStats.loans + new.loans,
+              "returns": DailyLoanStats.returns + new.returns,
+              "late_returns": DailyLoanStats.late_returns + new.late_returns}))
+
+def rebuild_daily_stats(): # A METHOD TO BUILD THE DAILY ROLLUP AGAIN FROM THE LOAN AND RETURNED BOOKS TABLES, RETURNS HOW MANY (DAY, CATEGORY) ROWS IT MADE
+    stats = {}
+    def day_entry(day, category):
+        return stats.setdefault((day, category), {"day": day, "category": category, "loans": 0, "returns": 0, "late_returns": 0})
+# The open loans, counted by the database:
+    open_loans = (db.session.query(func.date(Loan.loan_date), Book.category, func.count(Loan.id))
+                  .join(Book, Book.id == Loan.book_id)
+                  .group_by(func.date(Loan.loan_date), Book.category))
+    for day, category, count in open_loans:
+        day_entry(date.fromisoformat(day), category)["loans"] += count
+# The returned loans count on the day they were loaned and on the day they came back - their book is found by its name (lower name index),
+# returns of a book that isnt in the store anymore have no category and are left out:
+    same_book = func.lower(Book.name) == func.lower(ReturnedBooks.book_name)
+    book_type = select(Book.type).where(same_book).limit(1).scalar_subquery()
+    book_category = select(Book.category).where(same_book).limit(1).scalar_subquery()
+    returns = (db.session.query(ReturnedBooks.loan_date, ReturnedBooks.returned_date, book_type, book_category)
+               .yield_per(app.config['EXPORT_FETCH_SIZE']))
+    for loan_date, returned_date, loan_type, category in returns:
+        if category is None:
+            continue
+        day_entry(loan_date.date(), category)["loans"] += 1
+        if returned_date is None:
+            continue
+        entry = day_entry(returned_date.date(), category)
+        entry["returns"] += 1
+        if returned_date > loan_date + timedelta(days=LOAN_DAYS[BookType(loan_type)]):
+            entry["late_returns"] += 1
+# Replace the old rows in one transaction:
+    DailyLoanStats.query.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(DailyLoanStats, list(stats.values()))
+    db.session.commit()
+    return len(stats)
+
+def ensure_daily_stats(): # FILLS THE DAILY ROLLUP THE FIRST TIME A DATABASE WITH LOAN HISTORY RUNS THIS VERSION
+    if db.session.query(DailyLoanStats.query.exists()).scalar():
+        return
+    if db.session.query(Loan.query.exists()).scalar() or db.session.query(ReturnedBooks.query.exists()).scalar():
+        rebuild_daily_stats()
+
+def daily_stats_history(first_day, last_day, granularity): # THE ROLLUP ROWS OF THE DAYS SUMMED BY BUCKET AND CATEGORY - ONE ROW PER BUCKET AND CATEGORY, EMPTY BUCKETS INCLUDED
+    bucket = HISTORY_BUCKET_SQL[granularity](DailyLoanStats.day)
+    rows = (db.session.query(bucket, DailyLoanStats.category,
+                             func.sum(DailyLoanStats.loans), func.sum(DailyLoanStats.returns), func.sum(DailyLoanStats.late_returns))
+            .filter(DailyLoanStats.day >= first_day, DailyLoanStats.day <= last_day)
+            .group_by(bucket, DailyLoanStats.category))
+    bucket_start = HISTORY_GRANULARITIES[granularity]
+    buckets = {}
+    start = bucket_start(first_day)
+    while start <= last_day:
+        buckets[start] = {"start": start.isoformat(), "loans": 0, "returns": 0, "late_returns": 0, "categories": {}}
+        start = bucket_start(start + timedelta(days=31 if granularity == 'month' else 7 if granularity == 'week' else 1))
+    for start, category, loans, returns, late_returns in rows:
+        entry = buckets[date.fromisoformat(start)]
+        entry["categories"][category.value] = {"loans": loans, "returns": returns, "late_returns": late_returns}
+        entry["loans"] += loans
+        entry["returns"] += returns
+        entry["late_returns"] += late_returns
+    for entry in buckets.values():
+        entry["late_return_rate"] = round(entry["late_returns"] / entry["returns"], 4) if entry["returns"] else None
+    return list(buckets.values())
+
+# ------------ SEARCH RESPONSE CACHE =============================
+# ===============================================================
+class TableVersions:
+    """
+    A change counter for every table the cached routes read. Triggers bump it in the same transaction as the change,
+    so the counters are right for every worker (and for the CLI imports) without the routes doing anything.
+    """
+    TABLES = ('book', 'customer', 'loan', 'returned_books')
+
+    def ensure(self):
+# Create the counters table and the triggers if missing - the counters are never reset so an old ETag can not come back:
+        db.session.execute(text("CREATE TABLE IF NOT EXISTS table_versions (table_name VARCHAR(50) PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)"))
+        for name in self.TABLES:
+            db.session.execute(text("INSERT OR IGNORE INTO table_versions (table_name, version) VALUES (:name, 0)"), {"name": name})
+            for trigger_event, suffix in (('INSERT', 'ai'), ('UPDATE', 'au'), ('DELETE', 'ad')):
+                db.session.execute(text(f"""CREATE TRIGGER IF NOT EXISTS {name}_version_{suffix} AFTER {trigger_event} ON {name} BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE table_name = '{name}'; END"""))
+        db.session.commit()
+
+    def bump(self, tables):
+# For the changes the triggers dont see (the tables dropped and created again by /reset_database), in the transaction of the change:
+        db.session.execute(text("UPDATE table_versions SET version = version + 1 WHERE table_name IN :names").bindparams(bindparam('names', expanding=True)),
+                           {"names": list(tables)})
+
+    def get(self, tables):
+# One read of a 4 row table:
+        versions = dict(db.session.execute(text("SELECT table_name, version FROM table_versions")).all())
+        return tuple(versions.get(name, 0) for name in tables)
+
+table_versions = TableVersions()
+
+def prepare_database(rebuild=False): # CREATES THE MISSING TABLES, THE ONES THAT ARE NOT MODELS (FULL TEXT SEARCH, TABLE VERSIONS), MIGRATES OLD LOG ROWS AND FILLS NEW READ MODELS - SAFE TO CALL ON EVERY START
+    db.create_all()
+    migrate_log_entries()
+    search_index.ensure(rebuild=rebuild)
+    table_versions.ensure()
+    ensure_customer_stats()
+    ensure_daily_stats()
+
+class ResponseCache:
+    """
+    LRU cache of the serialized answers of the search routes, keyed by route + sorted query args
+    and tagged with the versions of the tables the route reads.
+    The same key and versions make a strong ETag, so a client that already has the answer gets '304 Not Modified'.
+    """
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self._entries = OrderedDict() # key -> entry, oldest used first
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self, tables):
+# The entries would never match the new versions anyway - drop them now to free the memory:
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.tables.intersection(tables)]:
+                self._size -= len(self._entries.pop(key).body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _get(self, key, versions):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.versions != versions:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, entry):
+        if len(entry.body) > self.app.config['RESPONSE_CACHE_MAX_BYTES']:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old.body)
+            self._entries[key] = entry
+            self._size += len(entry.body)
+            while len(self._entries) > self.app.config['RESPONSE_CACHE_MAX_ENTRIES'] or self._size > self.app.config['RESPONSE_CACHE_MAX_BYTES']:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+
+    def serve(self, view, tables, args, kwargs):
+# The versions are read before the query, so a change made during the query only makes the cached answer newer than its tag:
+        key = (request.endpoint, tuple(sorted(request.args.items(multi=True))))
+        versions = table_versions.get(tables)
+        etag = hashlib.sha1(repr((key, versions)).encode()).hexdigest()
+        entry = self._get(key, versions)
+        if entry is None:
+# Run the route and keep its log rows, a cached answer writes them again so the audit log still shows every search:
+            g.logged_actions = []
+            response = self.app.make_response(view(*args, **kwargs))
+            actions = g.pop('logged_actions')
+            if response.status_code != 200:
+                return response
+            entry = SimpleNamespace(tables=set(tables), versions=versions, body=response.get_data(), mimetype=response.mimetype,
+                                    headers=[(name, value) for name, value in response.headers.items() if name.startswith('X-')],
+                                    actions=actions)
+            self._put(key, entry)
+        else:
+            for action_event, params in entry.actions:
+                log_action(action_event, **params)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(entry.body, status=200, mimetype=entry.mimetype, headers=entry.headers)
+# no-cache = the browser keeps the answer but asks with If-None-Match every time:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+response_cache = ResponseCache(app)
+
+def cached_response(*tables): # DECORATOR FOR THE GET ROUTES THAT ONLY READ THESE TABLES - ETag/304 AND THE RESPONSE CACHE
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not app.config['RESPONSE_CACHE_ENABLED']:
+                return view(*args, **kwargs)
+            return response_cache.serve(view, tables, args, kwargs)
+        return wrapper
+    return decorator
+
+# ------------ AUDIT LOG RETENTION ===============================
+# ===============================================================
+class LogArchive:
+    """
+    Moves old log entries out of the LogEntry table into one gzipped NDJSON file per month
+    (log_entries_YYYY-MM.ndjson.gz), and reads them back for the /log_entries date ranges that reach them.
+    """
+    FILE_PREFIX = 'log_entries_'
+    FILE_SUFFIX = '.ndjson.gz'
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+
+    @property
+    def directory(self):
+        return self.app.config['LOG_ARCHIVE_DIR'] or os.path.join(self.app.instance_path, 'log_archive')
+
+    def month_path(self, month):
+        return os.path.join(self.directory, f"{self.FILE_PREFIX}{month}{self.FILE_SUFFIX}")
+
+    def months(self):
+# The archived months, newest first:
+        if not os.path.isdir(self.directory):
+            return []
+        names = [name[len(self.FILE_PREFIX):-len(self.FILE_SUFFIX)] for name in os.listdir(self.directory)
+                 if name.startswith(self.FILE_PREFIX) and name.endswith(self.FILE_SUFFIX)]
+        return sorted(names, reverse=True)
+
+    def archive(self, older_than_days=None):
+# Every chunk is appended to its month files (as a new gzip member) and synced to disk before its rows are deleted:
+        days = self.app.config['LOG_RETENTION_DAYS'] if older_than_days is None else older_than_days
+        cutoff = datetime.now() - timedelta(days=days)
+        os.makedirs(self.directory, exist_ok=True)
+        moved = 0
+        while True:
+            rows = (db.session.query(LogEntry.id, LogEntry.event, LogEntry.params, LogEntry.timestamp)
+                    .filter(LogEntry.timestamp < cutoff)
+                    .order_by(LogEntry.timestamp, LogEntry.id)
+                    .limit(self.app.config['LOG_ARCHIVE_CHUNK_SIZE']).all())
+            if not rows:
+                return moved
+            by_month = {}
+            for row in rows:
+                by_month.setdefault(f"{row.timestamp:%Y-%m}", []).append(row)
+            for month, month_rows in by_month.items():
+                with open(self.month_path(month), 'ab') as f:
+                    with gzip.GzipFile(fileobj=f, mode='wb') as archive_file:
+                        for row in month_rows:
+                            archive_file.write((json.dumps({"id": row.id, "event": row.event, "params": row.params, "timestamp": row.timestamp.isoformat()}, ensure_ascii=False) + '\n').encode())
+                    f.flush()
+                    os.fsync(f.fileno())
+            LogEntry.query.filter(LogEntry.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+            db.session.commit()
+            moved += len(rows)
+            time.sleep(self.app.config['LOG_ARCHIVE_PAUSE_SECONDS'])
+
+    def read_month(self, month):
+# Ids are de-duplicated in case an archive run stopped between writing a chunk and deleting it:
+        entries = {}
+        with gzip.open(self.month_path(month), 'rt', encoding='utf-8') as archive_file:
+            for line in archive_file:
+                row = json.loads(line)
+# Files archived before the event rows hold the HTML text in 'action':
+                if 'action' in row:
+                    row['event'], row['params'] = TEXT_EVENT, encode_params({"text": row['action']})
+                entries[row['id']] = SimpleNamespace(id=row['id'], event=row['event'], params=row['params'], timestamp=datetime.fromisoformat(row['timestamp']))
+        return entries.values()
+
+    def read_page(self, start, end, before_key, limit):
+# Newest first entries in [start, end) older than before_key, returns (entries, has_more):
+        page = []
+        for month in self.months():
+            month_start = datetime.strptime(month, '%Y-%m')
+            if (end is not None and month_start >= end) or (before_key is not None and month_start > before_key[0]):
+                continue
+            if start is not None and (month_start.replace(day=28) + timedelta(days=4)).replace(day=1) <= start:
+                break
+            entries = [entry for entry in self.read_month(month)
+                       if (start is None or entry.timestamp >= start)
+                       and (end is None or entry.timestamp < end)
+                       and (before_key is None or (entry.timestamp, entry.id) < before_key)]
+            entries.sort(key=lambda entry: (entry.timestamp, entry.id), reverse=True)
+            page.extend(entries[:limit + 1 - len(page)])
+            if len(page) > limit:
+                return page[:limit], True
+        return page, False
+
+log_archive = LogArchive(app)
+
+def migrate_log_entries(): # MOVES THE OLD HTML LOG ROWS TO THE EVENT + PARAMS COLUMNS, RETURNS HOW MANY ROWS WERE MIGRATED (0 WHEN ITS ALREADY DONE)
+# The old table is renamed and copied into a new one in chunks, a stopped migration continues from the last copied id:
+    def table_exists(name):
+        return db.session.execute(text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"), {"name": name}).first() is not None
+    columns = {row[1] for row in db.session.execute(text("PRAGMA table_info(log_entry)"))}
+    if 'action' in columns and not table_exists('log_entry_html'):
+# The indexes keep their names when the table is renamed, drop them so the new table can create them:
+        for (index_name,) in db.session.execute(text("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='log_entry' AND sql IS NOT NULL")).all():
+            db.session.execute(text(f'DROP INDEX "{index_name}"'))
+        db.session.execute(text("ALTER TABLE log_entry RENAME TO log_entry_html"))
+        db.session.commit()
+        LogEntry.__table__.create(bind=db.engine)
+    if not table_exists('log_entry_html'):
+        return 0
+    old_rows = table('log_entry_html', column('id'), column('action'), column('timestamp', db.DateTime))
+    last_id = db.session.query(func.max(LogEntry.id)).scalar() or 0
+    migrated = 0
+    while True:
+        rows = db.session.execute(select(old_rows).where(old_rows.c.id > last_id).order_by(old_rows.c.id)
+                                  .limit(app.config['LOG_ARCHIVE_CHUNK_SIZE'])).all()
+        if not rows:
+            break
+        converted = []
+        for row in rows:
+            event, params = parse_action(row.action)
+            converted.append({"id": row.id, "event": event, "params": encode_params(params), "timestamp": row.timestamp})
+        db.session.execute(LogEntry.__table__.insert(), converted)
+        db.session.commit()
+        last_id = rows[-1].id
+        migrated += len(rows)
+    db.session.execute(text("DROP TABLE log_entry_html"))
+    db.session.commit()
+    logging.info(f" Outcome Activated -> Migrated {migrated} log entries to event rows")
+    return migrated
+
+# ------------ REQUEST METRICS ===================================
+# ===============================================================
+class RequestMetrics:
+    """
+    Per route counters for /metrics in the Prometheus text format: requests, latency histogram,
+    SQL statements and time, commits, "database is locked" errors and the write queue (waits, rejections, depth).
+    Every worker keeps its own counters and writes them to a file of its pid in METRICS_DIR,
+    /metrics adds up the files of all the workers.
+    """
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    FILE_PREFIX = 'metrics_'
+    RETIRED_PREFIX = 'retired_'
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self._lock = threading.Lock()
+        self._retire_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._written_at = 0.0
+        self.requests = {}        # (endpoint, method, status) -> count
+        self.latency = {}         # (endpoint, method) -> [bucket counts..., +Inf count, sum of seconds]
+        self.sql_statements = {}  # endpoint -> count
+        self.sql_seconds = {}     # endpoint -> seconds
+        self.commits = {}         # endpoint -> count
+        self.lock_errors = {}     # endpoint -> count
+        self.write_waits = {}     # endpoint -> [bucket counts..., +Inf count, sum of seconds] of the wait in the write queue
+        self.write_rejected = {}  # (endpoint, reason) -> count
+        self.gauges = {}          # name -> (help text, function that reads the current value)
+
+    @property
+    def directory(self):
+        return self.app.config['METRICS_DIR'] or os.path.join(self.app.instance_path, 'metrics')
+
+    @staticmethod
+    def current_endpoint():
+# SQL of the audit log writer and the CLI commands runs outside of a request:
+        if not has_request_context():
+            return 'background'
+        return request.endpoint or 'unmatched'
+
+    def _check_fork(self):
+# A forked worker starts from zero, the counters it inherited belong to the file of the parent:
+        if self._pid != os.getpid():
+            gauges = self.gauges
+            self._reset()
+            self.gauges = gauges
+
+    def request_done(self, endpoint, method, status, seconds):
+        with self._lock:
+            self._check_fork()
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            buckets = self.latency.setdefault((endpoint, method), [0] * (len(self.LATENCY_BUCKETS) + 1) + [0.0])
+            buckets[bisect.bisect_left(self.LATENCY_BUCKETS, seconds)] += 1
+            buckets[-1] += seconds
+        self.write_if_due()
+
+    def write_wait_done(self, endpoint, seconds):
+        with self._lock:
+            self._check_fork()
+            buckets = self.write_waits.setdefault(endpoint, [0] * (len(self.LATENCY_BUCKETS) + 1) + [0.0])
+            buckets[bisect.bisect_left(self.LATENCY_BUCKETS, seconds)] += 1
+            buckets[-1] += seconds
+
+    def write_rejected_done(self, endpoint, reason):
+        with self._lock:
+            self._check_fork()
+            key = (endpoint, reason)
+            self.write_rejected[key] = self.write_rejected.get(key, 0) + 1
+
+    def gauge(self, name, help_text, read): # A VALUE READ WHEN THE WORKER WRITES ITS FILE, /metrics SHOWS THE SUM OF THE WORKERS
+        self.gauges[name] = (help_text, read)
+
+    def statement_done(self, endpoint, seconds):
+        with self._lock:
+            self._check_fork()
+            self.sql_statements[endpoint] = self.sql_statements.get(endpoint, 0) + 1
+            self.sql_seconds[endpoint] = self.sql_seconds.get(endpoint, 0.0) + seconds
+
+    def count(self, counter_name, endpoint):
+        with self._lock:
+            self._check_fork()
+            counter = getattr(self, counter_name)
+            counter[endpoint] = counter.get(endpoint, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            return {
+                "requests": [[list(key), value] for key, value in self.requests.items()],
+                "latency": [[list(key), list(value)] for key, value in self.latency.items()],
+                "sql_statements": list(self.sql_statements.items()),
+                "sql_seconds": list(self.sql_seconds.items()),
+                "commits": list(self.commits.items()),
+                "lock_errors": list(self.lock_errors.items()),
+                "write_waits": [[key, list(value)] for key, value in self.write_waits.items()],
+                "write_rejected": [[list(key), value] for key, value in self.write_rejected.items()],
+                "gauges": [[name, help_text, read()] for name, (help_text, read) in self.gauges.items()] }
+
+    def write(self):
+# Written to a temporary file and renamed, so /metrics of another worker never reads half a file:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self.FILE_PREFIX}{os.getpid()}.json")
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+        self._written_at = time.monotonic()
+
+    def write_if_due(self):
+        if time.monotonic() - self._written_at >= self.app.config['METRICS_WRITE_INTERVAL']:
+            try:
+                self.write()
+            except OSError as e:
+                logging.info(f" Outcome Activated -> Error writing the metrics file: {str(e)}")
+
+    def close(self):
+# Only workers that served requests leave a file (not the CLI commands):
+        if self._pid == os.getpid() and self.requests:
+            try:
+                self.write()
+            except OSError:
+                pass
+
+    @staticmethod
+    def pid_alive(pid):
+# Signal 0 only checks the process (on POSIX, where gunicorn runs - elsewhere every file counts as alive):
+        if os.name != 'posix':
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def worker_files(self):
+# (pid, kind, path) of the files in the directory - kind 'metrics' for the file of a worker, 'retired' for the counters a worker took over from dead ones:
+        files = []
+        for name in os.listdir(self.directory):
+            for kind, prefix in (('metrics', self.FILE_PREFIX), ('retired', self.RETIRED_PREFIX)):
+                if name.startswith(prefix) and name.endswith('.json') and name[len(prefix):-len('.json')].isdigit():
+                    files.append((int(name[len(prefix):-len('.json')]), kind, os.path.join(self.directory, name)))
+        return files
+
+    @staticmethod
+    def add_up(totals, worker, gauges=True):
+        for key, value in worker["requests"]:
+            totals["requests"][tuple(key)] = totals["requests"].get(tuple(key), 0) + value
+        for key, value in worker["latency"]:
+            merged = totals["latency"].setdefault(tuple(key), [0] * len(value))
+            totals["latency"][tuple(key)] = [a + b for a, b in zip(merged, value)]
+        for counter_name in ("sql_statements", "sql_seconds", "commits", "lock_errors"):
+            for endpoint, value in worker[counter_name]:
+                totals[counter_name][endpoint] = totals[counter_name].get(endpoint, 0) + value
+# Files written by an older version dont have the write queue numbers:
+        for endpoint, value in worker.get("write_waits", []):
+            merged = totals["write_waits"].setdefault(endpoint, [0] * len(value))
+            totals["write_waits"][endpoint] = [a + b for a, b in zip(merged, value)]
+        for key, value in worker.get("write_rejected", []):
+            totals["write_rejected"][tuple(key)] = totals["write_rejected"].get(tuple(key), 0) + value
+        if gauges:
+            for name, help_text, value in worker.get("gauges", []):
+                totals["gauges"][name] = (help_text, totals["gauges"].get(name, (None, 0))[1] + value)
+
+    @staticmethod
+    def new_totals():
+        return {"requests": {}, "latency": {}, "sql_statements": {}, "sql_seconds": {}, "commits": {}, "lock_errors": {},
+                "write_waits": {}, "write_rejected": {}, "gauges": {}}
+
+    def retire_dead_workers(self):
+# The files of dead workers (recycled by max_requests) are folded into one retired file of this worker and deleted, so /metrics
+# reads a file per live worker and keeps the counters of the dead ones - their gauges (queue depth) are dropped, nothing is waiting there anymore.
+# A dead file is claimed by renaming it first, only one worker can win the rename, so no counter is added twice:
+        with self._retire_lock:
+            claimed = []
+            for pid, kind, path in self.worker_files():
+                if pid == os.getpid() or self.pid_alive(pid):
+                    continue
+                try:
+                    os.rename(path, f"{path}.{os.getpid()}.claimed")
+                    claimed.append(f"{path}.{os.getpid()}.claimed")
+                except FileNotFoundError:
+                    continue
+            if not claimed:
+                return
+            retired_path = os.path.join(self.directory, f"{self.RETIRED_PREFIX}{os.getpid()}.json")
+            totals = self.new_totals()
+            for path in [retired_path] + claimed:
+                try:
+                    with open(path) as f:
+                        self.add_up(totals, json.load(f), gauges=False)
+                except (OSError, ValueError):
+                    continue
+            retired = {"requests": [[list(key), value] for key, value in totals["requests"].items()],
+                       "latency": [[list(key), value] for key, value in totals["latency"].items()],
+                       **{name: list(totals[name].items()) for name in ("sql_statements", "sql_seconds", "commits", "lock_errors")},
+                       "write_waits": [[key, value] for key, value in totals["write_waits"].items()],
+                       "write_rejected": [[list(key), value] for key, value in totals["write_rejected"].items()]}
+            with open(retired_path + '.tmp', 'w') as f:
+                json.dump(retired, f)
+            os.replace(retired_path + '.tmp', retired_path)
+            for path in claimed:
+                os.remove(path)
+
+    def collect(self):
+# Adds up the files of all the workers (this worker writes its file first so its numbers are up to date):
+        self.write()
+        self.retire_dead_workers()
+        totals = self.new_totals()
+        for pid, kind, path in self.worker_files():
+            try:
+                with open(path) as f:
+                    worker = json.load(f)
+            except (OSError, ValueError):
+                continue
+# The gauges are the current values of live workers only:
+            self.add_up(totals, worker, gauges=kind == 'metrics' and self.pid_alive(pid))
+        return totals
+
+    def render(self):
+        totals = self.collect()
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        header('library_http_requests_total', 'counter', 'Requests by route, method and status code.')
+        for (endpoint, method, status), value in sorted(totals["requests"].items()):
+            lines.append(f'library_http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {value}')
+        def histogram(name, labels, value):
+            cumulative = 0
+            for bound, bucket_count in zip(self.LATENCY_BUCKETS + ('+Inf',), value[:-1]):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {value[-1]:.6f}')
+            lines.append(f'{name}_count{{{labels}}} {cumulative}')
+
+        header('library_http_request_duration_seconds', 'histogram', 'Request latency by route and method.')
+        for (endpoint, method), value in sorted(totals["latency"].items()):
+            histogram('library_http_request_duration_seconds', f'endpoint="{endpoint}",method="{method}"', value)
+        for name, counter_name, value_format, help_text in (
+                ('library_sql_statements_total', 'sql_statements', '{}', 'SQL statements executed by route.'),
+                ('library_sql_duration_seconds_total', 'sql_seconds', '{:.6f}', 'Time spent executing SQL statements by route.'),
+                ('library_db_commits_total', 'commits', '{}', 'Commits on the main (write) engine by route.'),
+                ('library_db_lock_errors_total', 'lock_errors', '{}', '"database is locked" errors by route.')):
+            header(name, 'counter', help_text)
+            for endpoint, value in sorted(totals[counter_name].items()):
+                lines.append(f'{name}{{endpoint="{endpoint}"}} ' + value_format.format(value))
+        header('library_write_queue_wait_seconds', 'histogram', 'Time the write requests waited in the write queue by route.')
+        for endpoint, value in sorted(totals["write_waits"].items()):
+            histogram('library_write_queue_wait_seconds', f'endpoint="{endpoint}"', value)
+        header('library_write_queue_rejected_total', 'counter', 'Write requests answered 503 by route and reason (full queue or deadline).')
+        for (endpoint, reason), value in sorted(totals["write_rejected"].items()):
+            lines.append(f'library_write_queue_rejected_total{{endpoint="{endpoint}",reason="{reason}"}} {value}')
+        for name, (help_text, value) in sorted(totals["gauges"].items()):
+            header(name, 'gauge', help_text)
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+request_metrics = RequestMetrics(app)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        request_metrics.request_done(RequestMetrics.current_endpoint(), request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_statement_metrics(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['statement_started'].pop()
+    request_metrics.statement_done(RequestMetrics.current_endpoint(), time.perf_counter() - started)
+
+@event.listens_for(Engine, 'commit')
+def record_commit_metrics(conn):
+# The read engine only runs SELECTs, its commits are just the end of a read transaction:
+    if conn.engine is not read_engine._engine:
+        request_metrics.count('commits', RequestMetrics.current_endpoint())
+
+@event.listens_for(Engine, 'handle_error')
+def record_error_metrics(exception_context):
+# A failed statement never reaches after_cursor_execute, drop its start time:
+    if exception_context.connection is not None and exception_context.execution_context is not None:
+        started = exception_context.connection.info.get('statement_started')
+        if started:
+            started.pop()
+    if 'database is locked' in str(exception_context.original_exception):
+        request_metrics.count('lock_errors', RequestMetrics.current_endpoint())
+
+# Write the last numbers of this worker when the process exits:
+atexit.register(request_metrics.close)
+
+# ------------ WRITE ADMISSION CONTROL ===========================
+# ===============================================================
+class WriteGate:
+    """
+    Bounded queue in front of the routes that write - SQLite has one writer, so more requests writing at the same time
+    only wait for its lock. WRITE_CONCURRENCY requests of this worker write at a time, the others wait in order
+    until the request deadline. A full queue or a passed deadline is answered with a fast 503 + Retry-After.
+    """
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.running = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def enter(self, deadline):
+# Returns None when the request may write, or the reason it was refused ('full' or 'deadline'):
+        concurrency = self.app.config['WRITE_CONCURRENCY']
+        with self._condition:
+# Nobody waits and there is a free place - the usual case costs one lock:
+            if self.waiting == 0 and self.running < concurrency:
+                self.running += 1
+                return None
+            if self.waiting >= self.app.config['WRITE_QUEUE_MAX_WAITING']:
+                return 'full'
+            self.waiting += 1
+            try:
+                while self.running >= concurrency:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+# Pass the wake up on if a place was freed while this request gave up:
+                        self._condition.notify()
+                        return 'deadline'
+                    self._condition.wait(remaining)
+                self.running += 1
+                return None
+            finally:
+                self.waiting -= 1
+
+    def leave(self):
+        with self._condition:
+            self.running -= 1
+            self._condition.notify()
+
+write_gate = WriteGate(app)
+request_metrics.gauge('library_write_queue_waiting', 'Write requests waiting in the write queue (all workers).', lambda: write_gate.waiting)
+request_metrics.gauge('library_write_queue_running', 'Write requests holding a write place (all workers).', lambda: write_gate.running)
+
+@app.before_request
+def admit_write_request():
+# Only the routes that change data queue, the reads and the CORS preflight go straight through:
+    if (not app.config['WRITE_QUEUE_ENABLED'] or request.method in ('GET', 'HEAD', 'OPTIONS')
+            or request.endpoint is None or request.endpoint in app.config['WRITE_QUEUE_EXEMPT_ENDPOINTS']):
+        return None
+    started = g.get('request_started', time.perf_counter())
+    refused = write_gate.enter(started + app.config['WRITE_QUEUE_TIMEOUT'])
+    waited = time.perf_counter() - started
+    if refused:
+# Not written to the audit log - under a burst that would be one more write for the same lock:
+        request_metrics.write_rejected_done(request.endpoint, refused)
+        logging.info(f" Outcome Activated -> Write request refused ({refused}) after {waited:.3f}s in the write queue: {request.endpoint}")
+        response = jsonify({"error": "The server is busy, please try again in a moment."})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(app.config['WRITE_QUEUE_RETRY_AFTER'])
+        return response
+    g.write_admitted = True
+    request_metrics.write_wait_done(request.endpoint, waited)
+    return None
+
+@app.teardown_request
+def release_write_request(exception):
+    if g.pop('write_admitted', False):
+        write_gate.leave()
+
+def data_changed(*tables): # CALLED BY THE ROUTES AFTER A COMMIT THAT CHANGED ROWS OF THESE TABLES
+    if stats_cache.TABLES.intersection(tables):
+        stats_cache.invalidate()
+    response_cache.invalidate(tables)
 
 # API Routes:
 # ===========
 
 # -------MAIN PAGE STARTER METHOD ==========================
 # ==========================================================
+class StaticPage:
+    """
+    A frontend file kept in memory - read again from the disk only when its modification time changes.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._page = None
+        self._lock = threading.Lock()
+
+    def get(self):
+# Returns (body, etag, last modified), one stat of the file per call:
+        mtime = os.stat(self.path).st_mtime_ns
+        page = self._page
+        if page is None or mtime != self._mtime:
+            with open(self.path, 'rb') as f:
+                body = f.read()
+            page = (body, hashlib.sha1(body).hexdigest()[:20], datetime.fromtimestamp(mtime / 1e9, timezone.utc))
+            with self._lock:
+                self._page, self._mtime = page, mtime
+        return page
+
+index_page = StaticPage(os.path.join(app.root_path, 'index.html'))
+
+def log_late_loans_alert(current_date): # THE HOME PAGE ALERT GOES TO THE AUDIT LOG ONCE A DAY, NOT ON EVERY RELOAD OF THE PAGE
+    today = current_date.date()
+    if getattr(app, 'late_loans_alert_logged_on', None) == today:
+        return
+# Another worker may have logged it today already - one indexed check per worker per day:
+    day_start = datetime.combine(today, datetime.min.time())
+    logged = db.session.query(LogEntry.query.filter(LogEntry.timestamp >= day_start, LogEntry.event == 'home_late_loans').exists()).scalar()
+    if not logged:
+        log_action('home_late_loans')
+    app.late_loans_alert_logged_on = today
+
 @app.route('/')
 def serve_frontend():
     try:
-# Query for late loans to alert the staff:
+# Check for late loans to alert the staff (a comparison with the earliest due date the overdue tracker keeps):
         current_date = datetime.now()
-        late_loans = Loan.query.filter(Loan.return_due_date < current_date, Loan.return_due_date.isnot(None) ).all()
 # Initiate alert variable as None to prevent an error in cases where no late loans exist: 
         alert_message = None
-        if late_loans:
+        if overdue_tracker.has_overdue_loans(current_date):
 # As stated in the top -- Log_Action would be part of the rest of the Code for the store administrators to track actions in the store:
-            log_action("User started the application and <mark><u>late loans</u></mark> were found.")    
+            log_late_loans_alert(current_date)
 # alert message to pass to the frontend through the Headers:
             alert_message = "There are late loans. Please check the ''Late Loans'' section. <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<===================================================================="
-# Sends the HTML along with the alert message:
-        response = send_file('index.html')
+# Sends the HTML from memory along with the alert message:
+        body, etag, last_modified = index_page.get()
+        response = Response(body, mimetype='text/html')
 # can set a cookie, or use query parameters in JS to pass the alert message:
         if alert_message:
             response.headers['X-Alert-Message'] = alert_message
+# The ETag includes the alert, so a cached page is only reused ('304 Not Modified') while the alert didnt change:
+        response.set_etag(f"{etag}-{'alert' if alert_message else 'ok'}")
+        response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        response = response.make_conditional(request)
 # Logging the output info into the logger file for tracking:
         logging.info(f""" Outcome Activated -> Response to index page {"with alert message" if alert_message else "without alert message"}""") 
         return response
 # Catching unexpected error for gracious error handle:
     except Exception as e:
         logging.info(f" Outcome Activated -> Error opening home page: {str(e)} ")
-        log_action(f"Error opening home page: {str(e)}")
+        log_action('home_error', error=str(e))
         return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
 # ----------------------------------------------------------------------------------------------
 # ////////////////////////////////////////////////////////////////////////////////////
@@ -150,11 +1418,7 @@ def add_customer():
 # Log to the logger file:
             logging.info(" Outcome Activated -> Error: customer already exists, matched by phone number ") 
 # logging infromation into the DataBase logger for the Store to use:
-            log_action(f""" <b>User</b> tried to add 
-                        <br> a new Customer 
-                        <br> with a phone number that already exists in Database<b>:</b>
-                    <br><br> <b>[ {data['phone_number']} ]</b> 
-                    <br><br> which belongs to user with <b>ID:({existing_customer.id})</b> """)
+            log_action('customer_exists', phone_number=data['phone_number'], customer_id=existing_customer.id)
 # Return Data to the front:
             return jsonify({ "error_cust_exist": existing_customer.id }), 400
 
@@ -163,22 +1427,22 @@ def add_customer():
 # adding them to the DataBase and closing the session:
         db.session.add(new_customer)
         db.session.commit()
+        data_changed('customer')
 # Adding the information into the logger file:
         logging.info(" Outcome Activated -> Success: New customer added successfuly")
 # logging infromation into the DataBase logger for the Store to use:
-        log_action(f""" <mark>Added</mark> new customer: 
-                        <br> <b>[</b> {new_customer.name} <b>],</b> 
-                        <br> ID: {new_customer.id} """)
+        log_action('customer_added', customer_name=new_customer.name, customer_id=new_customer.id)
 # Return Data to the front:
         return jsonify({"success": {"cust_name": new_customer.name, "cust_id": new_customer.id} }), 201
     
 # catching unexpected error for gracious error handle:
     except Exception as e:
         logging.info(f" Outcome Activated -> Error adding customer: {str(e)}") 
-        log_action(f"Error adding customer: {str(e)}")
+        log_action('customer_add_error', error=str(e))
         return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
 
 @app.route('/search_customers', methods=['GET'])
+@cached_response('customer')
 def search_customers():
     try:
 # requesting and getting the parameters from the User:
@@ -187,37 +1451,36 @@ def search_customers():
         phone_number = request.args.get('phone_number')
         is_deactivated = request.args.get('is_deactivated')
 
-# Open a query requst to build the query:
-        query = Customer.query
+# Start the search, the statement of this combination of filters is built once and cached:
+        query = customer_searches.new()
 # filters the query with "if" query chains based on provided parameters:
         if cust_id:
             cust_id = int(cust_id)
-            query = query.filter(Customer.id == cust_id)      
-        if name:
-            query = query.filter(Customer.name.ilike(f'%{name}%'))
-        if phone_number:
-            query = query.filter(Customer.phone_number.ilike(f'%{phone_number}%'))
+            query.where('id', 'eq', cust_id)
+# Name and phone number are answered from the full text index (ranked, 'term*' for "starts with"):
+        search_index.apply(query, {'name': name, 'phone_number': phone_number})
         if is_deactivated:
             if is_deactivated.lower() in ['true', 'false']:
                 is_deactivated_bool = is_deactivated.lower() == 'true'
-                query = query.filter(Customer.is_deactivated == is_deactivated_bool)
+                query.where('is_deactivated', 'eq', is_deactivated_bool)
             else:
                 logging.info(" Outcome Activated -> Error: Invalid value in Deactivated (true or false)") 
                 return jsonify({"error": "Invalid value in Deactivated. Use 'true' or 'false'."}), 400
 
-# Execute query request and close the session:
-        customers = query.all()
+# Check the paging parameters (limit, cursor, count):
+        try:
+            page = read_search_page(query)
+        except ValueError as e:
+            logging.info(f" Outcome Activated -> Error: invalid search paging parameters: {str(e)}")
+            return jsonify({"error": f"Invalid paging parameters: {str(e)}"}), 400
+# Execute query request (one page of it) and close the session:
+        customers, next_cursor, total = query.page(db.session, **page)
 # case when no customers are found:
         if not customers:
 # Log to the action logger file:
             logging.info(" Outcome Activated -> Error: User searched customers - Non were found ") 
 # Log to the Admin database log:
-            log_action(f""" User searched for Customers.
-                    <br><br>     No customers found matching the search criteria <b>--->></b> 
-                    <br><br> <b> ID</b>: [ {cust_id if cust_id else '?'} ]
-                        <br> <b> Name</b>: [{name if name else '?'}]
-                        <br> <b> Phone Number</b>: [{phone_number if phone_number else '?'}]
-                        <br> <b> Deactivation Status</b>: [{is_deactivated if is_deactivated else '?'}] """)
+            log_action('customer_search_not_found', cust_id=cust_id, name=name, phone_number=phone_number, is_deactivated=is_deactivated)
 # Retrun data to the front:
             return jsonify({"error_customer_not_found":
                                 {   "name": name if name else '?',
@@ -228,23 +1491,12 @@ def search_customers():
 # In case when customers WERE found:
 # Log to the action logger file, log it to the database admin log, and return data to front:
         logging.info(f" Outcome Activated -> Success: User searched customers ") 
-        log_action(f""" User searched Customers with filters<b>:</b> 
-                    <br><br> <b> ID</b>: [ {cust_id if cust_id else '?'} ]
-                        <br> <b> Name</b>: [{name if name else '?'}]
-                        <br> <b> Phone Number</b>: [{phone_number if phone_number else '?'}]
-                        <br> <b> Deactivation Status</b>: [{is_deactivated if is_deactivated else '?'}]
-                    <br><br> <span style="font-size: 18px;">I</span>f all <b>'?'</b> then User would get full unfiltered list. """)
-        return jsonify([{
-            'Name': customer.name,
-            'Id': customer.id,
-            'City': customer.city,
-            'Age': customer.age,
-            'Phone_number': customer.phone_number,
-            'Deactivated_status': customer.is_deactivated} for customer in customers]), 200
+        log_action('customer_search', cust_id=cust_id, name=name, phone_number=phone_number, is_deactivated=is_deactivated)
+        return paged_json(customer_row.many(customers), next_cursor, total), 200
 # catching unexpected error for gracious error handle:
     except Exception as e:
             logging.info(f" Outcome Activated -> Error searching customer: {str(e)}") 
-            log_action(f" Error searching customer: {str(e)}")
+            log_action('customer_search_error', error=str(e))
             return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
 
 @app.route('/remove_customer/<int:id>', methods=['PUT'])
@@ -257,34 +1509,29 @@ def remove_customer(id):
             if customer.is_deactivated == True:
 # Log to the action logger file, log it to the database admin log, and return data to front:
                 logging.info(" Outcome Activated -> Error: Customer Already Deactivated, matched by ID ") 
-                log_action(f"""  <span style="font-size: 18px;">U</span>ser tried to Deactivate Customer: <b>[</b>{customer.name}<b>]</b> -
-                            <br> <span style="font-size: 18px;">I</span>D Number: <b>(</b> {customer.id} <b>)</b> 
-                            <br>--------------------- 
-                            <br> <span style="font-size: 18px;">B</span>ut they are Already Deactivated """)
+                log_action('customer_deactivate_already', customer_name=customer.name, customer_id=customer.id)
                 return jsonify({"errorDeactivated": {"customer_name": customer.name, "customer_id": customer.id} }), 400
 # If the customer isnt deactivated change it to deactivated and commit and push the change:
             customer.is_deactivated = True
             db.session.commit()
+            data_changed('customer')
 # Log to the action logger file, log it to the database admin log, and return data to front:
             logging.info(" Outcome Activated -> Success: Customer deactivated") 
-            log_action(f"""      <span style="font-size: 18px;">U</span>ser <mark>Deactivated</mark> Customer named: <b>[</b>{customer.name}<b>]</b> - 
-                        <br><br> <span style="font-size: 18px;">C</span>ustomer <span style="font-size: 18px;">I</span>D Number: {customer.id}  """)
+            log_action('customer_deactivated', customer_name=customer.name, customer_id=customer.id)
             return jsonify({"success": {"customer_name":customer.name, "customer_id":customer.id}}), 200
 # If customer wasnt found --> return to the Frontend the "Customer not found" JSON data:
 # Log to the action logger file, log it to the database admin log, and return data to front:
         logging.info(" Outcome Activated -> Error: Customer wasnt found, matched by ID ") 
-        log_action(f"""  <span style="font-size: 18px;">U</span>ser searched for Customer on ID <span style="font-size: 18px;">N</span>umber:<b>(</b>{id}<b>)</b>,
-                    <br> for Deactivation process.
-                <br><br> <span style="font-size: 18px;">C</span>ustomer with that ID Number wasn't found. """)
+        log_action('customer_deactivate_not_found', customer_id=id)
         return jsonify({"error_id": id}), 404
 # catching unexpected error for gracious error handle:
     except ValueError as e:
         logging.info(f" Outcome Activated -> ValueError occurred: {str(e)} during deactivating customer with ID: {id}") 
-        log_action(f" ValueError occurred: {str(e)} during deactivating customer with ID: {id}")
+        log_action('customer_deactivate_value_error', error=str(e), customer_id=id)
         return jsonify({"error": "A value error occurred in the removing process. Please check the data you entered and try again."}), 400
     except Exception as e:
         logging.info(f" Outcome Activated -> Error removing customer: {str(e)}") 
-        log_action(f" Error removing customer: {str(e)}")
+        log_action('customer_deactivate_error', error=str(e))
         return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
 
 @app.route('/activate_customer/<int:id>', methods=['PUT'])
@@ -295,38 +1542,64 @@ def activate_customer(id):
         if not customer: # if customer with the ID wasnt found
 # Log to the action logger file, log it to the database admin log, and return data to front:
             logging.info(" Outcome Activated -> Error: No customer was found, matched by ID") 
-            log_action(f"""  <span style="font-size: 18px;">U</span>ser tried to Activate a Customer with ID: {id}.
-                    <br><br> <span style="font-size: 18px;">N</span>o such Customer found.  """)
+            log_action('customer_activate_not_found', customer_id=id)
             return jsonify({"errorExist": id }), 404
 # If the customer exist and is deactivated - activate it and push the change into the DataBase:
         if customer and customer.is_deactivated == True:
             customer.is_deactivated = False
             db.session.commit()
+            data_changed('customer')
 # Log to the action logger file, log it to the database admin log, and return data to front:
             logging.info(" Outcome Activated -> Success: Customer activated ") 
-            log_action(f"""  <span style="font-size: 18px;">U</span>ser <mark>Activated</mark> Customer:
-                    <br><br> <b>[</b>{customer.name}<b>]</b>,
-                        <br> <span style="font-size: 18px;">I</span>D: <b>(</b> {customer.id} <b>)</b>  """)
+            log_action('customer_activated', customer_name=customer.name, customer_id=customer.id)
             return jsonify({"success": { "name": customer.name, "id": customer.id } }), 200
 
 # If customer exists and isnt deactivated:
         if customer and customer.is_deactivated == False:
 # Log to the action logger file, log it to the database admin log, and return data to front:
             logging.info(" Outcome Activated -> Error: Customer is already activated, matched by ID") 
-            log_action(f"""  <span style="font-size: 18px;">U</span>ser tried to Activate Customer:
-                    <br><br> <b>[</b>{customer.name}<b>]</b>,
-                        <br> ID: {customer.id}.
-                    <br><br> <span style="font-size: 18px;">T</span>hat Customer is Already Activated """)
+            log_action('customer_activate_already', customer_name=customer.name, customer_id=customer.id)
             return jsonify({"errorActive": { "name": customer.name, "id": customer.id } }), 400
 
 # catching unexpected error for gracious error handle:
     except ValueError as e:
         logging.info(f" Outcome Activated -> ValueError occurred: {str(e)} during activating customer with ID: {id}") 
-        log_action(f" ValueError occurred: {str(e)} during activating customer with ID: {id}")
+        log_action('customer_activate_value_error', error=str(e), customer_id=id)
         return jsonify({"error": "A value error occurred in the activating process. Please check the data you entered and try again."}), 400
     except Exception as e:
         logging.info(f" Outcome Activated -> Error activating customer: {str(e)}") 
-        log_action(f" Error activating customer: {str(e)}")
+        log_action('customer_activate_error', error=str(e))
+        return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
+
+@app.route('/customer/<int:id>/summary', methods=['GET'])
+def customer_summary(id):
+    try:
+# The customer and its stats row in one primary key lookup - no scan of the loans or the returned books:
+        customer, stats = (db.session.query(Customer, CustomerStats)
+                           .outerjoin(CustomerStats, CustomerStats.cust_id == Customer.id)
+                           .filter(Customer.id == id)
+                           .first()) or (None, None)
+        if not customer:
+            logging.info(" Outcome Activated -> Error: No customer was found for the summary, matched by ID") 
+            log_action('customer_summary_not_found', customer_id=id)
+            return jsonify({"errorExist": id }), 404
+# A customer that never loaned a book has no stats row yet:
+        stats = stats or CustomerStats(active_loans=0, total_loans=0, total_returns=0, late_returns=0)
+        logging.info(" Outcome Activated -> Success: Customer summary shown ") 
+        log_action('customer_summary', customer_name=customer.name, customer_id=customer.id)
+        return jsonify({"success": { "name": customer.name,
+                                     "id": customer.id,
+                                     "deactivated_status": customer.is_deactivated,
+                                     "active_loans": stats.active_loans,
+                                     "total_loans": stats.total_loans,
+                                     "total_returns": stats.total_returns,
+                                     "late_returns": stats.late_returns,
+                                     "on_time_returns": stats.total_returns - stats.late_returns,
+                                     "last_activity": safe_format_datetime(stats.last_activity) if stats.last_activity else None }}), 200
+# catching unexpected error for gracious error handle:
+    except Exception as e:
+        logging.info(f" Outcome Activated -> Error getting customer summary: {str(e)}") 
+        log_action('customer_summary_error', error=str(e))
         return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
 
 
@@ -354,7 +1627,7 @@ def add_book():
         if missing_fields:
 # Log to the action logger file, log it to the database admin log, and return data to front:
             logging.info(f" Outcome Activated -> Error: User tries to add a book to DataBase- Missing required fields: {', '.join(missing_fields)} ") 
-            log_action(f" User tries to add a book to DataBase- Error Missing required fields: {', '.join(missing_fields)} ")
+            log_action('book_add_missing_fields', missing_fields=', '.join(missing_fields))
             raise BadRequest(f"Missing required fields: {', '.join(missing_fields)}")
 
 # Check if a book with the same name already exists (case-insensitive):
@@ -362,8 +1635,7 @@ def add_book():
         if existing_book:
 # Log to the action logger file, log it to the database admin log, and return data to front:
             logging.info(" Outcome Activated -> Error: Book already exists, Matched by using book name") 
-            log_action(f""" <span style="font-size: 18px;">U</span>ser tried to add a book that <span style="font-size: 17px;">a</span>lready exists:
-                            ' {existing_book.name} ', ID:{existing_book.id} """)
+            log_action('book_exists', book_name=existing_book.name, book_id=existing_book.id)
             return jsonify({"error_book_Exist": { "book_name": existing_book.name, "book_id":existing_book.id } }), 400
 
 # Prepearing the Data Dump variables:
@@ -376,11 +1648,10 @@ def add_book():
         
         db.session.add(new_book) #prepearing to adding the data to the databse
         db.session.commit() #pushing the data to the database and closing session 
+        data_changed('book')
 # Log to the action logger file, log it to the database admin log, and return data to front:
         logging.info(" Outcome Activated -> Success: New Book added succesfuly") 
-        log_action(f"""  <mark><span style="font-size: 18px;">A</span>dded</mark> new book:
-                    <br> <b>[</b> {new_book.name}<b> ]</b>
-                <br><br> <span style="font-size: 18px;">B</span>ook ID: {new_book.id} """)
+        log_action('book_added', book_name=new_book.name, book_id=new_book.id)
         return jsonify({"success": {"name": new_book.name, "id": new_book.id} }), 201
 
 # catching unexpected error for gracious error handle:
@@ -394,7 +1665,7 @@ def add_book():
         return jsonify({"error": str(e)}), 400
     except Exception as e:
         logging.info(f" Outcome Activated -> Error adding book: {str(e)}") 
-        log_action(f" Error adding book: {str(e)}")
+        log_action('book_add_error', error=str(e))
         return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
 
 @app.route('/update_book_quantity', methods=['PUT'])
@@ -415,8 +1686,7 @@ def update_book_quantity():
         if not book: 
 # Log to the action logger file, log it to the database admin log, and return data to front:
             logging.info(" Outcome Activated -> Error: Book wasnt found - matched by using book ID") 
-            log_action(f"""  <span style="font-size: 18px;">U</span>ser tried to enter <mark>Book quantity</mark> change for Book ID:<b>(</b>{book_id}<b>)</b>
-                    <br><br> <span style="font-size: 18px;">B</span>ook was not found.""")
+            log_action('book_quantity_not_found', book_id=book_id)
             return jsonify({"errorFoundid": book_id}), 404
 # Get the quantity value and catch possible error to the libraries book stock importent part:
         try:
@@ -431,8 +1701,7 @@ def update_book_quantity():
 # It might Seem redundent but logging this action would allow the library owner to see if his employee tries to mess with the stock numbers:
 # Log to the action logger file, log it to the database admin log, and return data to front:
             logging.info(" Outcome Activated -> Error: Book quantity change failed - negative number was entered ") 
-            log_action(f""" User tried to enter invalid number: ( {new_quantity} ). 
-                            if tried too much in short time it might indicate a problematic employee """) 
+            log_action('book_quantity_negative', new_quantity=new_quantity) 
             return jsonify({"error_quantity": f" {new_quantity} is Invalid quantity number." }), 400
 
 # Update the book quantity - starting by putting into variables the previous quantity and saving the new quantity:
@@ -443,28 +1712,20 @@ def update_book_quantity():
             book.is_out_of_stock = True
 # Log the actions:
             logging.info(" Outcome Activated -> Success: Book quantity changed to 0 succesfuly, book went out of stock") 
-            log_action(f"""  <span style="font-size: 18px;">U</span>ser updated Book <b>[</b>{book.name}<b>]</b> 
-                            and <mark>marked as out of stock</mark> due to quantity updated to <span style="font-size: 18px;">0</span>.
-                    <br><br> Quantity updated from amount of: {previous_quantity} To {new_quantity}. """)
+            log_action('book_quantity_out_of_stock', book_name=book.name, previous_quantity=previous_quantity, new_quantity=new_quantity)
 # Check if Book quantity was changed from 0, in order to notify the Admin and user that book is in stock - but not activated: 
         elif previous_quantity == 0 and new_quantity > 0:
 # Log the actions:
             logging.info(" Outcome Activated -> Success: Book quantity changed FROM 0 to another amount successfuly") 
-            log_action(f"""  User updated Book: 
-                        <br> <b>[</b>{book.name}<b>]</b> 
-                    <br><br> ID:<b>(</b>{book_id}<b>)</b>
-                    <br><br> To be back in stock after update in quantity.
-                    <br><br> <mark> book wont be active to loan untill user activate it manualy</mark>
-                    <br><br> quantity updated from amount of: {previous_quantity} To {new_quantity}. """)
+            log_action('book_quantity_back_in_stock', book_name=book.name, book_id=book_id, previous_quantity=previous_quantity, new_quantity=new_quantity)
 # Just change to quantity in case it was just changed from number above 0 to another number above 0 which doesnt need special attention:
         elif previous_quantity > 0 and new_quantity > 0:
 # Log the actions:
             logging.info(" Outcome Activated -> Success: Book quantity changed sucessfuly ") 
-            log_action(f"""  <span style="font-size: 18px;">U</span>ser updated Book: <b>[</b>{book.name}<b>]</b>
-                    <br><br> ID:({book_id}) 
-                    <br><br> <mark>Quantity updated</mark> from amount of: {previous_quantity} To {new_quantity}. """)
+            log_action('book_quantity_updated', book_name=book.name, book_id=book_id, previous_quantity=previous_quantity, new_quantity=new_quantity)
 # push the changes to the DataBase and close session:
         db.session.commit()
+        data_changed('book')
 # return data to the front:
         return jsonify({ "success": {
                 "book_id": book.id,
@@ -475,90 +1736,81 @@ def update_book_quantity():
 # catching unexpected error for gracious error handle:
     except Exception as e:
         logging.info(f" Outcome Activated -> Error updating quantity: {str(e)}") 
-        log_action(f" Error updating quantity: {str(e)}")
+        log_action('book_quantity_error', error=str(e))
         return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
 
 @app.route('/deactivate_book/<int:id>', methods=['PUT'])
 def remove_book(id):
     try:
 # Get an id number from the user through URI:
-        book = db.session.get(Book,id)  
+        book = db.session.get(Book, id)
 # Check if its already deactivated:
         if book: 
             if book.is_out_of_stock:
 # Log to the action logger file, log it to the database admin log, and return data to front:
                 logging.info(" Outcome Activated -> Error: Book is already deactivated, matched by ID") 
-                log_action(f"""  <span style="font-size: 18px;">U</span>ser <mark>tried</mark> to mark out of stock the book<b>:</b>
-                        <br><br> <b>[</b>{book.name}<b>]</b> 
-                            <br> ID Number: <b>(</b>{book.id}<b>)</b> 
-                        <br><br> <span style="font-size: 18px;">B</span>ut its already out """)
+                log_action('book_deactivate_already', book_name=book.name, book_id=book.id)
                 return jsonify({"errorDeactivated": {"name": book.name, "id": book.id } }), 400
 # If it isnt already deactivated then make it deactivated and close session:
             book.is_out_of_stock = True
             db.session.commit()
+            data_changed('book')
 # Log to the action logger file, log it to the database admin log, and return data to front:
             logging.info(" Outcome Activated -> Success: Book deactivated succesfuly ") 
-            log_action(f"""  <span style="font-size: 18px;">U</span>ser Marked book:
-                        <br> [ {book.name} ] 
-                        <br> ID Number: {book.id} --> <mark>out of stock</mark> """)
+            log_action('book_deactivated', book_name=book.name, book_id=book.id)
             return jsonify({"success": {"name": book.name, "id": book.id} }), 200
 
 # User alert message incase no book was found:
 # Log to the action logger file, log it to the database admin log, and return data to front:    
         logging.info(" Outcome Activated -> Error: Book wasnt found, matched by ID") 
-        log_action(f""" <span style="font-size: 18px;">U</span>ser <mark>tried</mark> to Mark out of stock book with ID:( {id} ) --> But no book with that ID was found """)
+        log_action('book_deactivate_not_found', book_id=id)
         return jsonify({"errorNotfound": {"id": id } }), 404
 # catching unexpected error for gracious error handle:
     except Exception as e:
         logging.info(f" Outcome Activated -> Error removing book: {str(e)} ") 
-        log_action(f" Error removing book: {str(e)}")
+        log_action('book_deactivate_error', error=str(e))
         return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
 
 @app.route('/activate_book/<int:id>', methods=['PUT'])
 def activate_book(id):
     try:
 # Get user id query through URI:
-        book = db.session.get(Book,id) 
+        book = db.session.get(Book, id)
 # If book id doesnt exist in the Database:
         if not book:
 # Log to the action logger file, log it to the database admin log, and return data to front:
             logging.info(" Outcome Activated -> Error: Book wasnt found in Database, matched by ID ") 
-            log_action(f"""<span style="font-size: 18px;">U</span>ser tried to <mark>Activate</mark> a Book with ID: ( {id} ) , no Book with this ID was found.""")    
+            log_action('book_activate_not_found', book_id=id)    
             return jsonify({"errorFoundid": id}), 404
 
 # check if there are any of the specifc book in stock: 
         if book.book_quantity == 0:
 # Log to the action logger file, log it to the database admin log, and return data to front:
             logging.info(" Outcome Activated -> Error: Book cant be activated without books in stock ") 
-            log_action(f"""  <span style="font-size: 18px;">U</span>ser tried to <mark>activate</mark> Book:
-                        <br> <b>[</b>{book.name}, ID: {book.id}<b>]</b>
-                    <br><br> <span style="font-size: 18px;">I</span>t cant be activated Because no books of it are in stock.""")
+            log_action('book_activate_no_stock', book_name=book.name, book_id=book.id)
             return jsonify ({"errorquantity": {"name": book.name, "id":book.id} }), 400
 # If deactivated then change "out of stock" to false and make it active:
         if book.is_out_of_stock: 
             book.is_out_of_stock = False
 # Push the change into the DataBase and close session:
             db.session.commit() 
+            data_changed('book')
 # Log to the action logger file, log it to the database admin log, and return data to front:
             logging.info(" Outcome Activated -> Success: Book activated ") 
-            log_action(f"""  <span style="font-size: 18px;">U</span>ser <mark>Activated</mark> Book:
-                        <br> <b>[</b> {book.name} <b>]</b>
-                        <br> ID: {book.id} """)
+            log_action('book_activated', book_name=book.name, book_id=book.id)
             return jsonify({"success": {"name":book.name,"id":book.id} }), 200
 # Log to the action logger file, log it to the database admin log, and return data to front:
         logging.info(" Outcome Activated -> Error: Book is alerady activated, matched by ID ") 
-        log_action(f"""  <span style="font-size: 18px;">U</span>ser tried to <mark>Activate</mark> book:
-                    <br> [ {book.name} ]
-                    <br> ID: ( {book.id} ),
-                <br><br> <span style="font-size: 20px;">T</span>hat Book is already Active in stock""")
+        log_action('book_activate_already', book_name=book.name, book_id=book.id)
         return jsonify({"errorActivated": {"name":book.name, "id":id} }), 400
 # catching unexpected error for gracious error handle:
     except Exception as e:
         logging.info(f" Outcome Activated -> Error activating book: {str(e)} ") 
-        log_action(f" Error activating book: {str(e)}")
+        log_action('book_activate_error', error=str(e))
         return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
     
 @app.route('/search_books', methods=['GET'])
+@cached_response('book')
 def search_books():
     try:
 # Get the request paremeters from the user using URI:
@@ -566,17 +1818,15 @@ def search_books():
         author = request.args.get('author')
         category = request.args.get('category')
         out_of_stock = request.args.get('out_of_stock') 
-# Open query session:
-        query = Book.query 
+# Start the search, the statement of this combination of filters is built once and cached:
+        query = book_searches.new()
 # Start query chains (its when you use if conditions in SQLalchemy):
-        if name: 
-            query = query.filter(Book.name.ilike(f'%{name}%'))
-        if author:
-            query = query.filter(Book.author.ilike(f'%{author}%'))
+# Name and author are answered from the full text index (ranked, 'term*' for "starts with"):
+        search_index.apply(query, {'name': name, 'author': author})
         if category:
 # Ensure category is parsed correctly:
             try:
-                query = query.filter(Book.category == BookCategory[category])
+                query.where('category', 'eq', BookCategory[category])
             except KeyError:
 # if error found log the action to the logger file and return the data to the front:
                 logging.info(" Outcome Activated -> Error: invalid category ") 
@@ -585,19 +1835,20 @@ def search_books():
         if out_of_stock: 
             if out_of_stock.lower() in ['true', 'false']:
                 is_out_of_stock_bool = out_of_stock.lower() == 'true' # [the lower method is to make sure the parameter from the user would be all lower case letters]
-                query = query.filter(Book.is_out_of_stock == is_out_of_stock_bool)
+                query.where('is_out_of_stock', 'eq', is_out_of_stock_bool)
             else:
                 logging.info(" Outcome Activated -> Error: invalid value for out of stock (true\false)") 
                 return jsonify({"error": "Invalid value in out_of_stock. Use 'true' or 'false'."}), 400
-# Request all the results of the query chain:
-        books = query.all() 
+# Check the paging parameters (limit, cursor, count):
+        try:
+            page = read_search_page(query)
+        except ValueError as e:
+            logging.info(f" Outcome Activated -> Error: invalid search paging parameters: {str(e)}")
+            return jsonify({"error": f"Invalid paging parameters: {str(e)}"}), 400
+# Request one page of the results of the query chain:
+        books, next_cursor, total = query.page(db.session, **page)
 # log it for the store logger:
-        log_action(f"""  <span style="font-size: 18px;">E</span>mployee searched for books with filters: 
-                <br><br> Name: {name if name else "?"} 
-                    <br> Author: {author if author else "?"}
-                    <br> Category: {category if category else "?"}
-                    <br> Out of stock: {out_of_stock if out_of_stock else "?"}
-                <br><br> <span style="font-size: 18px;">I</span>f all fields are '?', <span style="font-size: 18px;">U</span>ser will get all the books in DataBase.""")
+        log_action('book_search', name=name, author=author, category=category, out_of_stock=out_of_stock)
 # If no books found in the search:   
         if not books:
             logging.info(" Outcome Activated -> Error: No book found")
@@ -608,79 +1859,104 @@ def search_books():
         
         logging.info(" Outcome Activated -> Success: Book list shown")
 # If books were found in the search: 
-        return jsonify([ {
-            'id': book.id, 
-            'name': book.name,
-            'author': book.author,
-            'year_published': book.year_published, 
-            'loan type': book.type.value,
-            'category': book.category.value, 
-            'quantity': book.book_quantity,
-            'is_out_of_stock': book.is_out_of_stock } for book in books]), 200
+        return paged_json(book_row.many(books), next_cursor, total), 200
 # catching unexpected error for gracious error handle:
     except Exception as e:
         logging.info(f" Outcome Activated -> Error searching book: {str(e)}") 
-        log_action(f"Error searching book: {str(e)}")
+        log_action('book_search_error', error=str(e))
         return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
 
 @app.route('/Returned_Books_list', methods=['GET'])
+@cached_response('returned_books')
 def search_Returned_list():
 # Get user query through URI:
     try: 
         name = request.args.get('name') 
         id = request.args.get('id')
-# Start query session:
-        query = ReturnedBooks.query
+# Start the search, the statement of this combination of filters is built once and cached:
+        query = returned_book_searches.new()
 # Query chain:
         if name:
-            query = query.filter(ReturnedBooks.cust_name.ilike(f'%{name}%'))  
+            query.where('cust_name', 'like', f'%{name}%')
         if id:
-            query = query.filter(ReturnedBooks.cust_id == id) 
-# Ask for results, and close session:
-        returned_books = query.all()
+            query.where('cust_id', 'eq', id)
+# Check the paging parameters (limit, cursor, count):
+        try:
+            page = read_search_page(query)
+        except ValueError as e:
+            logging.info(f" Outcome Activated -> Error: invalid search paging parameters: {str(e)}")
+            return jsonify({"error": f"Invalid paging parameters: {str(e)}"}), 400
+# Ask for one page of results, and close session:
+        returned_books, next_cursor, total = query.page(db.session, **page)
 
 # Log and return to front failed search result:
         if not returned_books:
             logging.info(" Outcome Activated -> Error: returned books werent found, matched by customer ID and/or customer name  ") 
-            log_action(f"""  <span style="font-size: 18px;">N</span>o ReturnedBooks with 
-                        <br> Customer ID: ( {id} )
-                        <br> OR/And
-                        <br> Customer Name: ( {name} ) """) 
+            log_action('returned_search_not_found', cust_id=id, name=name) 
             return jsonify({"errorSearchfound": {"id": id if id else '?', "name": name if name else '?' } }), 404
             
 # Log and return to front the search successs result:
         logging.info(" Outcome Activated -> Success: Returned Book list showed") 
-        log_action(f"""  <span style="font-size: 18px;">U</span>ser made search in Returned Books DataBase looking for:
-                <br><br> <span style="font-size: 18px;">C</span>ustomer name: {name if name else '?'} 
-                    <br> ID: {id if id else '?'} 
-                <br><br> <span style="font-size: 18px;">I</span>f query returned with full list it means  
-                        User didnt put paramters to search <b>(</b>would show as "?"<b>)</b>. """)
-        return jsonify([{
-            'id': ret.id,
-            'book_name': ret.book_name,
-            'cust_name': ret.cust_name,
-            'cust_id': ret.cust_id,
-            'loan_id': ret.loan_id,
-            'cust_phonenumber': ret.cust_phonenumber,
-            'loan_date': safe_format_datetime(ret.loan_date.isoformat()),
-            'returned_date': safe_format_datetime(ret.returned_date.isoformat() if ret.returned_date else None) } for ret in returned_books]), 200
+        log_action('returned_search', name=name, cust_id=id)
+        return paged_json(returned_book_row.many(returned_books), next_cursor, total), 200
 # catching unexpected error for gracious error handle:
     except Exception as e:
             logging.info(f" Outcome Activated -> Error Search returned books: {str(e)} ") 
-            log_action(f" Error Search returned books: {str(e)}")
+            log_action('returned_search_error', error=str(e))
             return jsonify({"error": str(e)}), 500
 
 #  --------------------------- LOAN RELATED METHODS =================================
 # ===================================================================================
 
+def wanted_pair(cust_id, book_id): # A ONE ROW SUBQUERY OF THE REQUESTED IDS, THE TABLES ARE OUTER JOINED TO IT SO A MISSING ROW COMES BACK AS None
+    return select(literal(cust_id, db.Integer).label('cust_id'), literal(book_id, db.Integer).label('book_id')).subquery('wanted')
+
+def loan_eligibility(cust_id, book_id): # ONE QUERY FOR THE LOAN CHECKS, RETURNS (customer or None, book or None, already loaned)
+    wanted = wanted_pair(cust_id, book_id)
+    already_loaned = (select(Loan.id).where(Loan.cust_id == wanted.c.cust_id, Loan.book_id == wanted.c.book_id)
+                      .exists().label('already_loaned'))
+    return (db.session.query(Customer, Book, already_loaned)
+            .select_from(wanted)
+            .outerjoin(Customer, Customer.id == wanted.c.cust_id)
+            .outerjoin(Book, Book.id == wanted.c.book_id)
+            .one())
+
+def open_loan_lookup(cust_id, book_id): # ONE QUERY FOR THE RETURN CHECKS, RETURNS (customer or None, book or None, newest loan of the pair or None)
+    wanted = wanted_pair(cust_id, book_id)
+    return (db.session.query(Customer, Book, Loan)
+            .select_from(wanted)
+            .outerjoin(Customer, Customer.id == wanted.c.cust_id)
+            .outerjoin(Book, Book.id == wanted.c.book_id)
+            .outerjoin(Loan, (Loan.cust_id == wanted.c.cust_id) & (Loan.book_id == wanted.c.book_id))
+            .order_by(Loan.loan_date.desc())
+            .limit(1)
+            .one())
+
+def take_book_copy(book_id): # CONDITIONAL STOCK DECREMENT, RETURNS THE NEW QUANTITY OR None WHEN NO COPY WAS LEFT (ANOTHER DESK TOOK THE LAST ONE)
+# The check and the decrement are one statement, so two loans of the last copy can never both win:
+    return db.session.execute(
+        update(Book)
+        .where(Book.id == book_id, Book.book_quantity > 0, Book.is_out_of_stock == False)
+        .values(book_quantity=Book.book_quantity - 1,
+                is_out_of_stock=case((Book.book_quantity == 1, True), else_=Book.is_out_of_stock))
+        .returning(Book.book_quantity),
+        execution_options={"synchronize_session": False}).scalar_one_or_none()
+
+def give_back_book_copy(book_id): # STOCK INCREMENT DONE BY THE DATABASE, RETURNS THE NEW QUANTITY
+    return db.session.execute(
+        update(Book)
+        .where(Book.id == book_id)
+        .values(book_quantity=Book.book_quantity + 1)
+        .returning(Book.book_quantity),
+        execution_options={"synchronize_session": False}).scalar_one()
+
 @app.route('/loan_book', methods=['POST'])
 def loan_book():
 # Ask from the User to put parameters, get them with JSON body:
     try:
         data = request.json
-# Command pull of the areguments from the body:
-        customer = db.session.get(Customer, data['cust_id']) 
-        book = db.session.get(Book, data['book_id'])
+# Command pull of the areguments from the body - the customer, the book and the existing loan check come back in one query:
+        customer, book, already_loaned = loan_eligibility(data['cust_id'], data['book_id'])
         
 # Ensure customer and book exist:
         if not customer:
@@ -696,59 +1972,59 @@ def loan_book():
         if book.is_out_of_stock:
             logging.info(" Outcome Activated -> Error: book is out of stock, matched by ID ")
             return jsonify({"erroroutofstock": {"name":book.name, "id":book.id} }), 400
-# Check if this book is already loaned to this customer:
-        existing_loan = Loan.query.filter_by(cust_id=customer.id, book_id=book.id).first()
-# if exist then return an error to not allow double book loans:
-        if existing_loan:
+# if this book is already loaned to this customer then return an error to not allow double book loans:
+        if already_loaned:
             logging.info(" Outcome Activated -> Error: customer already loaned this book, matched by ID ") 
-            log_action(f"""User tried to make a loan. <br><br> [ {book.name} ] is Already loaned to [{customer.name}, ID:{customer.id}] according to records""")
+            log_action('loan_already_loaned', book_name=book.name, customer_name=customer.name, customer_id=customer.id)
             return jsonify({"errorloaned": { "bookname":book.name, 
                                              "bookid":book.id,
                                              "custname": customer.name,
                                              "custid":customer.id }}), 400
 
-# Prepear the Loan specifics variables:
-        loan_days = {BookType.TYPE_1: 10, BookType.TYPE_2: 5, BookType.TYPE_3: 2}
-        return_due_date = datetime.now() + timedelta(days=loan_days[book.type])
-# Update the Book stock, make book out of stock if quantity == 0:       
-        if book.book_quantity > 0:
-            book.book_quantity -= 1
-            if book.book_quantity == 0:
-                book.is_out_of_stock = True
+# Keep the response values, the commit expires the objects:
+        book_id, book_name, book_type, book_category = book.id, book.name, book.type, book.category
+        customer_id, customer_name, customer_phone = customer.id, customer.name, customer.phone_number
+# Update the Book stock (out of stock when it reaches 0) - if another desk took the last copy since the check the loan is refused:
+        book_quantity = take_book_copy(book_id)
+        if book_quantity is None:
+            db.session.rollback()
+            logging.info(" Outcome Activated -> Error: the last copy of the book was loaned by another request, matched by ID ")
+            return jsonify({"erroroutofstock": {"name":book_name, "id":book_id} }), 400
 
 # Prepear the Loan object: 
-        new_loan = Loan(cust_id=customer.id,
-                        cust_name=customer.name,
-                        cust_phonenumber=customer.phone_number, 
-                        book_name = book.name, 
-                        book_id=book.id, 
-                        loan_date=datetime.now(), 
-                        return_due_date=return_due_date)
+        loan_date = datetime.now()
+        new_loan = Loan(cust_id=customer_id,
+                        cust_name=customer_name,
+                        cust_phonenumber=customer_phone, 
+                        book_name = book_name, 
+                        book_id=book_id, 
+                        loan_date=loan_date, 
+                        return_due_date=loan_date + timedelta(days=LOAN_DAYS[book_type]))
 
         db.session.add(new_loan) #request the add to DataBase
+        db.session.flush()
+        new_loan_id, return_due_date = new_loan.id, new_loan.return_due_date
+        count_customer_activity(customer_id, loan_date, loaned=1)
+        count_daily_activity(book_category, loan_date, loaned=1)
         db.session.commit() #push the data and close session
+        overdue_tracker.loan_created(return_due_date)
+        data_changed('book', 'loan')
 
 # Log and return Loan data to the front:   
         logging.info(" Outcome Activated -> Success: customer loaned a book ")      
-        log_action(f"""  <mark><span style="font-size: 18px;"><b>L</b></span>oaned</mark> book:
-                    <br> [ {book.name} ],
-                    <br> ID: ({book.id})
-                <br><br> <span style="font-size: 18px;">T</span>o Customer:
-                    <br> [ {customer.name} ],
-                    <br> ID: ( {customer.id} )
-                <br><br> <span style="font-size: 18px;">N</span>ew Loan ID: <b>(</b> {new_loan.id} <b>)</b> 
-            { "<br><br> Book quantity is 0, <mark><b>book out of stock</b></mark>" if book.book_quantity == 0 else f"New book quantity: {book.book_quantity}" } """)
-
-        return jsonify({"success": {"bookname": book.name,
-                                    "customername":customer.name,
-                                    "customerid":customer.id,
-                                    "bookid":book.id,
-                                    "bookquantity":book.book_quantity,
-                                    "newloandid":new_loan.id }}), 201
+        log_action('book_loaned_out_of_stock' if book_quantity == 0 else 'book_loaned', book_name=book_name, book_id=book_id, customer_name=customer_name, customer_id=customer_id, new_loan_id=new_loan_id, book_quantity=book_quantity)
+
+        return jsonify({"success": {"bookname": book_name,
+                                    "customername":customer_name,
+                                    "customerid":customer_id,
+                                    "bookid":book_id,
+                                    "bookquantity":book_quantity,
+                                    "newloandid":new_loan_id }}), 201
 # catching unexpected error for gracious error handle:
     except Exception as e:
+        db.session.rollback()
         logging.info(f" Outcome Activated -> Error loaning book: {str(e)}") 
-        log_action(f"Error loaning book: {str(e)}")
+        log_action('loan_error', error=str(e))
         return jsonify({"error": str(e)}), 500
 
 @app.route('/return_book', methods=['POST'])
@@ -759,34 +2035,37 @@ def return_book():
 # Check if the JSON body data returned empty or insufficient:
         if not data or 'cust_id' not in data or 'book_id' not in data : 
             logging.info(" Outcome Activated -> Error: User tried to Activate Book Return and didnt enter all necessary fields ") 
-            log_action("User tried to Activate Book Return and didnt enter all necessary fields")
+            log_action('return_missing_fields')
             return jsonify({"error": "Invalid data. All fields are required."}), 400
 # if sufficient put them into variables:   
         cust_id = data['cust_id']
         book_id = data['book_id']
-# Check the existence of a customer or book with the specific Id's:
-        customer = db.session.get(Customer, cust_id)
-        book = db.session.get(Book, book_id)
+# Check the existence of a customer or book with the specific Id's, and get their newest loan, in one query:
+        customer, book, loan = open_loan_lookup(cust_id, book_id)
 # If customer or book with these id's doesnt exist:
         if not customer or not book:
             logging.info(" Outcome Activated -> Error: book or customer doesnt exist, matched by ID") 
-            log_action(f"User tried to Return Book and book or Customer were not found <br> ( CustomerID: {cust_id} <br> BookID: {book_id} )")
+            log_action('return_not_found', cust_id=cust_id, book_id=book_id)
             return jsonify({"error_not_found": {"custid":cust_id, "bookid":book_id} }), 404
-# If exists, start query:
-        loan = Loan.query.filter_by(cust_id=cust_id, book_id=book_id ).order_by(Loan.loan_date.desc()).first()         
 # check if loan requested exist:
         if not loan:
             logging.info(" Outcome Activated -> Error: no active loan found, matched by customer and book ID") 
-            log_action(f"No Active loan found for <br> customer id:( {cust_id} ),<br> book id: ( {book_id} ) ")
+            log_action('return_no_loan', cust_id=cust_id, book_id=book_id)
             return jsonify({ "error_loan": { "bookid": book_id, "custid":cust_id } }), 404
 # If it exists, put into variables to work with:            
         customer_name = customer.name
         book_name = book.name
+        book_category = book.category
         customer_phone = customer.phone_number
         loan.actual_return_date = datetime.now()
-        previous_book_quantity = book.book_quantity
-# I made this function just to make the code smaller and simpler and to save lines:
+# Keep the loan out of the session, its values are used after the commit and its row is deleted by the statement below:
+        db.session.expunge(loan)
+# I made this function just to make the code smaller and simpler and to save lines, returns the new book quantity or None:
         def return_function (): 
+# Delete the loan only if its still there - when two desks return the same loan only one of them wins:
+            if Loan.query.filter(Loan.id == loan.id).delete(synchronize_session=False) == 0:
+                db.session.rollback()
+                return None
     # Prepare the returned book details to store in the returned book list:
             returned_book = ReturnedBooks(  loan_id = loan.id,
                                             cust_id = loan.cust_id,
@@ -794,27 +2073,32 @@ def return_book():
                                             cust_phonenumber=customer_phone,
                                             book_name=book_name,
                                             loan_date = loan.loan_date, 
-                                            returned_date = datetime.now() )
-# Add 1 book to total book quantity:
-            book.book_quantity += 1
-# Prepaer the add, prepear the deletion of the loan, and push:
+                                            returned_date = loan.actual_return_date )
+# Add 1 book to total book quantity (done by the database so concurrent returns dont overwrite each other):
+            updated_quantity = give_back_book_copy(loan.book_id)
+            count_customer_activity(loan.cust_id, loan.actual_return_date, returned=1, late=int(loan.actual_return_date > loan.return_due_date))
+            count_daily_activity(book_category, loan.actual_return_date, returned=1, late=int(loan.actual_return_date > loan.return_due_date))
+# Prepaer the add and push:
             db.session.add(returned_book)
-            db.session.delete(loan)
             db.session.commit()
+            overdue_tracker.loan_returned()
+            data_changed('book', 'loan', 'returned_books')
+            return updated_quantity
+
+        def already_returned():
+            logging.info(" Outcome Activated -> Error: the loan was returned by another request, matched by customer and book ID") 
+            return jsonify({ "error_loan": { "bookid": book_id, "custid":cust_id } }), 404
 
 # Checking if Book was returned late:
         if loan.actual_return_date <= loan.return_due_date:
     
 # Do the return incase it was returned on time:       
-            return_function()
+            updated_quantity = return_function()
+            if updated_quantity is None:
+                return already_returned()
+            previous_book_quantity = updated_quantity - 1
             logging.info(" Outcome Activated -> Success: Book was returned on time") 
-            log_action(f""" <span style="font-size: 18px;">R</span>eturned book 
-                            <br>[ {book_name}, ID: {loan.book_id} ] 
-                        <br><br> From Customer (ID: {loan.cust_id}, {customer_name}) 
-                        <br><br> On loan (ID: {loan.id} ) at {safe_format_datetime(loan.actual_return_date)}
-                        <br><br> Previous book quantity: {previous_book_quantity}
-                        <br><br> Updated book quantity: {book.book_quantity}
-                    {"<br><br> <mark>Book quantity back in stock</mark>, unless activated in the system it wont be active for loan" if previous_book_quantity == 0 else ""} """)
+            log_action('book_returned_back_in_stock' if previous_book_quantity == 0 else 'book_returned', book_name=book_name, book_id=loan.book_id, cust_id=loan.cust_id, customer_name=customer_name, loan_id=loan.id, returned_date=safe_format_datetime(loan.actual_return_date), previous_book_quantity=previous_book_quantity, updated_quantity=updated_quantity)
 
             return jsonify({"success_on_time": { "bookname":book_name,
                                                 "customername":customer_name,
@@ -823,22 +2107,15 @@ def return_book():
                                                 "loanid":loan.id, 
                                                 "actual_return_date": safe_format_datetime(loan.actual_return_date),
                                                 "previous_book_quantity":previous_book_quantity,
-                                                "Updated_book_quantity": book.book_quantity }}), 201
+                                                "Updated_book_quantity": updated_quantity }}), 201
 
 # Do the return incase it was late and notify the Employee so he could make the judgment needed:
-        return_function()
+        updated_quantity = return_function()
+        if updated_quantity is None:
+            return already_returned()
+        previous_book_quantity = updated_quantity - 1
         logging.info(" Outcome Activated -> Success: Book was returned Late") 
-        log_action(f""" <span style="font-size: 18px;">U</span>ser Returned book 
-                        <br> [ {book_name}, ID: {loan.book_id} ] 
-                    <br><br> From Customer 
-                        <br> (ID: {loan.cust_id}, {customer_name}) 
-                    <br><br> On loan (ID: {loan.id} )
-                    <br><br> <mark>Was recived after(!!)</mark> due return date which was {safe_format_datetime(loan.return_due_date)} 
-                    <br><br> and was returned on 
-                        <br> {safe_format_datetime(loan.actual_return_date)}
-                    <br><br> Previous book quantity: {previous_book_quantity}
-                    <br><br> Updated book quantity: {book.book_quantity}
-                {"<br><br> <mark>Book quantity back in stock</mark>, unless activated in the system it wont be active for loan" if previous_book_quantity == 0 else ""} """)
+        log_action('book_returned_late_back_in_stock' if previous_book_quantity == 0 else 'book_returned_late', book_name=book_name, book_id=loan.book_id, cust_id=loan.cust_id, customer_name=customer_name, loan_id=loan.id, return_due_date=safe_format_datetime(loan.return_due_date), returned_date=safe_format_datetime(loan.actual_return_date), previous_book_quantity=previous_book_quantity, updated_quantity=updated_quantity)
         
         return jsonify({ "success_late": {"return_due_date": safe_format_datetime(loan.return_due_date) , 
                                         "actual_return_date": safe_format_datetime(loan.actual_return_date),
@@ -847,15 +2124,207 @@ def return_book():
                                         "custid": loan.cust_id,
                                         "bookid": loan.book_id,
                                         "loanid":loan.id, 
-                                        "book_quantity": book.book_quantity, 
+                                        "book_quantity": updated_quantity, 
                                         "previous_book_quantity":previous_book_quantity   }}), 201
 # catching unexpected error for gracious error handle:
     except Exception as e:
+        db.session.rollback()
         logging.info(f" Outcome Activated -> Error in return_book: {str(e)}") 
-        log_action(f"Error in return_book: {str(e)}")
+        log_action('return_error', error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+def read_batch_pairs(data): # A METHOD TO READ THE (cust_id, book_id) LIST OF THE BATCH ROUTES, RAISES BadRequest IF ITS INVALID
+# The body can be the list itself or {"items": [...]}:
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise BadRequest("Body must be a non empty list of {'cust_id', 'book_id'} items (or {'items': [...]})")
+    if len(items) > app.config['BATCH_MAX_ITEMS']:
+        raise BadRequest(f"Too many items, the most is {app.config['BATCH_MAX_ITEMS']}")
+    pairs = []
+    for index, item in enumerate(items):
+        try:
+            pairs.append((int(item['cust_id']), int(item['book_id'])))
+        except (KeyError, TypeError, ValueError):
+            raise BadRequest(f"Item {index} must have integer 'cust_id' and 'book_id'")
+    return pairs
+
+@app.route('/loan_books', methods=['POST'])
+def loan_books():
+# Batch version of /loan_book - same rules for every pair, all the rows are read up front and written in one commit.
+# Every item gets its own status and the same answer /loan_book would give for it:
+    try:
+        pairs = read_batch_pairs(request.json)
+        cust_ids = {cust_id for cust_id, _ in pairs}
+        book_ids = {book_id for _, book_id in pairs}
+# Prefetch all the customers, books and the existing loans of the pairs in 3 queries:
+        customers = {c.id: c for c in Customer.query.filter(Customer.id.in_(cust_ids))}
+        books = {b.id: b for b in Book.query.filter(Book.id.in_(book_ids))}
+        loaned_pairs = set(db.session.query(Loan.cust_id, Loan.book_id).filter(tuple_(Loan.cust_id, Loan.book_id).in_(pairs)).all())
+
+        results = []
+        new_loans = []
+        for index, (cust_id, book_id) in enumerate(pairs):
+            customer = customers.get(cust_id)
+            book = books.get(book_id)
+# Same checks as /loan_book, in the same order:
+            if not customer:
+                results.append({"index": index, "status": 404, "result": {"errorCustnotfound": cust_id}})
+                continue
+            if not book:
+                results.append({"index": index, "status": 404, "result": {"errorBooknotfound": book_id}})
+                continue
+            if customer.is_deactivated:
+                results.append({"index": index, "status": 400, "result": {"errorCustdeactivated": {"name": customer.name, "id": customer.id}}})
+                continue
+            if book.is_out_of_stock:
+                results.append({"index": index, "status": 400, "result": {"erroroutofstock": {"name": book.name, "id": book.id}}})
+                continue
+            if (cust_id, book_id) in loaned_pairs:
+                results.append({"index": index, "status": 400, "result": {"errorloaned": {"bookname": book.name, "bookid": book.id, "custname": customer.name, "custid": customer.id}}})
+                continue
+# Update the Book stock with the same conditional decrement as /loan_book (later items of the same book see the new quantity):
+            book_quantity = take_book_copy(book.id)
+            if book_quantity is None:
+                results.append({"index": index, "status": 400, "result": {"erroroutofstock": {"name": book.name, "id": book.id}}})
+                continue
+            loan_date = datetime.now()
+            new_loan = Loan(cust_id=customer.id,
+                            cust_name=customer.name,
+                            cust_phonenumber=customer.phone_number,
+                            book_name=book.name,
+                            book_id=book.id,
+                            loan_date=loan_date,
+                            return_due_date=loan_date + timedelta(days=LOAN_DAYS[book.type]))
+            db.session.add(new_loan)
+            count_customer_activity(customer.id, loan_date, loaned=1)
+            count_daily_activity(book.category, loan_date, loaned=1)
+            loaned_pairs.add((cust_id, book_id))
+            new_loans.append((index, new_loan, customer, book, book_quantity))
+            results.append(None) # filled after the flush gives the loan its ID
+
+# Flush to get the new loan IDs and build the answers before the commit expires the objects:
+        db.session.flush()
+        for index, new_loan, customer, book, quantity in new_loans:
+            results[index] = {"index": index, "status": 201, "result": {"success": {"bookname": book.name,
+                                                                                      "customername": customer.name,
+                                                                                      "customerid": customer.id,
+                                                                                      "bookid": book.id,
+                                                                                      "bookquantity": quantity,
+                                                                                      "newloandid": new_loan.id }}}
+        due_dates = [new_loan.return_due_date for _, new_loan, _, _, _ in new_loans]
+        db.session.commit()
+        for return_due_date in due_dates:
+            overdue_tracker.loan_created(return_due_date)
+        if new_loans:
+            data_changed('book', 'loan')
+
+# Log one entry for the whole batch and return the per item results:
+        failed = len(pairs) - len(new_loans)
+        logging.info(f" Outcome Activated -> Batch loan: {len(new_loans)} loaned, {failed} failed")
+        log_action('batch_loan', items=len(pairs), loaned=len(new_loans), failed=failed, loans=[[r['result']['success']['newloandid'], r['result']['success']['bookname'], r['result']['success']['customername']] for r in results if r['status'] == 201])
+        return jsonify({"loaned": len(new_loans), "failed": failed, "results": results}), 200
+# catching unexpected error for gracious error handle (nothing from the batch was saved):
+    except BadRequest as e:
+        logging.info(f" Outcome Activated -> Bad request in batch loan: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logging.info(f" Outcome Activated -> Error in batch loan: {str(e)}")
+        log_action('batch_loan_error', error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/return_books', methods=['POST'])
+def return_books():
+# Batch version of /return_book - same rules for every pair, all the rows are read up front and written in one commit.
+# Every item gets its own status and the same answer /return_book would give for it:
+    try:
+        pairs = read_batch_pairs(request.json)
+        cust_ids = {cust_id for cust_id, _ in pairs}
+        book_ids = {book_id for _, book_id in pairs}
+# Prefetch all the customers, books and the loans of the pairs in 3 queries:
+        customers = {c.id: c for c in Customer.query.filter(Customer.id.in_(cust_ids))}
+        books = {b.id: b for b in Book.query.filter(Book.id.in_(book_ids))}
+        loans = {}
+# Newest loan first for every pair, like /return_book picks it:
+        for loan in Loan.query.filter(tuple_(Loan.cust_id, Loan.book_id).in_(pairs)).order_by(Loan.loan_date.desc()):
+            loans.setdefault((loan.cust_id, loan.book_id), []).append(loan)
+
+        results = []
+        returned = []
+        for index, (cust_id, book_id) in enumerate(pairs):
+            customer = customers.get(cust_id)
+            book = books.get(book_id)
+            if not customer or not book:
+                results.append({"index": index, "status": 404, "result": {"error_not_found": {"custid": cust_id, "bookid": book_id}}})
+                continue
+            pair_loans = loans.get((cust_id, book_id))
+            if not pair_loans:
+                results.append({"index": index, "status": 404, "result": {"error_loan": {"bookid": book_id, "custid": cust_id}}})
+                continue
+            loan = pair_loans.pop(0)
+# Delete the loan only if its still there like /return_book does - a loan another desk returned since it was read fails only its own item:
+            if Loan.query.filter(Loan.id == loan.id).delete(synchronize_session=False) == 0:
+                logging.info(" Outcome Activated -> Error: the loan was returned by another request, matched by customer and book ID")
+                results.append({"index": index, "status": 404, "result": {"error_loan": {"bookid": book_id, "custid": cust_id}}})
+                continue
+            actual_return_date = datetime.now()
+            db.session.add(ReturnedBooks(loan_id=loan.id,
+                                         cust_id=loan.cust_id,
+                                         cust_name=customer.name,
+                                         cust_phonenumber=customer.phone_number,
+                                         book_name=book.name,
+                                         loan_date=loan.loan_date,
+                                         returned_date=actual_return_date))
+            book_quantity = give_back_book_copy(book.id)
+            previous_book_quantity = book_quantity - 1
+            count_customer_activity(loan.cust_id, actual_return_date, returned=1, late=int(actual_return_date > loan.return_due_date))
+            count_daily_activity(book.category, actual_return_date, returned=1, late=int(actual_return_date > loan.return_due_date))
+            returned.append(loan.id)
+# Same answer as /return_book for an on time or a late return:
+            if actual_return_date <= loan.return_due_date:
+                result = {"success_on_time": {"bookname": book.name,
+                                              "customername": customer.name,
+                                              "custid": loan.cust_id,
+                                              "bookid": loan.book_id,
+                                              "loanid": loan.id,
+                                              "actual_return_date": safe_format_datetime(actual_return_date),
+                                              "previous_book_quantity": previous_book_quantity,
+                                              "Updated_book_quantity": book_quantity }}
+            else:
+                result = {"success_late": {"return_due_date": safe_format_datetime(loan.return_due_date),
+                                           "actual_return_date": safe_format_datetime(actual_return_date),
+                                           "bookname": book.name,
+                                           "customername": customer.name,
+                                           "custid": loan.cust_id,
+                                           "bookid": loan.book_id,
+                                           "loanid": loan.id,
+                                           "book_quantity": book_quantity,
+                                           "previous_book_quantity": previous_book_quantity }}
+            results.append({"index": index, "status": 201, "result": result})
+
+        db.session.commit()
+        if returned:
+            overdue_tracker.loan_returned()
+            data_changed('book', 'loan', 'returned_books')
+
+# Log one entry for the whole batch and return the per item results:
+        late = sum(1 for r in results if 'success_late' in r['result'])
+        failed = len(pairs) - len(returned)
+        logging.info(f" Outcome Activated -> Batch return: {len(returned)} returned ({late} late), {failed} failed")
+        log_action('batch_return', items=len(pairs), returned=len(returned), late=late, failed=failed, loan_ids=returned)
+        return jsonify({"returned": len(returned), "late": late, "failed": failed, "results": results}), 200
+# catching unexpected error for gracious error handle (nothing from the batch was saved):
+    except BadRequest as e:
+        logging.info(f" Outcome Activated -> Bad request in batch return: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logging.info(f" Outcome Activated -> Error in batch return: {str(e)}")
+        log_action('batch_return_error', error=str(e))
         return jsonify({"error": str(e)}), 500
 
 @app.route('/search_loans', methods=['GET'])
+@cached_response('loan')
 def search_loans():
     try:
 # Get the parameters from the user using URI: 
@@ -863,53 +2332,45 @@ def search_loans():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         cust_id = request.args.get('cust_id')
-# Start query session:
-        query = Loan.query
+# Start the search, the statement of this combination of filters is built once and cached:
+        query = loan_searches.new()
 # Query chain:
         if cust_id:
-            query = query.filter(Loan.cust_id == cust_id)
+            query.where('cust_id', 'eq', cust_id)
         if book_id:
-            query = query.filter(Loan.book_id == book_id)
+            query.where('book_id', 'eq', book_id)
         try:
             if start_date and end_date:
 # Parse the provided dates (assuming the format is YYYY-MM-DD):
                 start_date_parsed = datetime.strptime(start_date, '%Y-%m-%d')
                 end_date_parsed = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
 # Filter loans between the start and end dates:
-                query = query.filter(Loan.loan_date >= start_date_parsed, Loan.loan_date < end_date_parsed)
+                query.where('loan_date', 'ge', start_date_parsed).where('loan_date', 'lt', end_date_parsed)
 # If only start date given then Only filter from start_date:
             elif start_date:
                 start_date_parsed = datetime.strptime(start_date, '%Y-%m-%d')
-                query = query.filter(Loan.loan_date >= start_date_parsed)
+                query.where('loan_date', 'ge', start_date_parsed)
 # If only end date given then Only filter from end_date:
             elif end_date:
                 end_date_parsed = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
-                query = query.filter(Loan.loan_date < end_date_parsed)
+                query.where('loan_date', 'lt', end_date_parsed)
         except ValueError:
             logging.info(" Outcome Activated -> Error: Invalid date format. Please use 'YYYY-MM-DD' ") 
             return jsonify({"error": "Invalid date format. Please use 'YYYY-MM-DD'."}), 400
-# Submit query chain request and end session:        
-        loans = query.all()
+# Check the paging parameters (limit, cursor, count):
+        try:
+            page = read_search_page(query)
+        except ValueError as e:
+            logging.info(f" Outcome Activated -> Error: invalid search paging parameters: {str(e)}")
+            return jsonify({"error": f"Invalid paging parameters: {str(e)}"}), 400
+# Submit query chain request (one page of it) and end session:
+        loans, next_cursor, total = query.page(db.session, **page)
         
-        log_action(f""" Employee searched loans using these search paramters -->> 
-                    <br> ---------------------<br>
-                    <br> Customer ID: {cust_id if cust_id else "?"}
-                    <br> Book ID: {book_id if book_id else "?"}
-                    <br><br> Loan start date range: <br>{safe_format_datetime_for_log(start_date if start_date else "?")}
-                    <br><br> Loan end date range: {safe_format_datetime_for_log(end_date if end_date else "?")}
-                    <br><br><br> If all paramters are '?' or not accurate the User would get full active Loan list """)
+        log_action('loan_search', cust_id=cust_id, book_id=book_id, start_date=safe_format_datetime_for_log(start_date), end_date=safe_format_datetime_for_log(end_date))
 # If a Loan was found:
         if loans:
             logging.info(" Outcome Activated -> Success: Loans search occured ") 
-            return jsonify([{
-                        'loan_ID': loan.id,
-                        'Customer_Name': loan.cust_name,
-                        'Customer_ID': loan.cust_id,
-                        'Customer_phone number': loan.cust_phonenumber,
-                        'Book_Name': loan.book_name,
-                        'Book_ID': loan.book_id, 
-                        'Loan_Date': safe_format_datetime(loan.loan_date.isoformat()),
-                        'Return_Due_Date': safe_format_datetime(loan.return_due_date.isoformat()) } for loan in loans]), 200
+            return paged_json(loan_row.many(loans), next_cursor, total), 200
 # If a Loan wasnt found:
         logging.info(" Outcome Activated -> Error: no loans found ")
         return jsonify({"error_loans": {"cust_id": cust_id if cust_id else '?',
@@ -919,7 +2380,7 @@ def search_loans():
 # catching unexpected error for gracious error handle:
     except Exception as e:
         logging.info(f" Outcome Activated -> Error searching loan: {str(e)}") 
-        log_action(f"Error searching loan: {str(e)}")
+        log_action('loan_search_error', error=str(e))
         return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
 
 @app.route('/search_late_loans', methods=['GET'])
@@ -930,40 +2391,292 @@ def get_late_loans():
     try:
 # Set a variable to instore the current time and start a query session:
         current_date = datetime.now() 
-        late_loans = Loan.query.filter(Loan.return_due_date < current_date, Loan.return_due_date.isnot(None)).all()
+# Oldest due date first (the due date index), the cached statement of the late loans search:
+        query = late_loan_searches.new().where('return_due_date', 'lt', current_date)
+# Check the paging parameters (limit, cursor, count):
+        try:
+            page = read_search_page(query)
+        except ValueError as e:
+            logging.info(f" Outcome Activated -> Error: invalid search paging parameters: {str(e)}")
+            return jsonify({"error": f"Invalid paging parameters: {str(e)}"}), 400
+# Skip the query when the overdue tracker knows there are no late loans:
+        late_loans, next_cursor, total = [], None, None
+        if overdue_tracker.has_overdue_loans(current_date):
+            late_loans, next_cursor, total = query.page(db.session, **page)
 # If a late loan wasnt found:
         if not late_loans: 
             logging.info(" Outcome Activated -> Error: no late loans found") 
-            log_action(f"""<span style="font-size: 18px;">U</span>ser searched for Late loans. <br> No late loans were found""")
+            log_action('late_loans_not_found')
             return jsonify({"error_late_loans": "No late loans found."}), 404
 
         logging.info(" Outcome Activated -> Success: Late loans found, list shown and documented into databse logger")
 #----PUTTING THE RESULT INTO THE STORE LOGGER because late loans are extremly importent to track by the Manager\Boss: 
         for loan in late_loans:
-            log_entry = LogEntry(action = f""" Employee searched for Late Loans and <mark>late loans were found</mark>:
-                                            <br>--------------------
-                                            <br><br> Loan ID: {loan.id}
-                                            <br><br> Customer ID: {loan.cust_id}
-                                            <br><br> Book ID: {loan.book_id} 
-                                            <br><br> Loan Date: {safe_format_datetime(loan.loan_date.isoformat())} 
-                                            <br><br> Return due Date: {safe_format_datetime(loan.return_due_date.isoformat())} """)
-# Prepear the add + commit it and close session:
-            db.session.add(log_entry)
-            db.session.commit()
+            log_action('late_loan_found', loan_id=loan.id, cust_id=loan.cust_id, book_id=loan.book_id, loan_date=format_datetime(loan.loan_date), return_due_date=format_datetime(loan.return_due_date))
 # Return the Late loans to the Front: 
-        return jsonify([{
-            'Loan_ID': loan.id, 
-            'Customer_ID': loan.cust_id,
-            'Customer_name': loan.cust_name,
-            'Customer_phone number': loan.cust_phonenumber,
-            'Book_Name': loan.book_name,
-            'Book_ID': loan.book_id,
-            'loan_date': safe_format_datetime(loan.loan_date.isoformat()),
-            'return_due_date': safe_format_datetime(loan.return_due_date.isoformat())} for loan in late_loans]), 200
+        return paged_json(late_loan_row.many(late_loans), next_cursor, total), 200
 # catching unexpected error for gracious error handle:
     except Exception as e:
         logging.info(f" Outcome Activated -> Error searching late loans: {str(e)}") 
-        log_action(f"Error searching late loans: {str(e)}")
+        log_action('late_loans_error', error=str(e))
+        return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
+
+# ------------------- BULK IMPORT METHODS =========================================================
+# =================================================================================================
+
+def read_import_rows(stream, file_format): # A METHOD TO STREAM THE ROWS OF A CSV OR NDJSON UPLOAD, YIELDS (row number, dict or error text)
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        for row_number, row in enumerate(csv.DictReader(text_stream), start=1):
+            yield row_number, row
+        return
+    for row_number, line in enumerate(text_stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield row_number, f"invalid JSON: {str(e)}"
+            continue
+        yield row_number, row if isinstance(row, dict) else "each line must be a JSON object"
+
+def required_fields(row, fields):
+    missing = [field for field in fields if row.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+
+def validate_book_row(row): # SAME RULES AS /add_book, RETURNS THE ROW TO INSERT OR RAISES ValueError
+    required_fields(row, ['name', 'author', 'year_published', 'type', 'category'])
+    try:
+        book_type = BookType(int(row['type']))
+    except ValueError:
+        raise ValueError(f"Invalid type '{row['type']}', use 1, 2 or 3")
+    try:
+        category = BookCategory(row['category'])
+    except ValueError:
+        raise ValueError(f"Invalid category '{row['category']}', use one of: {', '.join(c.value for c in BookCategory)}")
+    quantity = int(row.get('quantity') or 1)
+    if quantity < 0:
+        raise ValueError(f"Invalid quantity {quantity}")
+    return {'name': str(row['name']).strip(),
+            'author': str(row['author']).strip(),
+            'year_published': int(row['year_published']),
+            'type': book_type,
+            'category': category,
+            'book_quantity': quantity,
+            'is_out_of_stock': quantity == 0}
+
+def validate_customer_row(row): # SAME RULES AS /add_customer, RETURNS THE ROW TO INSERT OR RAISES ValueError
+    required_fields(row, ['name', 'city', 'age', 'phone_number'])
+    return {'name': str(row['name']).strip(),
+            'city': str(row['city']).strip(),
+            'age': int(row['age']),
+            'phone_number': str(row['phone_number']).strip(),
+            'is_deactivated': False}
+
+# For every import: the model, the row check, the duplicate key of a row and the query of the keys that already exist:
+IMPORTERS = {
+    'books': (Book, validate_book_row, lambda row: row['name'].lower(),
+              lambda keys: {key for (key,) in db.session.query(func.lower(Book.name)).filter(func.lower(Book.name).in_(keys))}),
+    'customers': (Customer, validate_customer_row, lambda row: row['phone_number'],
+                  lambda keys: {key for (key,) in db.session.query(Customer.phone_number).filter(Customer.phone_number.in_(keys))}) }
+
+def run_import(kind, stream, file_format): # A METHOD TO IMPORT A STREAM OF ROWS IN CHUNKS, RETURNS THE REPORT
+    model, validate, duplicate_key, existing_keys = IMPORTERS[kind]
+    chunk_size = app.config['IMPORT_CHUNK_SIZE']
+    max_errors = app.config['IMPORT_MAX_REPORTED_ERRORS']
+    report = {"imported": 0, "failed": 0, "errors": [], "errors_truncated": False}
+    seen_keys = set() # duplicates inside the file itself
+
+    def add_error(row_number, error):
+        report["failed"] += 1
+        if len(report["errors"]) < max_errors:
+            report["errors"].append({"row": row_number, "error": error})
+        else:
+            report["errors_truncated"] = True
+
+    def write_chunk(chunk):
+# One query for the duplicates of the whole chunk, then one executemany insert and one commit:
+        existing = existing_keys([key for _, key, _ in chunk])
+        rows = []
+        for row_number, key, row in chunk:
+            if key in existing:
+                add_error(row_number, f"already exists in DataBase ({key})")
+            else:
+                rows.append(row)
+        if rows:
+            db.session.execute(model.__table__.insert(), rows)
+            db.session.commit()
+            report["imported"] += len(rows)
+
+    chunk = []
+    for row_number, row in read_import_rows(stream, file_format):
+        if isinstance(row, str):
+            add_error(row_number, row)
+            continue
+        try:
+            row = validate(row)
+        except (ValueError, TypeError) as e:
+            add_error(row_number, str(e))
+            continue
+        key = duplicate_key(row)
+        if key in seen_keys:
+            add_error(row_number, f"duplicate of an earlier row in the file ({key})")
+            continue
+        seen_keys.add(key)
+        chunk.append((row_number, key, row))
+        if len(chunk) >= chunk_size:
+            write_chunk(chunk)
+            chunk = []
+    if chunk:
+        write_chunk(chunk)
+    if report["imported"]:
+        data_changed(model.__tablename__)
+    report["errors"].sort(key=lambda error: error["row"])
+    return report
+
+def import_file_format(filename, content_type):
+# 'format' parameter first, then the file extension, then the content type - CSV if nothing says otherwise:
+    requested = (request.args.get('format') or '').lower()
+    if requested:
+        return requested
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')) or 'ndjson' in (content_type or '') or 'jsonl' in (content_type or ''):
+        return 'ndjson'
+    return 'csv'
+
+@app.route('/import/<kind>', methods=['POST'])
+def import_rows(kind):
+# Bulk import of books or customers from a CSV or NDJSON upload (multipart field 'file' or the raw body).
+# The rows are streamed and written in chunks, so already written chunks stay if a later chunk fails:
+    try:
+        if kind not in IMPORTERS:
+            logging.info(f" Outcome Activated -> Error: unknown import kind {kind}")
+            return jsonify({"error": f"Unknown import '{kind}', use 'books' or 'customers'"}), 404
+        upload = request.files.get('file')
+        if upload:
+            stream, file_format = upload.stream, import_file_format(upload.filename, upload.content_type)
+        else:
+            stream, file_format = request.stream, import_file_format(None, request.content_type)
+        if file_format not in ('csv', 'ndjson'):
+            logging.info(f" Outcome Activated -> Error: invalid import format {file_format}")
+            return jsonify({"error": f"Invalid format '{file_format}', use 'csv' or 'ndjson'"}), 400
+
+        report = run_import(kind, stream, file_format)
+        logging.info(f" Outcome Activated -> Success: imported {report['imported']} {kind}, {report['failed']} rows failed")
+        log_action('import_done', kind=kind, file_format=file_format.upper(), imported=report['imported'], failed=report['failed'])
+        return jsonify({"success": report}), 201 if report["imported"] else 200
+# catching unexpected error for gracious error handle:
+    except Exception as e:
+        db.session.rollback()
+        logging.info(f" Outcome Activated -> Error importing {kind}: {str(e)}")
+        log_action('import_error', kind=kind, error=str(e))
+        return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
+
+# ------------------- EXPORT METHODS ==============================================================
+# =================================================================================================
+
+def filter_date_range(query, date_column, start_date, end_date): # SAME 'YYYY-MM-DD' DATE FILTER THE SEARCH ROUTES USE, RAISES ValueError
+    if start_date:
+        query = query.filter(date_column >= datetime.strptime(start_date, '%Y-%m-%d'))
+    if end_date:
+        query = query.filter(date_column < datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1))
+    return query
+
+def export_loans_query(args): # SAME FILTERS AS /search_loans
+    query = Loan.query
+    if args.get('cust_id'):
+        query = query.filter(Loan.cust_id == args.get('cust_id'))
+    if args.get('book_id'):
+        query = query.filter(Loan.book_id == args.get('book_id'))
+    return filter_date_range(query, Loan.loan_date, args.get('start_date'), args.get('end_date')).order_by(Loan.id)
+
+def export_returned_books_query(args): # SAME FILTERS AS /Returned_Books_list (plus the returned date range)
+    query = ReturnedBooks.query
+    if args.get('name'):
+        query = query.filter(ReturnedBooks.cust_name.ilike(f"%{args.get('name')}%"))
+    if args.get('id'):
+        query = query.filter(ReturnedBooks.cust_id == args.get('id'))
+    return filter_date_range(query, ReturnedBooks.returned_date, args.get('start_date'), args.get('end_date')).order_by(ReturnedBooks.id)
+
+def export_log_entries_query(args): # SAME FILTERS AS /log_entries, oldest first
+    query = filter_date_range(LogEntry.query, LogEntry.timestamp, args.get('start_date'), args.get('end_date'))
+    return query.order_by(LogEntry.timestamp, LogEntry.id)
+
+# Export name -> (query maker, row builder):
+EXPORTS = {
+    'loans': (export_loans_query, loan_row),
+    'returned_books': (export_returned_books_query, returned_book_row),
+    'log_entries': (export_log_entries_query, log_entry_row) }
+
+def export_chunks(query, row_serializer, file_format): # A GENERATOR OF THE FILE TEXT IN PIECES, READS THE ROWS IN FETCHES
+    flush_bytes = app.config['EXPORT_FLUSH_BYTES']
+    rows = query.yield_per(app.config['EXPORT_FETCH_SIZE'])
+    buffer = io.StringIO()
+    if file_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(row_serializer.keys)
+        for row in rows:
+            writer.writerow(row_serializer(row).values())
+            if buffer.tell() >= flush_bytes:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    else:
+        for row in rows:
+            buffer.write(json.dumps(row_serializer(row), ensure_ascii=False))
+            buffer.write('\n')
+            if buffer.tell() >= flush_bytes:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def gzip_chunks(chunks): # A GENERATOR THAT GZIPS THE PIECES AS THEY COME
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # 31 = gzip header
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route('/export/<name>', methods=['GET'])
+def export_rows(name):
+# Streams loans, returned books or log entries as CSV or NDJSON (format=csv|ndjson, gzip=true for a .gz file).
+# The rows are read from the database in fetches and sent as they are made, so the memory stays flat for any size:
+    try:
+        if name not in EXPORTS:
+            logging.info(f" Outcome Activated -> Error: unknown export {name}")
+            return jsonify({"error": f"Unknown export '{name}', use one of: {', '.join(EXPORTS)}"}), 404
+        file_format = (request.args.get('format') or 'csv').lower()
+        if file_format not in ('csv', 'ndjson'):
+            logging.info(f" Outcome Activated -> Error: invalid export format {file_format}")
+            return jsonify({"error": f"Invalid format '{file_format}', use 'csv' or 'ndjson'"}), 400
+        compress = (request.args.get('gzip') or '').lower() == 'true'
+        make_query, row_serializer = EXPORTS[name]
+        try:
+            query = make_query(request.args)
+        except ValueError:
+            logging.info(" Outcome Activated -> Error: Invalid date format. Please use 'YYYY-MM-DD' ")
+            return jsonify({"error": "Invalid date format. Please use 'YYYY-MM-DD'."}), 400
+        if name == 'log_entries':
+            audit_log_writer.flush()
+
+        logging.info(f" Outcome Activated -> Success: export of {name} started")
+        log_action('export_done', table=name.replace('_', ' '), file_format=file_format.upper(), filters=", ".join(f"{key}: {value}" for key, value in request.args.items() if key not in ('format', 'gzip')) or "none (full list)")
+        chunks = export_chunks(query, row_serializer, file_format)
+        filename = f"{name}_{datetime.now():%Y%m%d_%H%M%S}.{file_format}"
+        mimetype = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+        if compress:
+            chunks, filename, mimetype = gzip_chunks(chunks), filename + '.gz', 'application/gzip'
+        response = Response(stream_with_context(chunks), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+# catching unexpected error for gracious error handle:
+    except Exception as e:
+        logging.info(f" Outcome Activated -> Error exporting {name}: {str(e)}")
+        log_action('export_error', name=name, error=str(e))
         return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
 
 # ------------------- ADDITIONAL METHODS TO HELP THE LIBRARY PROGRAM ==============================
@@ -972,10 +2685,12 @@ def get_late_loans():
 @app.route('/reset_database', methods=['POST'])
 def reset_database():
     try:
+# Write the buffered log rows before the tables are dropped:
+        audit_log_writer.flush()
 # Erasing all DataBase:
         db.drop_all() 
 # Creating new Database:
-        db.create_all()  
+        prepare_database(rebuild=True)
 # Add 5 random customers:
         customers = [
             Customer(name="Alice Johnson", city="New York", age=28, phone_number="054-6300598"),
@@ -995,118 +2710,204 @@ def reset_database():
             Book(name="The Hobbit", author="J.R.R. Tolkien", year_published=1937, type=BookType.TYPE_2, category=BookCategory.FANTASY, book_quantity = 1)
         ]
         db.session.bulk_save_objects(books) #Prepear save
+# The tables were dropped and created again, the loans and returned books have no insert that would move their counters -
+# moved here so the cached answers and ETags of the other workers cant match the old rows anymore (the counters table survives the drop):
+        table_versions.bump(TableVersions.TABLES)
 # Commit changes and end session:
         db.session.commit()
+        overdue_tracker.invalidate()
+        data_changed('book', 'customer', 'loan', 'returned_books')
         logging.info(" Outcome Activated -> !!!!!!!! USER ERASED AND RESTARTED ALL DATABASE !!!!!!! ") 
-        log_action("<mark>USER has reseted Database</mark> with 5 new Customers and 5 sample books")
+        log_action('database_reset')
         return jsonify({"success": "<mark>Database was reseted successfully!!!</mark>"}), 201
 # catching unexpected error for gracious error handle:
     except Exception as e:
         logging.info(f" Outcome Activated -> Error reseting database: {str(e)}") 
-        log_action(f"Error reseting database: {str(e)}")
+        log_action('database_reset_error', error=str(e))
         return jsonify({"error": str(e)}), 500
 
 @app.route('/log_entries', methods=['GET'])
 def get_log_entries():
+# Returns the newest log entries first, one page at a time:
+#   limit  - page size
+#   before - cursor from the X-Next-Cursor header, gives the next (older) page
+#   after  - cursor from the X-Tail-Cursor header, gives only the entries added since then (tail mode)
+#   render - 'false' returns the event code and parameters of every entry instead of the HTML (see /log_entries/templates)
     try:
+# Write the buffered log rows first so the user sees the latest actions:
+        audit_log_writer.flush()
 # Get the 'start_date' and 'end_date' query parameters:
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
+        before = request.args.get('before')
+        after = request.args.get('after')
 # Initialize the query:
         query = LogEntry.query
 # Handle start_date and end_date combination:
         try:
 # Parse the provided dates (assuming the format is YYYY-MM-DD):
-            if start_date and end_date:
-                start_date_parsed = datetime.strptime(start_date, '%Y-%m-%d')
-                end_date_parsed = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
-# Filter the logs where the timestamp is between start_date and end_date:
-                query = query.filter(LogEntry.timestamp >= start_date_parsed, LogEntry.timestamp < end_date_parsed)
-# If Only start date exists - filter from start_date:
-            elif start_date:
-                start_date_parsed = datetime.strptime(start_date, '%Y-%m-%d')
+            start_date_parsed = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+            end_date_parsed = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1) if end_date else None
+# Filter the logs where the timestamp is between start_date and end_date (or only from start_date / until end_date):
+            if start_date_parsed:
                 query = query.filter(LogEntry.timestamp >= start_date_parsed)
-# If Only end_date exists - filter from end_date:
-            elif end_date:
-                end_date_parsed = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+            if end_date_parsed:
                 query = query.filter(LogEntry.timestamp < end_date_parsed)
 # Catch possible errors 
         except ValueError:
             logging.info(" Outcome Activated -> Invalid date format. Please use 'YYYY-MM-DD'") 
             return jsonify({"error": "Invalid date format. Please use 'YYYY-MM-DD'."}), 400
-
-# Execute the query and get the logs, sorted by the timestamp (desc by default):
-        logs = query.order_by(LogEntry.timestamp.desc()).all()
+# Check the paging parameters:
+        try:
+            limit = parse_page_limit(request.args.get('limit'), app.config['LOG_ENTRIES_PAGE_SIZE'], app.config['LOG_ENTRIES_MAX_PAGE_SIZE'])
+            before_key = decode_cursor(before) if before else None
+            after_key = decode_cursor(after) if after else None
+        except ValueError as e:
+            logging.info(f" Outcome Activated -> Error: invalid log entries paging parameters: {str(e)}") 
+            return jsonify({"error": f"Invalid paging parameters: {str(e)}"}), 400
+        if before_key and after_key:
+            logging.info(" Outcome Activated -> Error: log entries asked with both 'before' and 'after'") 
+            return jsonify({"error": "Use either 'before' or 'after', not both."}), 400
+
+        key = tuple_(LogEntry.timestamp, LogEntry.id)
+        if after_key:
+# Tail mode - follows the id only: a row gets its timestamp when the action happens but its id when its inserted (a batch later, maybe by another worker),
+# and SQLite gives the ids in the order of the commits, so a row with an older timestamp committed after the last poll is still ahead of the cursor.
+# Walk the primary key upwards from the cursor and flip the page back to newest first:
+            logs = query.filter(LogEntry.id > after_key[1]).order_by(LogEntry.id.asc()).limit(limit + 1).all()
+            has_more = len(logs) > limit
+            logs = list(reversed(logs[:limit]))
+        else:
+            if before_key:
+                query = query.filter(key < before_key)
+# Execute the query and get the logs, sorted by the timestamp (newest first), one extra row tells if there is another page:
+            logs = query.order_by(LogEntry.timestamp.desc(), LogEntry.id.desc()).limit(limit + 1).all()
+            has_more = len(logs) > limit
+            logs = logs[:limit]
+# The archived months are older than anything in the table - a short page continues into the ones the range reaches
+# (read_page skips the months outside of the dates, a range without a start date reaches all of them):
+            if not has_more:
+                boundary = (logs[-1].timestamp, logs[-1].id) if logs else before_key
+                archived, has_more = log_archive.read_page(start_date_parsed, end_date_parsed, boundary, limit - len(logs))
+                logs = logs + archived
 # this function are to present the log etneries in proper order of day-month-year:
         start_date=safe_format_datetime_for_log(start_date)
         end_date=safe_format_datetime_for_log(end_date)
         
         logging.info(" Outcome Activated -> User has queried the log entries") 
-        log_action(f""" User has queried the log entries with 
-                        <br><br> Start_date:[{start_date}],
-                        <br><br> End_date:[{end_date}]. 
-                        <br><br> if no dates mentioned all logs would be retrived.""")
-# Return the logs to the front in JSON format:
-        return jsonify([{
-            'id': log.id,
-            'action': log.action,
-            'timestamp': safe_format_datetime(log.timestamp.isoformat()) } for log in logs])
+# The tail mode is polled by the log page, logging every poll would fill the log with its own entries:
+        if not after_key:
+            log_action('log_search', start_date=start_date, end_date=end_date)
+# Return the logs to the front in JSON format, with the paging cursors in the headers:
+        row_serializer = log_event_row if request.args.get('render', '').lower() == 'false' else log_entry_row
+        response = jsonify(row_serializer.many(logs))
+        if has_more and not after_key:
+            response.headers['X-Next-Cursor'] = encode_cursor(logs[-1].timestamp, logs[-1].id)
+        if logs:
+# The tail continues after the highest id of the page (not its newest timestamp, see the tail mode above):
+            newest = max(logs, key=lambda log: log.id)
+            response.headers['X-Tail-Cursor'] = encode_cursor(newest.timestamp, newest.id)
+        elif after_key:
+            response.headers['X-Tail-Cursor'] = after
+        return response
 # catching unexpected error for gracious error handle:
     except Exception as e:
         logging.info(f" Outcome Activated -> Error searching logs: {str(e)}") 
-        log_action(f"Error searching logs: {str(e)}")
+        log_action('log_search_error', error=str(e))
         return jsonify({"error": f"unknown error occurred: {str(e)} "}), 500
 
+@app.route('/log_entries/templates', methods=['GET'])
+def get_log_templates():
+# The event templates, for a client that renders the log entries itself (str.format style, a missing parameter shows as '?'):
+    return jsonify(EVENTS), 200
+
 @app.route('/stats', methods=['GET'])
 def get_stats():
     try:
-# Start querying the information to handle the statistics cards and put into Variables to get current time and late loans data:
+# Get the counters from the stats cache (one aggregate query per table when it has to be refreshed):
         current_date = datetime.now() 
-        total_books = Book.query.count()
-        total_activated_customers = Customer.query.filter_by(is_deactivated=False).count()
-        total_deactivated_customers = Customer.query.filter_by(is_deactivated=True).count()
-        total_loans = Loan.query.count()
-        books_out_of_stock = Book.query.filter_by(is_out_of_stock =True).count()
-        books_on_stock = Book.query.filter_by(is_out_of_stock =False).count()
-        total_loans_late = Loan.query.filter(Loan.return_due_date < current_date).count()
-        total_book_quantity = db.session.query(func.sum(Book.book_quantity)).scalar()
+        stats = stats_cache.get()
+# Late loans depend on the current time so they are counted on every call, from the due date index:
+        stats["total_loans_late_on_returns"] = Loan.query.filter(Loan.return_due_date < current_date).count() if overdue_tracker.has_overdue_loans(current_date) else 0
 
 # Log the action and Return the data to the front:
         logging.info(" Outcome Activated -> Success: Store statistics shown") 
-        log_action("User has asked for the Stores statistics")
-        return jsonify({"success":
-            {
-            "total_different_books": total_books,
-            "total_loans_and_total_books_loaned": total_loans,
-            "total_activated_customers" : total_activated_customers,
-            "total_deactivated_customers" : total_deactivated_customers,
-            "books_out_of_stock": books_out_of_stock,
-            "books_on_stock": books_on_stock,
-            "total_loans_late_on_returns": total_loans_late,
-            "total_book_pieces_in_the_store":  total_book_quantity }}), 200
+        log_action('stats_shown')
+        return jsonify({"success": stats }), 200
 # catching unexpected error for gracious error handle:
     except Exception as e:
         logging.info(f" Outcome Activated -> Error getting stats: {str(e)}") 
-        log_action(f"Error getting stats: {str(e)}")
+        log_action('stats_error', error=str(e))
         return jsonify({"error": str(e)}), 500
 
-def safe_format_datetime(date_value): # A METHOD TO HANDLE TIME ISSUES
+@app.route('/stats/history', methods=['GET'])
+def get_stats_history():
+    try:
+# Read the range and the granularity (the last 30 days by day when nothing is given):
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in HISTORY_GRANULARITIES:
+            logging.info(" Outcome Activated -> Error: invalid stats history granularity ")
+            return jsonify({"error": f"Invalid granularity: {granularity}, use day, week or month"}), 400
+        try:
+            last_day = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else date.today()
+            first_day = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else last_day - timedelta(days=29)
+        except ValueError:
+            logging.info(" Outcome Activated -> Error: invalid stats history dates ")
+            return jsonify({"error": "Invalid date format, use YYYY-MM-DD"}), 400
+        if first_day > last_day or (last_day - first_day).days >= app.config['STATS_HISTORY_MAX_DAYS']:
+            logging.info(" Outcome Activated -> Error: invalid stats history range ")
+            return jsonify({"error": f"Invalid range, 'from' must be before 'to' and at most {app.config['STATS_HISTORY_MAX_DAYS']} days apart"}), 400
+# The buckets are summed from the daily rollup rows (at most one row per day and category), not from the loans history:
+        buckets = daily_stats_history(first_day, last_day, granularity)
+
+        logging.info(" Outcome Activated -> Success: Store statistics history shown")
+        log_action('stats_history_shown', first_day=first_day.isoformat(), last_day=last_day.isoformat(), granularity=granularity)
+        return jsonify({"success": {"from": first_day.isoformat(),
+                                    "to": last_day.isoformat(),
+                                    "granularity": granularity,
+                                    "buckets": buckets}}), 200
+# catching unexpected error for gracious error handle:
+    except Exception as e:
+        logging.info(f" Outcome Activated -> Error getting stats history: {str(e)}")
+        log_action('stats_history_error', error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+# Prometheus scrape endpoint - counters of all the workers, not logged in the audit log (its called every few seconds):
+    try:
+        return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+    except Exception as e:
+        logging.info(f" Outcome Activated -> Error collecting metrics: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/healthz', methods=['GET'])
+def health_check():
+# Liveness - the worker answers, nothing else is checked (and nothing is logged, its called every few seconds):
+    return jsonify({"status": "ok"}), 200
 
+@app.route('/readyz', methods=['GET'])
+def readiness_check():
+# Readiness - the worker finished its warm up and the database answers, until then the load balancer sends the requests to the other workers:
+    if not getattr(app, 'worker_ready', False):
+        return jsonify({"status": "starting"}), 503
+    try:
+        db.session.execute(text("SELECT 1"))
+        return jsonify({"status": "ready"}), 200
+    except Exception as e:
+        logging.info(f" Outcome Activated -> Readiness check failed: {str(e)}")
+        return jsonify({"status": "database unavailable", "error": str(e)}), 503
+
+def safe_format_datetime(date_value): # A METHOD TO HANDLE TIME ISSUES
 # Attempt to convert from string to datetime:
     if isinstance(date_value, str):
         try:
             date_value = datetime.fromisoformat(date_value)  # If it's an ISO format string
         except ValueError:
             return date_value  # If conversion fails, return original string
-    
-# adjust the date to correct time zone
-    israel_tz = pytz.timezone('Asia/Jerusalem')
-    
+# Convert to Israel's timezone (handles DST automatically) and format it, see serializers.py:
     if isinstance(date_value, datetime):
-        # Convert the datetime to Israel's timezone (handles DST automatically)
-        date_value = date_value.astimezone(israel_tz)
-        # Format the datetime in the desired format
-        return date_value.strftime('%d/%m/%Y, %H:%M.%S')
+        return format_datetime(date_value)
     return date_value  # Return original if it's not a string or datetime
 
 def safe_format_datetime_for_log(date_value): # A METHOD TO HANDLE TIME ISSUES FOR THE LOG
@@ -1116,17 +2917,203 @@ def safe_format_datetime_for_log(date_value): # A METHOD TO HANDLE TIME ISSUES F
             date_value = datetime.fromisoformat(date_value)  # If it's an ISO format string
         except ValueError:
             return date_value  # If conversion fails, return original string
-
-# adjust the date to correct time zone
-    israel_tz = pytz.timezone('Asia/Jerusalem')
-
+# Convert to Israel's timezone and format only the date:
     if isinstance(date_value, datetime):
-       # Convert the datetime to Israel's timezone (handles DST automatically)
-        date_value = date_value.astimezone(israel_tz)
-        # Format the datetime in the desired format
-        return date_value.strftime('%d/%m/%Y')
+        return format_date(date_value)
     return date_value  # Return original if it's not a string or datetime
 
+def encode_cursor(timestamp, row_id): # A METHOD TO BUILD A PAGING CURSOR FROM THE LAST ROW OF A PAGE
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor): # A METHOD TO READ A PAGING CURSOR BACK, RAISES ValueError IF ITS BROKEN
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"invalid cursor '{cursor}'") from e
+
+def parse_page_limit(value, default, maximum): # A METHOD TO CHECK THE 'limit' PARAMETER OF THE PAGED LISTS
+    if value is None or value == '':
+        return default
+    limit = int(value)
+    if limit < 1 or limit > maximum:
+        raise ValueError(f"limit must be between 1 and {maximum}")
+    return limit
+
+def read_search_page(query): # A METHOD TO READ THE 'limit', 'cursor' AND 'count' PARAMETERS OF THE SEARCH ROUTES, RAISES ValueError IF ONE IS BROKEN
+    limit = parse_page_limit(request.args.get('limit'), app.config['SEARCH_PAGE_SIZE'], app.config['SEARCH_MAX_PAGE_SIZE'])
+    cursor = request.args.get('cursor')
+    return {"limit": limit,
+            "after": query.decode_cursor(cursor) if cursor else None,
+            "count": request.args.get('count', '').lower() == 'true'}
+
+def paged_json(items, next_cursor, total): # A METHOD TO ANSWER ONE PAGE OF A SEARCH - THE SAME LIST AS BEFORE, THE NEXT PAGE CURSOR AND THE TOTAL COUNT IN THE HEADERS
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    if total is not None:
+        response.headers['X-Total-Count'] = str(total)
+    return response
+
+
+# -------- DATABASE MAINTENANCE COMMANDS (flask --app app <command>) ================================
+# ==================================================================================================
+
+def upgrade_database(): # A METHOD TO BRING AN EXISTING library.db UP TO THE CURRENT SCHEMA WITHOUT LOSING DATA
+# create_all only adds missing tables, indexes of tables that already exist have to be created one by one:
+    prepare_database()
+    created = []
+    for table_obj in db.metadata.sorted_tables:
+        for index in table_obj.indexes:
+            exists = db.session.execute(text("SELECT 1 FROM sqlite_master WHERE type='index' AND name=:name"), {"name": index.name}).first()
+            if not exists:
+                index.create(bind=db.engine)
+                created.append(index.name)
+    return created
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Add the missing tables and indexes to an existing database."""
+    created = upgrade_database()
+    click.echo(f"Created indexes: {', '.join(created)}" if created else "Database is up to date")
+
+@app.cli.command('rebuild-customer-stats')
+def rebuild_customer_stats_command():
+    """Build the customer stats read model again from the loans history."""
+    customers = rebuild_customer_stats()
+    click.echo(f"Rebuilt the stats of {customers} customers")
+
+@app.cli.command('rebuild-daily-stats')
+def rebuild_daily_stats_command():
+    """Backfill the daily loans and returns rollup (/stats/history) from the loans history."""
+    rows = rebuild_daily_stats()
+    click.echo(f"Rebuilt {rows} daily stats rows")
+
+@app.cli.command('archive-logs')
+@click.option('--older-than-days', type=int, help="default: LOG_RETENTION_DAYS")
+def archive_logs_command(older_than_days):
+    """Move old log entries into the monthly gzipped archive files."""
+    audit_log_writer.flush()
+    moved = log_archive.archive(older_than_days)
+    click.echo(f"Archived {moved} log entries to {log_archive.directory}")
+
+def import_command(kind, path, file_format, report_path):
+    file_format = file_format or ('ndjson' if path.lower().endswith(('.ndjson', '.jsonl')) else 'csv')
+    with open(path, 'rb') as stream:
+        report = run_import(kind, stream, file_format)
+    click.echo(f"Imported {report['imported']} {kind}, {report['failed']} rows failed")
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        click.echo(f"Row errors written to {report_path}")
+    else:
+        for error in report['errors']:
+            click.echo(f"  row {error['row']}: {error['error']}")
+
+@app.cli.command('import-books')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']), help="default: from the file extension")
+@click.option('--report', 'report_path', help="write the row errors to this JSON file")
+def import_books_command(path, file_format, report_path):
+    """Import books from a CSV or NDJSON file."""
+    prepare_database()
+    import_command('books', path, file_format, report_path)
+
+@app.cli.command('import-customers')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']), help="default: from the file extension")
+@click.option('--report', 'report_path', help="write the row errors to this JSON file")
+def import_customers_command(path, file_format, report_path):
+    """Import customers from a CSV or NDJSON file."""
+    prepare_database()
+    import_command('customers', path, file_format, report_path)
+
+def query_plan_checks(): # THE INDEXED LOOKUPS THE ROUTES MAKE, CHECKED BY THE 'check-query-plans' COMMAND
+    now = datetime.now()
+    return {
+        "add_customer: customer by phone number": Customer.query.filter_by(phone_number='054-0000000').statement,
+        "add_book: book by lower(name)": Book.query.filter(func.lower(Book.name) == func.lower('dune')).statement,
+        "loan_book: existing loan by customer and book": Loan.query.filter_by(cust_id=1, book_id=1).statement,
+        "return_book: newest loan by customer and book": Loan.query.filter_by(cust_id=1, book_id=1).order_by(Loan.loan_date.desc()).statement,
+        "overdue check: earliest due date": db.select(func.min(Loan.return_due_date)),
+        "customer summary: stats by customer": CustomerStats.query.filter(CustomerStats.cust_id == 1).statement,
+        "stats history: days of the range": DailyLoanStats.query.filter(DailyLoanStats.day >= now.date() - timedelta(days=29), DailyLoanStats.day <= now.date()).statement,
+        "log_entries: newest page": LogEntry.query.order_by(LogEntry.timestamp.desc(), LogEntry.id.desc()).limit(200).statement,
+        "log_entries: page before cursor": LogEntry.query.filter(tuple_(LogEntry.timestamp, LogEntry.id) < (now, 1)).order_by(LogEntry.timestamp.desc(), LogEntry.id.desc()).limit(200).statement,
+        "log_entries: tail after cursor": LogEntry.query.filter(LogEntry.id > 1).order_by(LogEntry.id.asc()).limit(200).statement,
+        "log_entries: date range": LogEntry.query.filter(LogEntry.timestamp >= now - timedelta(days=7), LogEntry.timestamp < now).order_by(LogEntry.timestamp.desc(), LogEntry.id.desc()).limit(200).statement }
+
+# The filters every search route can add, in the order it adds them (see search_queries.py) - one list of choices per filter, [] = not given.
+# A full text term shorter than the index can answer stays a LIKE:
+SEARCH_ROUTE_FILTERS = {
+    '/search_customers': (customer_searches, [[[], [('id', 'eq')]], [[], [('name', 'like')]], [[], [('phone_number', 'like')]], [[], [('is_deactivated', 'eq')]]], True),
+    '/search_books': (book_searches, [[[], [('name', 'like')]], [[], [('author', 'like')]], [[], [('category', 'eq')]], [[], [('is_out_of_stock', 'eq')]]], True),
+    '/search_loans': (loan_searches, [[[], [('cust_id', 'eq')]], [[], [('book_id', 'eq')]],
+                                      [[], [('loan_date', 'ge'), ('loan_date', 'lt')], [('loan_date', 'ge')], [('loan_date', 'lt')]]], False),
+    '/search_late_loans': (late_loan_searches, [[[('return_due_date', 'lt')]]], False),
+    '/Returned_Books_list': (returned_book_searches, [[[], [('cust_name', 'like')]], [[], [('cust_id', 'eq')]]], False) }
+# Filters no index can narrow down - a page with only these walks the table in its sort order and stops at the LIMIT:
+WALK_FILTERS = {('is_deactivated', 'eq'), ('is_out_of_stock', 'eq'), ('name', 'like'), ('phone_number', 'like'), ('author', 'like'), ('cust_name', 'like')}
+
+def search_filter_combinations(): # EVERY (route, searches, filters, full text match) THE SEARCH ROUTES CAN BUILD
+    for route, (searches, choices, can_match) in SEARCH_ROUTE_FILTERS.items():
+        for picked in itertools.product(*choices):
+            filters = [item for choice in picked for item in choice]
+            for match in ((False, True) if can_match else (False,)):
+                yield route, searches, filters, match
+
+def search_plan_checks(): # THE REAL PAGED, CURSOR AND COUNT STATEMENTS OF EVERY SEARCH COMBINATION - name -> (statement, must use an index, must keep the page order)
+    checks = {}
+    for route, searches, filters, match in search_filter_combinations():
+        indexed = match or any(item not in WALK_FILTERS for item in filters)
+        name = f"{route} {', '.join(f'{column} {op}' for column, op in filters) or 'no filters'}{' + full text' if match else ''}"
+# A full text match is ordered by its rank, that sort cant come from an index:
+        checks[f"{name}: first page"] = (searches.statement(filters, match, limit=True), indexed, not match)
+        checks[f"{name}: page after cursor"] = (searches.statement(filters, match, after=True, limit=True), indexed, not match)
+        checks[f"{name}: total count"] = (searches.count_statement(filters, match), indexed, False)
+    return checks
+
+def query_plan_problems(): # RUNS ALL THE PLAN CHECKS, YIELDS (name, plan lines, problem or None)
+    checks = {name: (statement, True, False) for name, statement in query_plan_checks().items()}
+    checks.update(search_plan_checks())
+    for name, (statement, indexed, ordered) in checks.items():
+        plan = explain_query_plan(statement)
+        problem = None
+        if indexed and any(is_full_scan(line) for line in plan):
+            problem = 'FULL SCAN'
+        elif ordered and any(line.startswith('USE TEMP B-TREE FOR') and 'ORDER BY' in line for line in plan):
+            problem = 'SORTED'
+        yield name, plan, problem
+
+def explain_query_plan(statement): # A METHOD TO RUN 'EXPLAIN QUERY PLAN' ON A STATEMENT AND RETURN THE PLAN LINES
+# Compiled with named parameters (and the IN lists written out), so the SQL can run again as a text() with the same typed parameters:
+    compiled = statement.compile(dialect=type(db.engine.dialect)(paramstyle='named'), compile_kwargs={"render_postcompile": True})
+# The parameters without a value (the cached search statements) are planned with NULL, SQLite plans before it sees the values:
+    params = compiled.construct_params({name: None for bind, name in compiled.bind_names.items() if bind.required})
+    explain = text("EXPLAIN QUERY PLAN " + str(compiled)).bindparams(*[bindparam(name, type_=bind.type) for bind, name in compiled.bind_names.items()])
+    with db.engine.connect() as connection:
+        return [row.detail for row in connection.execute(explain, params)]
+
+def is_full_scan(plan_line):
+# A plain 'SCAN table' reads every row. 'SCAN table USING INDEX' walks the index in order (the paged queries stop at their LIMIT),
+# a full text 'VIRTUAL TABLE' scan is an index lookup, and scans of a subquery or 'CONSTANT ROW' (the outer row of an EXISTS) arent tables:
+    words = plan_line.split()
+    return words[0] == 'SCAN' and words[1] in db.metadata.tables and ' USING ' not in plan_line and 'VIRTUAL TABLE' not in plan_line
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if any of the indexed route queries falls back to a full table scan, or a search page sorts its rows instead of reading them in order."""
+# Same schema setup the app does on its first request (run 'upgrade-db' first for an old database):
+    prepare_database()
+    failed = []
+    for name, plan, problem in query_plan_problems():
+        click.echo(f"{problem or 'ok':>9}  {name}: {' | '.join(plan)}")
+        if problem:
+            failed.append(name)
+    if failed:
+        raise click.ClickException(f"{len(failed)} queries fall back to a full scan or a sort: {', '.join(failed)}")
+
 
 # -------- UNIVERSAL ERROR HANDLERS (FOR UNEXPECTED CASES) =========================================
 # ==================================================================================================
@@ -1147,12 +3134,62 @@ def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
 
+# -------- SERVER START (wsgi.py, gunicorn.conf.py and python app.py) ===============================
+# ==================================================================================================
+
+# GET pages every new worker opens once before it takes requests - their statements get compiled and the answers cache filled:
+WARM_UP_PATHS = ('/search_books', '/search_customers', '/search_loans', '/Returned_Books_list', '/search_late_loans', '/stats')
+
+def start_server(): # PREPARES THE DATABASE ONCE WHEN THE SERVER STARTS (IN THE GUNICORN MASTER WITH preload_app) - THE REQUESTS DONT CHECK IT ANYMORE
+    with app.app_context():
+        prepare_database()
+# The workers are forked from this process, they should not get its connections:
+        db.engine.dispose()
+    read_engine.dispose()
+    app.tables_created = True
+    if create_tables_once in app.before_request_funcs.get(None, []):
+        app.before_request_funcs[None].remove(create_tables_once)
+
+def reopen_connections_after_fork(): # CALLED IN A NEW WORKER (gunicorn post_fork) - THE POOLS START EMPTY, THE PARENT CONNECTIONS ARE LEFT ALONE
+    with app.app_context():
+        db.engine.dispose(close=False)
+    read_engine.dispose(close=False)
+    app.worker_ready = False
+
+def warm_up_worker(): # RUN IN EVERY NEW WORKER BEFORE IT TAKES REQUESTS - OPENS THE CONNECTIONS, FILLS THE CACHES AND COMPILES THE HOT STATEMENTS
+    started = time.perf_counter()
+    with app.app_context():
+# One connection of each engine, with the PRAGMAs applied:
+        with db.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        if db.engine.url.database not in (None, '', ':memory:'):
+            with read_engine.get().connect() as connection:
+                connection.execute(text("SELECT 1"))
+        overdue_tracker.reload()
+        stats_cache.get()
+# The loan and return lookups with ids that dont exist - compiled, nothing is changed:
+        loan_eligibility(0, 0)
+        open_loan_lookup(0, 0)
+        db.session.rollback()
+    for path in WARM_UP_PATHS:
+        with app.test_request_context(path):
+# The warm up isnt an action of a user - log_action doesnt write its audit log rows (the response cache still keeps them for the real requests):
+            g.suppress_audit = True
+            try:
+                app.dispatch_request()
+            except Exception as e:
+                logging.info(f" Outcome Activated -> Warm up of {path} failed: {str(e)}")
+            finally:
+                db.session.remove()
+    app.worker_ready = True
+    logging.info(f" Outcome Activated -> Worker {os.getpid()} warmed up in {time.perf_counter() - started:.3f}s")
+
 # ---------------------- START MAIN ==============================
 # ================================================================
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
+    start_server()
+    warm_up_worker()
     app.run(debug=True)
 
 
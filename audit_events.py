@@ -0,0 +1,183 @@
+"""
+Audit log events of the Library application server -
+a log row is stored as an event code + its parameters (ids, names, counts) and the HTML of the log card
+is made from the event template only when the row is read
+"""
+import json
+import re
+import string
+
+
+# Rows that couldnt be matched to an event when the old HTML log rows were migrated keep their text in this event:
+TEXT_EVENT = 'text'
+
+EVENTS = {
+    TEXT_EVENT: '{text}',
+# Main page:
+    'home_late_loans': 'User started the application and <mark><u>late loans</u></mark> were found.',
+    'home_error': 'Error opening home page: {error}',
+# Customers:
+    'customer_exists': '<b>User</b> tried to add <br> a new Customer <br> with a phone number that already exists in Database<b>:</b> <br><br> <b>[ {phone_number} ]</b> <br><br> which belongs to user with <b>ID:({customer_id})</b>',
+    'customer_added': '<mark>Added</mark> new customer: <br> <b>[</b> {customer_name} <b>],</b> <br> ID: {customer_id}',
+    'customer_add_error': 'Error adding customer: {error}',
+    'customer_search_not_found': 'User searched for Customers. <br><br> No customers found matching the search criteria <b>--->></b> <br><br> <b> ID</b>: [ {cust_id} ] <br> <b> Name</b>: [{name}] <br> <b> Phone Number</b>: [{phone_number}] <br> <b> Deactivation Status</b>: [{is_deactivated}]',
+    'customer_search': 'User searched Customers with filters<b>:</b> <br><br> <b> ID</b>: [ {cust_id} ] <br> <b> Name</b>: [{name}] <br> <b> Phone Number</b>: [{phone_number}] <br> <b> Deactivation Status</b>: [{is_deactivated}] <br><br> <span style="font-size: 18px;">I</span>f all <b>\'?\'</b> then User would get full unfiltered list.',
+    'customer_search_error': 'Error searching customer: {error}',
+    'customer_deactivate_already': '<span style="font-size: 18px;">U</span>ser tried to Deactivate Customer: <b>[</b>{customer_name}<b>]</b> - <br> <span style="font-size: 18px;">I</span>D Number: <b>(</b> {customer_id} <b>)</b> <br>--------------------- <br> <span style="font-size: 18px;">B</span>ut they are Already Deactivated',
+    'customer_deactivated': '<span style="font-size: 18px;">U</span>ser <mark>Deactivated</mark> Customer named: <b>[</b>{customer_name}<b>]</b> - <br><br> <span style="font-size: 18px;">C</span>ustomer <span style="font-size: 18px;">I</span>D Number: {customer_id}',
+    'customer_deactivate_not_found': '<span style="font-size: 18px;">U</span>ser searched for Customer on ID <span style="font-size: 18px;">N</span>umber:<b>(</b>{customer_id}<b>)</b>, <br> for Deactivation process. <br><br> <span style="font-size: 18px;">C</span>ustomer with that ID Number wasn\'t found.',
+    'customer_deactivate_value_error': 'ValueError occurred: {error} during deactivating customer with ID: {customer_id}',
+    'customer_deactivate_error': 'Error removing customer: {error}',
+    'customer_activate_not_found': '<span style="font-size: 18px;">U</span>ser tried to Activate a Customer with ID: {customer_id}. <br><br> <span style="font-size: 18px;">N</span>o such Customer found.',
+    'customer_activated': '<span style="font-size: 18px;">U</span>ser <mark>Activated</mark> Customer: <br><br> <b>[</b>{customer_name}<b>]</b>, <br> <span style="font-size: 18px;">I</span>D: <b>(</b> {customer_id} <b>)</b>',
+    'customer_activate_already': '<span style="font-size: 18px;">U</span>ser tried to Activate Customer: <br><br> <b>[</b>{customer_name}<b>]</b>, <br> ID: {customer_id}. <br><br> <span style="font-size: 18px;">T</span>hat Customer is Already Activated',
+    'customer_activate_value_error': 'ValueError occurred: {error} during activating customer with ID: {customer_id}',
+    'customer_activate_error': 'Error activating customer: {error}',
+    'customer_summary': '<span style="font-size: 18px;">U</span>ser looked at the activity summary of Customer: <br><br> <b>[</b>{customer_name}<b>]</b>, <br> ID: {customer_id}',
+    'customer_summary_not_found': '<span style="font-size: 18px;">U</span>ser asked for the activity summary of Customer ID: {customer_id}. <br><br> <span style="font-size: 18px;">N</span>o such Customer found.',
+    'customer_summary_error': 'Error getting customer summary: {error}',
+# Books:
+    'book_add_missing_fields': 'User tries to add a book to DataBase- Error Missing required fields: {missing_fields}',
+    'book_exists': '<span style="font-size: 18px;">U</span>ser tried to add a book that <span style="font-size: 17px;">a</span>lready exists: \' {book_name} \', ID:{book_id}',
+    'book_added': '<mark><span style="font-size: 18px;">A</span>dded</mark> new book: <br> <b>[</b> {book_name}<b> ]</b> <br><br> <span style="font-size: 18px;">B</span>ook ID: {book_id}',
+    'book_add_error': 'Error adding book: {error}',
+    'book_quantity_not_found': '<span style="font-size: 18px;">U</span>ser tried to enter <mark>Book quantity</mark> change for Book ID:<b>(</b>{book_id}<b>)</b> <br><br> <span style="font-size: 18px;">B</span>ook was not found.',
+    'book_quantity_negative': 'User tried to enter invalid number: ( {new_quantity} ). if tried too much in short time it might indicate a problematic employee',
+    'book_quantity_out_of_stock': '<span style="font-size: 18px;">U</span>ser updated Book <b>[</b>{book_name}<b>]</b> and <mark>marked as out of stock</mark> due to quantity updated to <span style="font-size: 18px;">0</span>. <br><br> Quantity updated from amount of: {previous_quantity} To {new_quantity}.',
+    'book_quantity_back_in_stock': 'User updated Book: <br> <b>[</b>{book_name}<b>]</b> <br><br> ID:<b>(</b>{book_id}<b>)</b> <br><br> To be back in stock after update in quantity. <br><br> <mark> book wont be active to loan untill user activate it manualy</mark> <br><br> quantity updated from amount of: {previous_quantity} To {new_quantity}.',
+    'book_quantity_updated': '<span style="font-size: 18px;">U</span>ser updated Book: <b>[</b>{book_name}<b>]</b> <br><br> ID:({book_id}) <br><br> <mark>Quantity updated</mark> from amount of: {previous_quantity} To {new_quantity}.',
+    'book_quantity_error': 'Error updating quantity: {error}',
+    'book_deactivate_already': '<span style="font-size: 18px;">U</span>ser <mark>tried</mark> to mark out of stock the book<b>:</b> <br><br> <b>[</b>{book_name}<b>]</b> <br> ID Number: <b>(</b>{book_id}<b>)</b> <br><br> <span style="font-size: 18px;">B</span>ut its already out',
+    'book_deactivated': '<span style="font-size: 18px;">U</span>ser Marked book: <br> [ {book_name} ] <br> ID Number: {book_id} --> <mark>out of stock</mark>',
+    'book_deactivate_not_found': '<span style="font-size: 18px;">U</span>ser <mark>tried</mark> to Mark out of stock book with ID:( {book_id} ) --> But no book with that ID was found',
+    'book_deactivate_error': 'Error removing book: {error}',
+    'book_activate_not_found': '<span style="font-size: 18px;">U</span>ser tried to <mark>Activate</mark> a Book with ID: ( {book_id} ) , no Book with this ID was found.',
+    'book_activate_no_stock': '<span style="font-size: 18px;">U</span>ser tried to <mark>activate</mark> Book: <br> <b>[</b>{book_name}, ID: {book_id}<b>]</b> <br><br> <span style="font-size: 18px;">I</span>t cant be activated Because no books of it are in stock.',
+    'book_activated': '<span style="font-size: 18px;">U</span>ser <mark>Activated</mark> Book: <br> <b>[</b> {book_name} <b>]</b> <br> ID: {book_id}',
+    'book_activate_already': '<span style="font-size: 18px;">U</span>ser tried to <mark>Activate</mark> book: <br> [ {book_name} ] <br> ID: ( {book_id} ), <br><br> <span style="font-size: 20px;">T</span>hat Book is already Active in stock',
+    'book_activate_error': 'Error activating book: {error}',
+    'book_search': '<span style="font-size: 18px;">E</span>mployee searched for books with filters: <br><br> Name: {name} <br> Author: {author} <br> Category: {category} <br> Out of stock: {out_of_stock} <br><br> <span style="font-size: 18px;">I</span>f all fields are \'?\', <span style="font-size: 18px;">U</span>ser will get all the books in DataBase.',
+    'book_search_error': 'Error searching book: {error}',
+    'returned_search_not_found': '<span style="font-size: 18px;">N</span>o ReturnedBooks with <br> Customer ID: ( {cust_id} ) <br> OR/And <br> Customer Name: ( {name} )',
+    'returned_search': '<span style="font-size: 18px;">U</span>ser made search in Returned Books DataBase looking for: <br><br> <span style="font-size: 18px;">C</span>ustomer name: {name} <br> ID: {cust_id} <br><br> <span style="font-size: 18px;">I</span>f query returned with full list it means User didnt put paramters to search <b>(</b>would show as "?"<b>)</b>.',
+    'returned_search_error': 'Error Search returned books: {error}',
+# Loans and returns:
+    'loan_already_loaned': 'User tried to make a loan. <br><br> [ {book_name} ] is Already loaned to [{customer_name}, ID:{customer_id}] according to records',
+    'book_loaned': '<mark><span style="font-size: 18px;"><b>L</b></span>oaned</mark> book: <br> [ {book_name} ], <br> ID: ({book_id}) <br><br> <span style="font-size: 18px;">T</span>o Customer: <br> [ {customer_name} ], <br> ID: ( {customer_id} ) <br><br> <span style="font-size: 18px;">N</span>ew Loan ID: <b>(</b> {new_loan_id} <b>)</b> New book quantity: {book_quantity}',
+    'book_loaned_out_of_stock': '<mark><span style="font-size: 18px;"><b>L</b></span>oaned</mark> book: <br> [ {book_name} ], <br> ID: ({book_id}) <br><br> <span style="font-size: 18px;">T</span>o Customer: <br> [ {customer_name} ], <br> ID: ( {customer_id} ) <br><br> <span style="font-size: 18px;">N</span>ew Loan ID: <b>(</b> {new_loan_id} <b>)</b> <br><br> Book quantity is 0, <mark><b>book out of stock</b></mark>',
+    'loan_error': 'Error loaning book: {error}',
+    'return_missing_fields': 'User tried to Activate Book Return and didnt enter all necessary fields',
+    'return_not_found': 'User tried to Return Book and book or Customer were not found <br> ( CustomerID: {cust_id} <br> BookID: {book_id} )',
+    'return_no_loan': 'No Active loan found for <br> customer id:( {cust_id} ),<br> book id: ( {book_id} )',
+    'book_returned': '<span style="font-size: 18px;">R</span>eturned book <br>[ {book_name}, ID: {book_id} ] <br><br> From Customer (ID: {cust_id}, {customer_name}) <br><br> On loan (ID: {loan_id} ) at {returned_date} <br><br> Previous book quantity: {previous_book_quantity} <br><br> Updated book quantity: {updated_quantity}',
+    'book_returned_back_in_stock': '<span style="font-size: 18px;">R</span>eturned book <br>[ {book_name}, ID: {book_id} ] <br><br> From Customer (ID: {cust_id}, {customer_name}) <br><br> On loan (ID: {loan_id} ) at {returned_date} <br><br> Previous book quantity: {previous_book_quantity} <br><br> Updated book quantity: {updated_quantity} <br><br> <mark>Book quantity back in stock</mark>, unless activated in the system it wont be active for loan',
+    'book_returned_late': '<span style="font-size: 18px;">U</span>ser Returned book <br> [ {book_name}, ID: {book_id} ] <br><br> From Customer <br> (ID: {cust_id}, {customer_name}) <br><br> On loan (ID: {loan_id} ) <br><br> <mark>Was recived after(!!)</mark> due return date which was {return_due_date} <br><br> and was returned on <br> {returned_date} <br><br> Previous book quantity: {previous_book_quantity} <br><br> Updated book quantity: {updated_quantity}',
+    'book_returned_late_back_in_stock': '<span style="font-size: 18px;">U</span>ser Returned book <br> [ {book_name}, ID: {book_id} ] <br><br> From Customer <br> (ID: {cust_id}, {customer_name}) <br><br> On loan (ID: {loan_id} ) <br><br> <mark>Was recived after(!!)</mark> due return date which was {return_due_date} <br><br> and was returned on <br> {returned_date} <br><br> Previous book quantity: {previous_book_quantity} <br><br> Updated book quantity: {updated_quantity} <br><br> <mark>Book quantity back in stock</mark>, unless activated in the system it wont be active for loan',
+    'return_error': 'Error in return_book: {error}',
+    'batch_loan': '<mark><span style="font-size: 18px;"><b>B</b></span>atch loan</mark> of {items} books: <br><br> Loaned: {loaned}, Failed: {failed} <br><br> {loans}',
+    'batch_loan_error': 'Error in batch loan: {error}',
+    'batch_return': '<span style="font-size: 18px;">B</span>atch return of {items} books: <br><br> Returned: {returned}, <mark>Late: {late}</mark>, Failed: {failed} <br><br> Returned loan IDs: {loan_ids}',
+    'batch_return_error': 'Error in batch return: {error}',
+    'loan_search': "Employee searched loans using these search paramters -->> <br> ---------------------<br> <br> Customer ID: {cust_id} <br> Book ID: {book_id} <br><br> Loan start date range: <br>{start_date} <br><br> Loan end date range: {end_date} <br><br><br> If all paramters are '?' or not accurate the User would get full active Loan list",
+    'loan_search_error': 'Error searching loan: {error}',
+    'late_loans_not_found': '<span style="font-size: 18px;">U</span>ser searched for Late loans. <br> No late loans were found',
+    'late_loan_found': 'Employee searched for Late Loans and <mark>late loans were found</mark>: <br>-------------------- <br><br> Loan ID: {loan_id} <br><br> Customer ID: {cust_id} <br><br> Book ID: {book_id} <br><br> Loan Date: {loan_date} <br><br> Return due Date: {return_due_date}',
+    'late_loans_error': 'Error searching late loans: {error}',
+# Import, export and the rest:
+    'import_done': '<mark><span style="font-size: 18px;">I</span>mported</mark> {kind} from a {file_format} file: <br><br> Added: {imported} <br> Failed rows: {failed}',
+    'import_error': 'Error importing {kind}: {error}',
+    'export_done': '<span style="font-size: 18px;">U</span>ser exported <mark>{table}</mark> as {file_format} <br><br> Filters: {filters}',
+    'export_error': 'Error exporting {name}: {error}',
+    'database_reset': '<mark>USER has reseted Database</mark> with 5 new Customers and 5 sample books',
+    'database_reset_error': 'Error reseting database: {error}',
+    'log_search': 'User has queried the log entries with <br><br> Start_date:[{start_date}], <br><br> End_date:[{end_date}]. <br><br> if no dates mentioned all logs would be retrived.',
+    'log_search_error': 'Error searching logs: {error}',
+    'stats_shown': 'User has asked for the Stores statistics',
+    'stats_error': 'Error getting stats: {error}',
+    'stats_history_shown': 'User has asked for the loans history from {first_day} to {last_day}, by {granularity}',
+    'stats_history_error': 'Error getting stats history: {error}',
+}
+
+# Parameters stored as a list, rendered with (item template, separator):
+ITEM_FORMATS = {
+    ('batch_loan', 'loans'): ('Loan ID ({0}): [ {1} ] to [ {2} ]', '<br> ') }
+
+
+class EventFormatter(string.Formatter):
+    """
+    str.format for the event templates - a parameter that is missing (or empty) is shown as '?',
+    the same way the routes showed the search filters that were not used.
+    """
+    def __init__(self, event):
+        self.event = event
+
+    def get_value(self, key, args, kwargs):
+        value = kwargs.get(key)
+        if isinstance(value, list):
+            if not value:
+                return '-'
+            item_template, separator = ITEM_FORMATS.get((self.event, key), ('{0}', ', '))
+            return separator.join(item_template.format(*(item if isinstance(item, list) else [item])) for item in value)
+        if value is None or value == '':
+            return '?'
+        return value
+
+
+def compact_params(params):
+# The empty values are not stored, the template shows them as '?' anyway:
+    return {key: value for key, value in params.items() if value is not None and value != ''}
+
+
+def encode_params(params):
+    return json.dumps(compact_params(params), separators=(',', ':'), ensure_ascii=False)
+
+
+def decode_params(text):
+    return json.loads(text) if text else {}
+
+
+def render(event, params):
+# params can be the stored JSON text or the dict itself, unknown events (from a newer version) show their raw data:
+    if isinstance(params, str):
+        params = decode_params(params)
+    template = EVENTS.get(event)
+    if template is None:
+        return f"{event}: {json.dumps(params, ensure_ascii=False)}"
+    return EventFormatter(event).format(template, **params)
+
+
+# ------------ MIGRATION OF THE OLD HTML ROWS ====================
+_patterns = None
+
+def _event_patterns():
+# A regex for every template - its text with a named group for every parameter:
+    global _patterns
+    if _patterns is None:
+        _patterns = []
+        for event, template in EVENTS.items():
+            if event == TEXT_EVENT:
+                continue
+            pieces = re.split(r'\{(\w+)\}', template)
+            pattern = ''.join(re.escape(piece) if index % 2 == 0 else f'(?P<{piece}>.*?)' for index, piece in enumerate(pieces))
+            _patterns.append((event, re.compile(pattern, re.DOTALL)))
+    return _patterns
+
+
+def _param_value(text):
+    return int(text) if re.fullmatch(r'-?[1-9]\d*|0', text) else text
+
+
+def parse_action(action):
+    """
+    Turns the HTML text of an old log row back into (event, params).
+    Only a match that renders back to the same text (ignoring white space) is used, anything else becomes a TEXT_EVENT row.
+    """
+    text = ' '.join(action.split())
+    for event, pattern in _event_patterns():
+        match = pattern.fullmatch(text)
+        if not match:
+            continue
+        params = {key: _param_value(value) for key, value in match.groupdict().items() if value != '?'}
+        if ' '.join(render(event, params).split()) == text:
+            return event, params
+    return TEXT_EVENT, {"text": action}
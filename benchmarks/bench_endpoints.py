@@ -0,0 +1,423 @@
+"""
+Endpoint benchmarks for the Library application server.
+
+Seeds a throwaway SQLite database with synthetic books, customers, loans, returned books and log entries,
+calls every route of app.py (through the Flask test client, or a running server with --url)
+and writes p50/p95/p99 latency, throughput, SQL statement count and peak RSS per endpoint to a JSON file.
+
+    python benchmarks/bench_endpoints.py --scale small --output bench.json
+    python benchmarks/bench_endpoints.py --scale large --output after.json --baseline bench.json
+    python benchmarks/bench_endpoints.py --books 100000 --customers 1000000 --log-entries 5000000 --db /tmp/big.db
+
+The database is only seeded when the file doesnt exist yet, so one big seed can be reused between runs
+(use --reseed to build it again).
+"""
+import argparse
+from datetime import datetime, timedelta
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+
+SCALES = {
+    'small':  {'books': 10000,  'customers': 20000,   'loans': 5000,   'returns': 20000,   'log_entries': 100000},
+    'medium': {'books': 50000,  'customers': 200000,  'loans': 50000,  'returns': 200000,  'log_entries': 1000000},
+    'large':  {'books': 100000, 'customers': 1000000, 'loans': 200000, 'returns': 1000000, 'log_entries': 5000000} }
+
+FIRST_NAMES = ['Alice', 'Bob', 'Charlie', 'Diana', 'Edward', 'Noa', 'Yossi', 'Maya', 'David', 'Tamar', 'Omer', 'Shira']
+LAST_NAMES = ['Johnson', 'Smith', 'Brown', 'Ross', 'Norton', 'Cohen', 'Levi', 'Mizrahi', 'Peretz', 'Biton', 'Friedman']
+CITIES = ['New York', 'Los Angeles', 'Chicago', 'Tel Aviv', 'Haifa', 'Jerusalem', 'Eilat', 'Beer Sheva']
+TITLE_WORDS = ['Dune', 'Shadow', 'Garden', 'Night', 'River', 'Empire', 'Secret', 'Stone', 'Winter', 'Code', 'Star', 'Ghost',
+               'Ocean', 'Crown', 'Mirror', 'Silence', 'Fire', 'Storm', 'Journey', 'Machine']
+AUTHORS = ['Frank Herbert', 'Stephen King', 'Jane Austen', 'Dan Brown', 'J.R.R. Tolkien', 'Agatha Christie',
+           'Isaac Asimov', 'Ursula Le Guin', 'Neil Gaiman', 'Terry Pratchett', 'Amos Oz', 'David Grossman']
+CHUNK_SIZE = 20000
+
+
+def phone_number(index):
+    return f"05{index // 10**7 % 10}-{index % 10**7:07d}"
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    position = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[position]
+
+
+# ------------ SYNTHETIC DATA =====================================
+# ================================================================
+def insert_chunks(library, table, rows, total, label):
+    chunk = []
+    for count, row in enumerate(rows, start=1):
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            library.db.session.execute(table.insert(), chunk)
+            library.db.session.commit()
+            chunk = []
+            print(f"  {label}: {count}/{total}", end='\r', flush=True)
+    if chunk:
+        library.db.session.execute(table.insert(), chunk)
+        library.db.session.commit()
+    print(f"  {label}: {total}/{total}")
+
+
+def seed_database(library, sizes, rng):
+    now = datetime.now()
+    library.db.create_all()
+    book_types = list(library.BookType)
+# The name words and the type of every book and the names of every customer, as indexes into the word lists,
+# so the loans and returned books carry the real names without keeping millions of strings in memory:
+    book_words = bytearray(2 * sizes['books'])
+    book_type_indexes = bytearray(sizes['books'])
+    customer_words = bytearray(2 * sizes['customers'])
+
+    def book_name(book_id):
+        return f"{TITLE_WORDS[book_words[2 * book_id - 2]]} {TITLE_WORDS[book_words[2 * book_id - 1]]} {book_id}"
+
+    def customer_name(cust_id):
+        return f"{FIRST_NAMES[customer_words[2 * cust_id - 2]]} {LAST_NAMES[customer_words[2 * cust_id - 1]]} {cust_id}"
+
+    def books():
+        for i in range(1, sizes['books'] + 1):
+            quantity = rng.randint(0, 5)
+            book_words[2 * i - 2], book_words[2 * i - 1] = rng.randrange(len(TITLE_WORDS)), rng.randrange(len(TITLE_WORDS))
+            book_type_indexes[i - 1] = rng.randrange(len(book_types))
+            yield {'id': i,
+                   'name': book_name(i),
+                   'author': rng.choice(AUTHORS),
+                   'year_published': rng.randint(1800, 2024),
+                   'type': book_types[book_type_indexes[i - 1]],
+                   'category': rng.choice(list(library.BookCategory)),
+                   'book_quantity': quantity,
+                   'is_out_of_stock': quantity == 0}
+
+    def customers():
+        for i in range(1, sizes['customers'] + 1):
+            customer_words[2 * i - 2], customer_words[2 * i - 1] = rng.randrange(len(FIRST_NAMES)), rng.randrange(len(LAST_NAMES))
+            yield {'id': i,
+                   'name': customer_name(i),
+                   'city': rng.choice(CITIES),
+                   'age': rng.randint(12, 90),
+                   'phone_number': phone_number(i),
+                   'is_deactivated': rng.random() < 0.05}
+
+    def loans():
+# Every customer/book pair at most once, like the loan rules allow - about 10% of them are past due:
+        pairs = set()
+        while len(pairs) < sizes['loans']:
+            pairs.add((rng.randint(1, sizes['customers']), rng.randint(1, sizes['books'])))
+        for i, (cust_id, book_id) in enumerate(sorted(pairs), start=1):
+            loan_date = now - timedelta(days=rng.uniform(0, 12))
+            yield {'id': i,
+                   'cust_id': cust_id,
+                   'cust_name': customer_name(cust_id),
+                   'cust_phonenumber': phone_number(cust_id),
+                   'book_name': book_name(book_id),
+                   'book_id': book_id,
+                   'loan_date': loan_date,
+                   'return_due_date': loan_date + timedelta(days=library.LOAN_DAYS[book_types[book_type_indexes[book_id - 1]]])}
+
+    def returns():
+        for i in range(1, sizes['returns'] + 1):
+            cust_id = rng.randint(1, sizes['customers'])
+            loan_date = now - timedelta(days=rng.uniform(10, 730))
+            yield {'id': i,
+                   'book_name': book_name(rng.randint(1, sizes['books'])),
+                   'cust_name': customer_name(cust_id),
+                   'cust_id': cust_id,
+                   'loan_id': sizes['loans'] + i,
+                   'cust_phonenumber': phone_number(cust_id),
+                   'loan_date': loan_date,
+                   'returned_date': loan_date + timedelta(days=rng.uniform(1, 14))}
+
+    def log_entries():
+        start = now - timedelta(days=365)
+        step = timedelta(days=365) / max(sizes['log_entries'], 1)
+        for i in range(1, sizes['log_entries'] + 1):
+            yield {'id': i,
+                   'event': 'book_search',
+                   'params': json.dumps({'name': rng.choice(TITLE_WORDS)}),
+                   'timestamp': start + step * i}
+
+    insert_chunks(library, library.Book.__table__, books(), sizes['books'], 'books')
+    insert_chunks(library, library.Customer.__table__, customers(), sizes['customers'], 'customers')
+    insert_chunks(library, library.Loan.__table__, loans(), sizes['loans'], 'loans')
+    insert_chunks(library, library.ReturnedBooks.__table__, returns(), sizes['returns'], 'returned books')
+    insert_chunks(library, library.LogEntry.__table__, log_entries(), sizes['log_entries'], 'log entries')
+# Full text tables are filled once at the end instead of through the triggers row by row:
+    library.search_index.ensure(rebuild=True)
+    library.db.session.execute(text("ANALYZE"))
+    library.db.session.commit()
+
+
+# ------------ ENDPOINTS ==========================================
+# ================================================================
+class RunState:
+    """Ids the request makers pick from, and the loans made during the run so they can be returned."""
+    def __init__(self, sizes, rng):
+        self.sizes = sizes
+        self.rng = rng
+        self.loaned = []
+        self.batch_loaned = []
+        self.next_new = 0
+
+    def customer_id(self):
+        return self.rng.randint(1, self.sizes['customers'])
+
+    def book_id(self):
+        return self.rng.randint(1, self.sizes['books'])
+
+    def unique(self):
+        self.next_new += 1
+        return f"{os.getpid()}{int(time.time())}{self.next_new}"
+
+
+def loan_request(state):
+    pair = {'cust_id': state.customer_id(), 'book_id': state.book_id()}
+    state.loaned.append(pair)
+    return pair
+
+
+def import_body(state, kind):
+# A raw NDJSON body of 100 new rows (new names and phone numbers, so none of them is a duplicate):
+    rows = []
+    for _ in range(100):
+        unique = state.unique()
+        if kind == 'books':
+            rows.append({'name': f"Bench Import {unique}", 'author': state.rng.choice(AUTHORS), 'year_published': 2000, 'type': 1, 'category': 'Horror'})
+        else:
+            rows.append({'name': f"Bench Import {unique}", 'city': state.rng.choice(CITIES), 'age': 30, 'phone_number': unique[-11:]})
+    return ''.join(json.dumps(row) + '\n' for row in rows).encode()
+
+
+def days_ago(days):
+    return f"{(datetime.now() - timedelta(days=days)):%Y-%m-%d}"
+
+
+def batch_loan_request(state):
+    pairs = [{'cust_id': state.customer_id(), 'book_id': state.book_id()} for _ in range(20)]
+    state.batch_loaned.append(pairs)
+    return pairs
+
+
+# (name, method, path maker, body maker - JSON, or bytes for a raw NDJSON body) - run in this order, the returns use the loans made before them.
+# /reset_database is left out on purpose, it would erase the seeded data:
+ENDPOINTS = [
+    ('index', 'GET', lambda s: '/', None),
+    ('search_books by name', 'GET', lambda s: f"/search_books?name={s.rng.choice(TITLE_WORDS).lower()}", None),
+    ('search_books by author and category', 'GET', lambda s: "/search_books?author=king&category=HORROR", None),
+    ('search_customers by name', 'GET', lambda s: f"/search_customers?name={s.rng.choice(LAST_NAMES).lower()}", None),
+    ('search_customers by phone', 'GET', lambda s: f"/search_customers?phone_number={phone_number(s.customer_id())[:7]}", None),
+    ('search_customers by id', 'GET', lambda s: f"/search_customers?id={s.customer_id()}", None),
+    ('search_customers unfiltered', 'GET', lambda s: "/search_customers", None),
+    ('search_loans by customer', 'GET', lambda s: f"/search_loans?cust_id={s.customer_id()}", None),
+    ('search_loans by date range', 'GET', lambda s: f"/search_loans?start_date={(datetime.now() - timedelta(days=3)):%Y-%m-%d}&end_date={datetime.now():%Y-%m-%d}", None),
+    ('search_late_loans', 'GET', lambda s: "/search_late_loans", None),
+    ('Returned_Books_list by customer', 'GET', lambda s: f"/Returned_Books_list?id={s.customer_id()}", None),
+    ('Returned_Books_list unfiltered', 'GET', lambda s: "/Returned_Books_list", None),
+    ('log_entries', 'GET', lambda s: "/log_entries", None),
+    ('log_entries date range', 'GET', lambda s: f"/log_entries?start_date={(datetime.now() - timedelta(days=30)):%Y-%m-%d}&end_date={datetime.now():%Y-%m-%d}", None),
+    ('log_entries/templates', 'GET', lambda s: "/log_entries/templates", None),
+    ('stats', 'GET', lambda s: "/stats", None),
+    ('stats/history (30 days by day)', 'GET', lambda s: "/stats/history", None),
+    ('stats/history (year by month)', 'GET', lambda s: f"/stats/history?granularity=month&from={days_ago(364)}", None),
+    ('customer summary', 'GET', lambda s: f"/customer/{s.customer_id()}/summary", None),
+    ('metrics', 'GET', lambda s: "/metrics", None),
+# The exports are limited to recent dates, a full log export of the large scale would take minutes per call:
+    ('export loans (csv, 3 days)', 'GET', lambda s: f"/export/loans?start_date={days_ago(3)}", None),
+    ('export returned_books (ndjson gzip, 30 days)', 'GET', lambda s: f"/export/returned_books?format=ndjson&gzip=true&start_date={days_ago(30)}", None),
+    ('export log_entries (csv, 1 day)', 'GET', lambda s: f"/export/log_entries?start_date={days_ago(1)}", None),
+    ('import books (100 rows)', 'POST', lambda s: "/import/books?format=ndjson", lambda s: import_body(s, 'books')),
+    ('import customers (100 rows)', 'POST', lambda s: "/import/customers?format=ndjson", lambda s: import_body(s, 'customers')),
+    ('add_customer', 'POST', lambda s: "/add_customer",
+        lambda s: {'name': 'Bench Customer', 'city': 'Haifa', 'age': 30, 'phone_number': s.unique()[-11:]}),
+    ('add_book', 'POST', lambda s: "/add_book",
+        lambda s: {'name': f"Bench Book {s.unique()}", 'author': 'Bench', 'year_published': 2000, 'type': 1, 'category': 'Horror'}),
+    ('update_book_quantity', 'PUT', lambda s: "/update_book_quantity", lambda s: {'book_id': s.book_id(), 'quantity': s.rng.randint(1, 5)}),
+    ('remove_customer', 'PUT', lambda s: f"/remove_customer/{s.customer_id()}", None),
+    ('activate_customer', 'PUT', lambda s: f"/activate_customer/{s.customer_id()}", None),
+    ('deactivate_book', 'PUT', lambda s: f"/deactivate_book/{s.book_id()}", None),
+    ('activate_book', 'PUT', lambda s: f"/activate_book/{s.book_id()}", None),
+    ('loan_book', 'POST', lambda s: "/loan_book", loan_request),
+    ('return_book', 'POST', lambda s: "/return_book", lambda s: s.loaned.pop() if s.loaned else {'cust_id': 1, 'book_id': 1}),
+    ('loan_books (20 items)', 'POST', lambda s: "/loan_books", batch_loan_request),
+    ('return_books (20 items)', 'POST', lambda s: "/return_books", lambda s: s.batch_loaned.pop() if s.batch_loaned else [{'cust_id': 1, 'book_id': 1}]) ]
+
+
+# ------------ RUNNERS ============================================
+# ================================================================
+class TestClientRunner:
+    """Calls the routes in process and counts the SQL statements the request thread runs."""
+    def __init__(self, library):
+        self.client = library.app.test_client()
+        self.statements = 0
+        self._thread = threading.get_ident()
+        event.listen(Engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+# The audit log writer thread is not part of the request:
+        if threading.get_ident() == self._thread:
+            self.statements += 1
+
+    def call(self, method, path, body):
+        if isinstance(body, bytes):
+            response = self.client.open(path, method=method, data=body, content_type='application/x-ndjson')
+        else:
+            response = self.client.open(path, method=method, json=body)
+        response.get_data()
+        return response.status_code
+
+
+class HttpRunner:
+    """Calls a running server (for example gunicorn started with LIBRARY_DATABASE_URI on the seeded file)."""
+    statements = None
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def call(self, method, path, body):
+        if isinstance(body, bytes):
+            data, headers = body, {'Content-Type': 'application/x-ndjson'}
+        else:
+            data = json.dumps(body).encode() if body is not None else None
+            headers = {'Content-Type': 'application/json'} if data else {}
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=120) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+def peak_rss_kb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage // 1024 if sys.platform == 'darwin' else usage # bytes on macOS, KB on Linux
+
+
+def run_endpoint(runner, state, method, make_path, make_body, iterations, warmup):
+    for _ in range(warmup):
+        runner.call(method, make_path(state), make_body(state) if make_body else None)
+    latencies = []
+    statuses = {}
+    statements_before = runner.statements
+    started = time.perf_counter()
+    for _ in range(iterations):
+        path = make_path(state)
+        body = make_body(state) if make_body else None
+        call_started = time.perf_counter()
+        status = runner.call(method, path, body)
+        latencies.append((time.perf_counter() - call_started) * 1000)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'throughput_rps': round(iterations / elapsed, 2) if elapsed else None,
+        'sql_statements_per_request': round((runner.statements - statements_before) / iterations, 2) if runner.statements is not None else None,
+        'peak_rss_kb': peak_rss_kb(), # process high water mark after this endpoint
+        'status_codes': statuses }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    print(f"\n{'endpoint':40} {'p50 ms':>10} {'p95 ms':>10} {'base p95':>10} {'change':>8}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        change = ''
+        if base and base['p95_ms']:
+            change = f"{(result['p95_ms'] - base['p95_ms']) / base['p95_ms'] * 100:+.1f}%"
+        print(f"{name:40} {result['p50_ms']:>10} {result['p95_ms']:>10} {base['p95_ms'] if base else '-':>10} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    for size in SCALES['small']:
+        parser.add_argument(f"--{size.replace('_', '-')}", type=int, dest=size, help=f"override the {size} count of the scale")
+    parser.add_argument('--db', help="SQLite file to seed/use (default: a new temporary file)")
+    parser.add_argument('--reseed', action='store_true', help="delete and seed the --db file again")
+    parser.add_argument('--seed-only', action='store_true', help="only build the database")
+    parser.add_argument('--url', help="benchmark a running server instead of the Flask test client")
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', action='append', help="run only the endpoints whose name contains this text (repeatable)")
+    parser.add_argument('--seed', type=int, default=1234, help="random seed")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help="earlier --output file to compare the p95 latencies with")
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    for size in sizes:
+        if getattr(args, size) is not None:
+            sizes[size] = getattr(args, size)
+    db_path = os.path.abspath(args.db) if args.db else os.path.join(tempfile.mkdtemp(prefix='library-bench-'), 'library.db')
+    if args.reseed and os.path.exists(db_path):
+        os.remove(db_path)
+    needs_seed = not os.path.exists(db_path)
+
+# The app reads the database address when its imported:
+    os.environ['LIBRARY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as library
+
+    rng = random.Random(args.seed)
+    with library.app.app_context():
+        if needs_seed:
+            print(f"Seeding {db_path} with {sizes}")
+            seed_started = time.perf_counter()
+            seed_database(library, sizes, rng)
+            print(f"Seeded in {time.perf_counter() - seed_started:.1f}s")
+        else:
+            print(f"Using existing database {db_path}")
+    if args.seed_only:
+        return
+
+    runner = HttpRunner(args.url) if args.url else TestClientRunner(library)
+    state = RunState(sizes, rng)
+    results = {}
+    for name, method, make_path, make_body in ENDPOINTS:
+        if args.only and not any(part in name for part in args.only):
+            continue
+        results[name] = run_endpoint(runner, state, method, make_path, make_body, args.iterations, args.warmup)
+        r = results[name]
+        print(f"{name:40} p50 {r['p50_ms']:>9.2f}ms  p95 {r['p95_ms']:>9.2f}ms  p99 {r['p99_ms']:>9.2f}ms  "
+              f"{r['throughput_rps']:>8} req/s  sql {r['sql_statements_per_request']}  rss {r['peak_rss_kb']}KB  {r['status_codes']}")
+
+    output = {
+        'meta': {'created': datetime.now().isoformat(timespec='seconds'),
+                 'target': args.url or 'flask test client',
+                 'database': db_path,
+                 'sizes': sizes,
+                 'iterations': args.iterations,
+                 'python': platform.python_version(),
+                 'sqlite': sqlite3.sqlite_version },
+        'results': results }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Micro benchmark of the search filters - the ORM query chain the search routes used to build on every request
+against the cached statements of search_queries.py, for the same filters and values.
+
+Runs inside the app (no HTTP, no serialization) and both sides take the same steps:
+  build+run     - build the statement and run it through db.session.execute, like the routes do
+                  (SQLAlchemy looks the compiled SQL up in its cache, then SQLite runs it)
+  build+compile - build the statement and compile it to SQL, without its cache and without the database
+
+    python benchmarks/bench_search_queries.py
+    python benchmarks/bench_search_queries.py --db /tmp/big.db --iterations 2000
+
+The database is seeded like bench_endpoints.py does (at --scale small unless the --db file already exists).
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from bench_endpoints import LAST_NAMES, SCALES, percentile, seed_database
+
+
+# ------------ CASES ==============================================
+# ================================================================
+def orm_case(library, name):
+# The query chains of the routes before search_queries.py, one new Query per call:
+    Book, Customer, Loan, ReturnedBooks = library.Book, library.Customer, library.Loan, library.ReturnedBooks
+    def customer_by_id(cust_id, **_):
+        return Customer.query.filter(Customer.id == cust_id).filter(Customer.is_deactivated == False)
+    def books_in_stock(category, **_):
+        return Book.query.filter(Book.category == category).filter(Book.is_out_of_stock == False)
+    def loans_by_customer_and_date(cust_id, since, **_):
+        return Loan.query.filter(Loan.cust_id == cust_id).filter(Loan.loan_date >= since, Loan.loan_date < datetime.now())
+    def returned_by_name(last_name, cust_id, **_):
+        return ReturnedBooks.query.filter(ReturnedBooks.cust_name.ilike(f'%{last_name}%')).filter(ReturnedBooks.cust_id == cust_id)
+    return {'customer by id, active': customer_by_id,
+            'books by category, in stock': books_in_stock,
+            'loans by customer and date': loans_by_customer_and_date,
+            'returned books by name and customer': returned_by_name}[name]
+
+
+def cached_case(library, name):
+# The same filters through the cached statements the routes use now:
+    def customer_by_id(cust_id, **_):
+        return library.customer_searches.new().where('id', 'eq', cust_id).where('is_deactivated', 'eq', False)
+    def books_in_stock(category, **_):
+        return library.book_searches.new().where('category', 'eq', category).where('is_out_of_stock', 'eq', False)
+    def loans_by_customer_and_date(cust_id, since, **_):
+        return library.loan_searches.new().where('cust_id', 'eq', cust_id).where('loan_date', 'ge', since).where('loan_date', 'lt', datetime.now())
+    def returned_by_name(last_name, cust_id, **_):
+        return library.returned_book_searches.new().where('cust_name', 'like', f'%{last_name}%').where('cust_id', 'eq', cust_id)
+    return {'customer by id, active': customer_by_id,
+            'books by category, in stock': books_in_stock,
+            'loans by customer and date': loans_by_customer_and_date,
+            'returned books by name and customer': returned_by_name}[name]
+
+
+CASES = ['customer by id, active', 'books by category, in stock', 'loans by customer and date', 'returned books by name and customer']
+
+
+def make_values(library, sizes, rng):
+    return {'cust_id': rng.randint(1, sizes['customers']),
+            'category': rng.choice(list(library.BookCategory)),
+            'since': datetime.now() - timedelta(days=rng.uniform(1, 12)),
+            'last_name': rng.choice(LAST_NAMES)}
+
+
+# ------------ TIMING =============================================
+# ================================================================
+def time_calls(call, make_kwargs, iterations, warmup):
+    for _ in range(warmup):
+        call(**make_kwargs())
+    latencies = []
+    for _ in range(iterations):
+        kwargs = make_kwargs()
+        started = time.perf_counter()
+        call(**kwargs)
+        latencies.append((time.perf_counter() - started) * 1000000)
+    latencies.sort()
+    return {'p50_us': round(percentile(latencies, 0.50), 1),
+            'p95_us': round(percentile(latencies, 0.95), 1),
+            'mean_us': round(statistics.fmean(latencies), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--db', help="SQLite file to seed/use (default: a new temporary file)")
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1234, help="random seed")
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    db_path = os.path.abspath(args.db) if args.db else os.path.join(tempfile.mkdtemp(prefix='library-bench-'), 'library.db')
+    needs_seed = not os.path.exists(db_path)
+# The app reads the database address when its imported:
+    os.environ['LIBRARY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as library
+
+    rng = random.Random(args.seed)
+    with library.app.app_context():
+        if needs_seed:
+            print(f"Seeding {db_path} with {sizes}")
+            seed_database(library, sizes, rng)
+        session = library.db.session
+        print(f"{'case':38} {'':20} {'p50 us':>10} {'p95 us':>10} {'mean us':>10}")
+        for name in CASES:
+            orm, cached = orm_case(library, name), cached_case(library, name)
+            make_kwargs = lambda: make_values(library, sizes, rng)
+            dialect = session.get_bind().dialect
+# The ORM query carries its values in the statement, the cached statement gets them as parameters:
+            def orm_run(**kw):
+                return session.execute(orm(**kw).statement).all()
+            def cached_run(**kw):
+                search = cached(**kw)
+                return session.execute(search.statement(), search.parameters()).all()
+            timings = {
+                'orm build+run': time_calls(orm_run, make_kwargs, args.iterations, args.warmup),
+                'cached build+run': time_calls(cached_run, make_kwargs, args.iterations, args.warmup),
+                'orm build+compile': time_calls(lambda **kw: orm(**kw).statement.compile(dialect=dialect), make_kwargs, args.iterations, args.warmup),
+                'cached build+compile': time_calls(lambda **kw: cached(**kw).statement().compile(dialect=dialect), make_kwargs, args.iterations, args.warmup) }
+            for label, timing in timings.items():
+                print(f"{name:38} {label:20} {timing['p50_us']:>10} {timing['p95_us']:>10} {timing['mean_us']:>10}")
+            session.rollback()
+
+
+if __name__ == '__main__':
+    main()
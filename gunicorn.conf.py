@@ -0,0 +1,33 @@
+"""
+gunicorn settings of the Library server - gunicorn -c gunicorn.conf.py wsgi:app
+Every setting can be changed with its LIBRARY_* environment variable.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('LIBRARY_BIND', '0.0.0.0:5000')
+# SQLite has one writer - more workers only help the reads, the writes wait in the write queue of every worker (see WriteGate):
+workers = int(os.environ.get('LIBRARY_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = 'gthread'
+threads = int(os.environ.get('LIBRARY_THREADS', 4))
+# Load app.py once in the master (schema + imports), the workers are forked from it:
+preload_app = True
+timeout = int(os.environ.get('LIBRARY_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+# Workers are replaced after this many requests (with some jitter so they dont restart together), the warm up keeps it cheap:
+max_requests = int(os.environ.get('LIBRARY_MAX_REQUESTS', 10000))
+max_requests_jitter = 1000
+accesslog = os.environ.get('LIBRARY_ACCESS_LOG', '-')
+
+
+def post_fork(server, worker):
+# The engines of the master were disposed before the fork, make sure the worker starts with empty pools:
+    from app import reopen_connections_after_fork
+    reopen_connections_after_fork()
+
+
+def post_worker_init(worker):
+# Runs in the worker before it accepts connections - /readyz answers 200 only after this:
+    from app import warm_up_worker
+    warm_up_worker()
@@ -0,0 +1,156 @@
+"""
+Cached statements of the search routes - one Core SELECT for every combination of filters a route can get,
+built the first time that combination is asked for, with bound parameters for the values.
+The same statement object comes back on every call, so SQLAlchemy reuses its cache key and its compiled SQL
+instead of building an ORM query chain and compiling it again on every request.
+The rows are plain Core rows (the columns can be read as attributes, like the models) and not ORM objects in the session.
+
+Pages are keyset pages - the rows are always sorted by a stable key ending with the id (the bm25 rank first for full text matches)
+and the cursor of the next page holds the sort key of the last row, so a page deep in the results costs the same as the first one.
+"""
+import base64
+from datetime import datetime
+import json
+import operator
+from sqlalchemy import DateTime, bindparam, column, func, literal_column, select, table, tuple_
+
+
+# The operators a filter can use, applied to (column, bound parameter):
+OPERATORS = {
+    'eq': operator.eq,
+    'ge': operator.ge,
+    'lt': operator.lt,
+    'like': lambda table_column, value: table_column.ilike(value) }
+
+
+def parameter_name(column_name, operator_name):
+    return f"{column_name}_{operator_name}"
+
+
+class SearchStatements:
+    """
+    The statements of one searched table, keyed by the filters used (in the order the route adds them),
+    if the full text index is joined and the paging parts (cursor, limit) they need, plus the count of all the results of the filters.
+    order - the columns the rows are sorted by, the last one has to be unique (the id).
+    """
+    def __init__(self, source, fts_name=None, order=('id',)):
+        self.source = source
+        self.fts_name = fts_name
+        self.fts = table(fts_name, column('rowid'), column('rank')) if fts_name else None
+        self.order = [source.c[name] for name in order]
+        self._statements = {}
+
+    def new(self):
+        return SearchQuery(self)
+
+    def sort_key(self, match):
+# Ranked by bm25 like the full text search always was, the ties (and the searches without the index) in the order of the table:
+        return [self.fts.c.rank] + self.order if match else self.order
+
+    def statement(self, filters, match=False, after=False, limit=False):
+        key = (tuple(filters), match, after, limit)
+        statement = self._statements.get(key)
+        if statement is None:
+# Two threads may build the same one at the same time, setdefault keeps the first:
+            statement = self._statements.setdefault(key, self._build(*key))
+        return statement
+
+    def count_statement(self, filters, match=False):
+        key = ('count', tuple(filters), match)
+        statement = self._statements.get(key)
+        if statement is None:
+# Without the ORDER BY, the rows are only counted:
+            statement = self._statements.setdefault(key, select(func.count()).select_from(self._build(tuple(filters), match).order_by(None).subquery()))
+        return statement
+
+    def combinations(self):
+# The (filters, full text match) of every statement built so far, the plan checks have to cover all of them:
+        return {key[1:] if key[0] == 'count' else key[:2] for key in self._statements}
+
+    def _build(self, filters, match, after=False, limit=False):
+        statement = select(self.source)
+        for column_name, operator_name in filters:
+            statement = statement.where(OPERATORS[operator_name](self.source.c[column_name], bindparam(parameter_name(column_name, operator_name))))
+        if match:
+# The rowid of the index is the id of the row, the rank is returned for the cursor of the page:
+            statement = (statement.add_columns(self.fts.c.rank.label('search_rank'))
+                                  .join(self.fts, self.fts.c.rowid == self.source.c.id)
+                                  .where(literal_column(self.fts_name).op('MATCH')(bindparam('match'))))
+        sort_key = self.sort_key(match)
+        if after:
+            statement = statement.where(tuple_(*sort_key) > tuple_(*[bindparam(f'after_{i}', type_=key.type) for i, key in enumerate(sort_key)]))
+        statement = statement.order_by(*sort_key)
+        if limit:
+            statement = statement.limit(bindparam('limit'))
+        return statement
+
+
+class SearchQuery:
+    """
+    The filters of one search call - collects the filters and their values, then runs the cached statement of that combination.
+    """
+    def __init__(self, statements):
+        self.statements = statements
+        self.filters = []
+        self.params = {}
+        self.phrases = []
+
+    def where(self, column_name, operator_name, value):
+        self.filters.append((column_name, operator_name))
+        self.params[parameter_name(column_name, operator_name)] = value
+        return self
+
+    def match(self, phrase):
+# Full text phrases of all the columns go into one MATCH, joined with AND:
+        self.phrases.append(phrase)
+        return self
+
+    def statement(self):
+        return self.statements.statement(self.filters, match=bool(self.phrases))
+
+    def parameters(self):
+        if self.phrases:
+            return {**self.params, 'match': ' AND '.join(self.phrases)}
+        return self.params
+
+    def all(self, session):
+        return session.execute(self.statement(), self.parameters()).all()
+
+    def page(self, session, limit, after=None, count=False):
+        """
+        Runs one page of the search - after is the decoded cursor of the page before (decode_cursor), count asks for the number of all the results.
+        Returns (rows, cursor of the next page or None, total count or None).
+        """
+        match = bool(self.phrases)
+        params = dict(self.parameters(), limit=limit + 1)
+        if after is not None:
+            params.update({f'after_{i}': value for i, value in enumerate(after)})
+        statement = self.statements.statement(self.filters, match=match, after=after is not None, limit=True)
+# One row more than the page tells if there is a next page:
+        rows = session.execute(statement, params).all()
+# The count is its own query - a window count(*) in the page query would read and sort all the results before the LIMIT:
+        total = session.execute(self.statements.count_statement(self.filters, match=match), self.parameters()).scalar() if count else None
+        if len(rows) <= limit:
+            return rows, None, total
+        rows = rows[:limit]
+        return rows, self.encode_cursor(rows[-1]), total
+
+    def encode_cursor(self, row):
+# The sort key of the row - the rank first for a full text match, then the order columns:
+        values = [row.search_rank] if self.phrases else []
+        values += [getattr(row, key.name) for key in self.statements.order]
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+# Raises ValueError if its broken, or if it was made by a search with other filters:
+        order = self.statements.order
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            if not isinstance(values, list) or len(values) != len(order) + bool(self.phrases):
+                raise ValueError("wrong number of values")
+            rank = [float(values.pop(0))] if self.phrases else []
+            return rank + [datetime.fromisoformat(value) if isinstance(key.type, DateTime) else key.type.python_type(value)
+                           for key, value in zip(order, values)]
+        except (ValueError, TypeError, UnicodeDecodeError) as e:
+            raise ValueError(f"invalid cursor '{cursor}'") from e
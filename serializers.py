@@ -0,0 +1,148 @@
+"""
+Response serialization for the Library application server -
+date formatting in the store time zone and the row -> dict builders of the list routes
+"""
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from operator import attrgetter
+import pytz
+from audit_events import decode_params, render
+
+
+# The store time zone, the dates are shown to the workers in this time (with day time saving changes):
+LOCAL_TIMEZONE = 'Asia/Jerusalem'
+EPOCH = datetime(1970, 1, 1)
+
+
+class LocalTimeFormatter:
+    """
+    Formats datetimes in one time zone without going through pytz for every value:
+    the zone is resolved once and its UTC offset changes are kept as a sorted list of timestamps,
+    so finding the offset of a date is a bisect.
+    """
+    def __init__(self, zone_name):
+        zone = pytz.timezone(zone_name)
+        transitions = getattr(zone, '_utc_transition_times', None)
+        if transitions:
+            self._starts = [(moment - EPOCH).total_seconds() for moment in transitions]
+            self._offsets = [info[0].total_seconds() for info in zone._transition_info]
+        else:
+# Zones without day time saving (like UTC) have one fixed offset:
+            self._starts = [float('-inf')]
+            self._offsets = [zone.utcoffset(datetime(2000, 1, 1)).total_seconds()]
+
+    def to_local(self, value):
+# Naive datetimes are server local time (datetime.now()), same as datetime.astimezone() reads them:
+        timestamp = value.timestamp()
+        offset = self._offsets[max(bisect_right(self._starts, timestamp) - 1, 0)]
+        return EPOCH + timedelta(seconds=int(timestamp + offset))
+
+    def format_datetime(self, value):
+# Same output as strftime('%d/%m/%Y, %H:%M.%S'):
+        if value is None:
+            return None
+        local = self.to_local(value)
+        return f"{local.day:02d}/{local.month:02d}/{local.year}, {local.hour:02d}:{local.minute:02d}.{local.second:02d}"
+
+    def format_date(self, value):
+# Same output as strftime('%d/%m/%Y'):
+        if value is None:
+            return None
+        local = self.to_local(value)
+        return f"{local.day:02d}/{local.month:02d}/{local.year}"
+
+
+local_time = LocalTimeFormatter(LOCAL_TIMEZONE)
+format_datetime = local_time.format_datetime
+format_date = local_time.format_date
+
+
+def whole_row(row):
+    return row
+
+
+def render_log_entry(row):
+    return render(row.event, row.params)
+
+
+def enum_value(value):
+    return value.value if value is not None else None
+
+
+class RowSerializer:
+    """
+    Builds the response dict of a model row from a fixed list of (response key, attribute, converter),
+    the attribute getters are made once instead of on every row. An attribute of None gives the converter the whole row.
+    """
+    def __init__(self, fields):
+        self.fields = [(key, attrgetter(attribute) if attribute else whole_row, converter) for key, attribute, converter in fields]
+        self.keys = [key for key, _, _ in fields]
+
+    def __call__(self, row):
+        return {key: converter(getter(row)) if converter else getter(row) for key, getter, converter in self.fields}
+
+    def many(self, rows):
+        return [self(row) for row in rows]
+
+
+# The rows of every list route, keys are the ones the frontend reads:
+customer_row = RowSerializer([
+    ('Name', 'name', None),
+    ('Id', 'id', None),
+    ('City', 'city', None),
+    ('Age', 'age', None),
+    ('Phone_number', 'phone_number', None),
+    ('Deactivated_status', 'is_deactivated', None) ])
+
+book_row = RowSerializer([
+    ('id', 'id', None),
+    ('name', 'name', None),
+    ('author', 'author', None),
+    ('year_published', 'year_published', None),
+    ('loan type', 'type', enum_value),
+    ('category', 'category', enum_value),
+    ('quantity', 'book_quantity', None),
+    ('is_out_of_stock', 'is_out_of_stock', None) ])
+
+loan_row = RowSerializer([
+    ('loan_ID', 'id', None),
+    ('Customer_Name', 'cust_name', None),
+    ('Customer_ID', 'cust_id', None),
+    ('Customer_phone number', 'cust_phonenumber', None),
+    ('Book_Name', 'book_name', None),
+    ('Book_ID', 'book_id', None),
+    ('Loan_Date', 'loan_date', format_datetime),
+    ('Return_Due_Date', 'return_due_date', format_datetime) ])
+
+late_loan_row = RowSerializer([
+    ('Loan_ID', 'id', None),
+    ('Customer_ID', 'cust_id', None),
+    ('Customer_name', 'cust_name', None),
+    ('Customer_phone number', 'cust_phonenumber', None),
+    ('Book_Name', 'book_name', None),
+    ('Book_ID', 'book_id', None),
+    ('loan_date', 'loan_date', format_datetime),
+    ('return_due_date', 'return_due_date', format_datetime) ])
+
+returned_book_row = RowSerializer([
+    ('id', 'id', None),
+    ('book_name', 'book_name', None),
+    ('cust_name', 'cust_name', None),
+    ('cust_id', 'cust_id', None),
+    ('loan_id', 'loan_id', None),
+    ('cust_phonenumber', 'cust_phonenumber', None),
+    ('loan_date', 'loan_date', format_datetime),
+    ('returned_date', 'returned_date', format_datetime) ])
+
+# The log card HTML is made from the event template here, when the row is read:
+log_entry_row = RowSerializer([
+    ('id', 'id', None),
+    ('action', None, render_log_entry),
+    ('timestamp', 'timestamp', format_datetime) ])
+
+# The same rows without the HTML, for clients that render the events themselves (/log_entries?render=false):
+log_event_row = RowSerializer([
+    ('id', 'id', None),
+    ('event', 'event', None),
+    ('params', 'params', decode_params),
+    ('timestamp', 'timestamp', format_datetime) ])
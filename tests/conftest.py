@@ -0,0 +1,94 @@
+"""
+Shared setup of the tests - the app reads its database address when its imported,
+so a throwaway SQLite file is set before the first import.
+"""
+import contextlib
+import logging
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+TEST_DIR = tempfile.mkdtemp(prefix='library-tests-')
+os.environ.setdefault('LIBRARY_DATABASE_URI', f"sqlite:///{os.path.join(TEST_DIR, 'library.db')}")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The app logs to library.log in the working directory unless logging is set up before its import:
+logging.basicConfig(filename=os.path.join(TEST_DIR, 'library.log'), level=logging.INFO)
+
+import app as library
+
+# The metric files and the log archive go to the temporary folder too, not to the instance folder of the repo:
+library.app.config['METRICS_DIR'] = os.path.join(TEST_DIR, 'metrics')
+library.app.config['LOG_ARCHIVE_DIR'] = os.path.join(TEST_DIR, 'log_archive')
+
+
+@pytest.fixture
+def client():
+# Every test starts from the 5 sample customers and books of /reset_database:
+    library.app.config['TESTING'] = True
+    with library.app.app_context():
+        library.prepare_database()
+    client = library.app.test_client()
+    assert client.post('/reset_database').status_code == 201
+    return client
+
+
+def log_rows():
+# The batched writer is flushed first so the count has every row written so far:
+    library.audit_log_writer.flush()
+    with library.app.app_context():
+        return library.LogEntry.query.count()
+
+
+@contextlib.contextmanager
+def sql_statements():
+# The SQL statements this thread runs inside the block (the test client runs the request in the calling thread, the audit log writer has its own):
+    statements = []
+    thread = threading.get_ident()
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            statements.append(statement)
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+
+
+class ClockType(type):
+# The app checks isinstance(value, datetime) on the rows it read, those are plain datetimes:
+    def __instancecheck__(cls, value):
+        return isinstance(value, datetime)
+
+
+class FixedClock(datetime, metaclass=ClockType):
+# Stands for the datetime of the app, so the routes write their loans and returns on the days a test picks:
+    current = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current if tz is None else cls.current.astimezone(tz)
+
+
+def make_loan_history(client, monkeypatch):
+# Loans on two days, one return on time and two late ones 15 days later (every book type is late by then), two loans left open -
+# through the single and the batch routes:
+    monkeypatch.setattr(library, 'datetime', FixedClock)
+    start = datetime(2024, 3, 4, 10)
+    steps = [(0, '/loan_book', {'cust_id': 1, 'book_id': 1}),
+             (0, '/loan_books', [{'cust_id': 2, 'book_id': 2}, {'cust_id': 1, 'book_id': 3}]),
+             (0, '/loan_book', {'cust_id': 3, 'book_id': 4}),
+             (1, '/loan_book', {'cust_id': 4, 'book_id': 5}),
+             (3, '/return_book', {'cust_id': 1, 'book_id': 1}),
+             (15, '/return_books', [{'cust_id': 2, 'book_id': 2}, {'cust_id': 1, 'book_id': 3}])]
+    for days, route, body in steps:
+        FixedClock.current = start + timedelta(days=days, minutes=len(route))
+        response = client.post(route, json=body)
+        assert response.status_code in (200, 201), (route, response.get_json())
+        if isinstance(body, list):
+            assert all(item['status'] == 201 for item in response.get_json()['results']), response.get_json()
@@ -0,0 +1,47 @@
+import pytest
+
+import app as library
+from conftest import sql_statements
+
+
+@pytest.fixture
+def writer(client, monkeypatch):
+# A writer of its own, its thread sleeps through the test so only the flushes of the test write rows:
+    monkeypatch.setitem(library.app.config, 'AUDIT_LOG_FLUSH_INTERVAL', 60)
+    monkeypatch.setitem(library.app.config, 'AUDIT_LOG_QUEUE_SIZE', 5)
+    writer = library.AuditLogWriter(library.app)
+    yield writer
+    writer.shutdown()
+
+
+def written_texts():
+    with library.app.app_context():
+        rows = library.LogEntry.query.filter_by(event=library.TEXT_EVENT).order_by(library.LogEntry.id).all()
+        return [row.params for row in rows]
+
+
+def texts(numbers):
+    return [library.encode_params({"text": f"row {number}"}) for number in numbers]
+
+
+def test_flush_writes_the_queued_rows_in_one_batch_in_order(writer):
+    for number in range(4):
+        writer.write(library.TEXT_EVENT, {"text": f"row {number}"})
+    assert written_texts() == []
+
+    with sql_statements() as statements:
+        writer.flush()
+
+    assert len([statement for statement in statements if statement.startswith('INSERT INTO log_entry')]) == 1
+    assert written_texts() == texts(range(4))
+
+
+def test_full_queue_is_written_by_the_request_thread(writer):
+    for number in range(6):
+        writer.write(library.TEXT_EVENT, {"text": f"row {number}"})
+# The sixth row found the queue full - it was written after the 5 waiting rows, without a flush:
+    assert written_texts() == texts(range(6))
+
+    writer.write(library.TEXT_EVENT, {"text": "row 6"})
+    writer.flush()
+    assert written_texts() == texts(range(7))
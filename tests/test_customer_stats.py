@@ -0,0 +1,29 @@
+import app as library
+from conftest import make_loan_history
+
+
+def customer_stats():
+    with library.app.app_context():
+        return [(row.cust_id, row.active_loans, row.total_loans, row.total_returns, row.late_returns, row.last_activity)
+                for row in library.CustomerStats.query.order_by(library.CustomerStats.cust_id)]
+
+
+def test_rebuild_gives_the_rows_the_routes_kept(client, monkeypatch):
+    make_loan_history(client, monkeypatch)
+    live = customer_stats()
+    assert [row[:5] for row in live] == [(1, 0, 2, 2, 1), (2, 0, 1, 1, 1), (3, 1, 1, 0, 0), (4, 1, 1, 0, 0)]
+
+    with library.app.app_context():
+        assert library.rebuild_customer_stats() == 4
+
+    assert customer_stats() == live
+
+
+def test_summary_reads_the_kept_row(client, monkeypatch):
+    make_loan_history(client, monkeypatch)
+
+    response = client.get('/customer/1/summary')
+
+    assert response.status_code == 200
+    body = response.get_json()['success']
+    assert (body['total_loans'], body['active_loans'], body['late_returns'], body['on_time_returns']) == (2, 0, 1, 1)
@@ -0,0 +1,32 @@
+import app as library
+from conftest import make_loan_history
+
+
+def daily_stats():
+    with library.app.app_context():
+        return [(row.day, row.category, row.loans, row.returns, row.late_returns)
+                for row in library.DailyLoanStats.query.order_by(library.DailyLoanStats.day, library.DailyLoanStats.category)]
+
+
+def test_rebuild_gives_the_rows_the_routes_kept(client, monkeypatch):
+    make_loan_history(client, monkeypatch)
+    live = daily_stats()
+    assert sum(row[2] for row in live) == 5
+    assert sum(row[3] for row in live) == 3
+
+    with library.app.app_context():
+        assert library.rebuild_daily_stats() == len(live)
+
+    assert daily_stats() == live
+
+
+def test_history_sums_the_days_by_week(client, monkeypatch):
+    make_loan_history(client, monkeypatch)
+
+    response = client.get('/stats/history', query_string={'from': '2024-03-04', 'to': '2024-03-24', 'granularity': 'week'})
+
+    assert response.status_code == 200
+    buckets = response.get_json()['success']['buckets']
+    assert [(bucket['start'], bucket['loans'], bucket['returns'], bucket['late_returns']) for bucket in buckets] == [
+        ('2024-03-04', 5, 1, 0), ('2024-03-11', 0, 0, 0), ('2024-03-18', 0, 2, 2)]
+    assert buckets[2]['late_return_rate'] == 1.0
@@ -0,0 +1,47 @@
+import csv
+import gzip
+import io
+import json
+
+import app as library
+
+
+def make_loans(client):
+    for cust_id, book_id in [(1, 1), (2, 2), (1, 3), (3, 4)]:
+        assert client.post('/loan_book', json={'cust_id': cust_id, 'book_id': book_id}).status_code == 201
+    with library.app.app_context():
+        return [library.loan_row(loan) for loan in library.Loan.query.order_by(library.Loan.id)]
+
+
+def test_gzip_ndjson_export_reads_back_as_the_loan_rows(client, monkeypatch):
+# Small fetches and pieces, so the export is made of many gzip pieces:
+    monkeypatch.setitem(library.app.config, 'EXPORT_FETCH_SIZE', 1)
+    monkeypatch.setitem(library.app.config, 'EXPORT_FLUSH_BYTES', 10)
+    loans = make_loans(client)
+
+    response = client.get('/export/loans', query_string={'format': 'ndjson', 'gzip': 'true'})
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/gzip'
+    assert response.headers['Content-Disposition'].endswith('.ndjson.gz"')
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert [json.loads(line) for line in lines] == loans
+
+
+def test_csv_export_keeps_the_filters_of_the_search(client, monkeypatch):
+    monkeypatch.setitem(library.app.config, 'EXPORT_FLUSH_BYTES', 10)
+    loans = make_loans(client)
+
+    response = client.get('/export/loans', query_string={'cust_id': '1'})
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.reader(io.StringIO(response.data.decode())))
+    assert rows[0] == library.loan_row.keys
+    assert rows[1:] == [[str(value) for value in loan.values()] for loan in loans if loan['Customer_ID'] == 1]
+
+
+def test_export_with_a_bad_date_answers_400(client):
+    response = client.get('/export/loans', query_string={'start_date': '01/01/2024'})
+
+    assert response.status_code == 400
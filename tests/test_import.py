@@ -0,0 +1,61 @@
+import io
+
+import app as library
+
+
+def book_names():
+    with library.app.app_context():
+        return {book.name for book in library.Book.query.all()}
+
+
+def test_csv_import_reports_the_failed_rows_and_writes_the_others(client, monkeypatch):
+# Chunks of 2 rows, so the good rows are written in more than one chunk around the failed ones:
+    monkeypatch.setitem(library.app.config, 'IMPORT_CHUNK_SIZE', 2)
+    existing = sorted(book_names())[0]
+    upload = "\n".join([
+        "name,author,year_published,type,category,quantity",
+        "Dracula,Bram Stoker,1897,1,Horror,2",
+        "Emma,Jane Austen,1815,7,Romance,1",
+        f"{existing},Someone,2000,1,Horror,1",
+        "Ulysses,,1922,2,History,1",
+        "Rebecca,Daphne du Maurier,1938,3,Romance,1",
+        "dracula,Bram Stoker,1897,1,Horror,1",
+        "Beloved,Toni Morrison,1987,1,Mystery,3"])
+
+    response = client.post('/import/books', data={'file': (io.BytesIO(upload.encode()), 'books.csv')})
+
+    assert response.status_code == 201
+    report = response.get_json()['success']
+    assert (report['imported'], report['failed']) == (3, 4)
+    assert [error['row'] for error in report['errors']] == [2, 3, 4, 6]
+    assert report['errors'][0]['error'].startswith("Invalid type '7'")
+    assert report['errors'][1]['error'] == f"already exists in DataBase ({existing.lower()})"
+    assert report['errors'][2]['error'] == "Missing required fields: author"
+    assert report['errors'][3]['error'] == "duplicate of an earlier row in the file (dracula)"
+    assert {'Dracula', 'Rebecca', 'Beloved'} <= book_names()
+    assert not {'Emma', 'Ulysses'} & book_names()
+
+
+def test_ndjson_import_reports_lines_that_are_not_objects(client):
+    upload = "\n".join([
+        '{"name": "Zoe Hart", "city": "Boston", "age": 30, "phone_number": "054-1111111"}',
+        '{"name": "Broken", ',
+        '["not", "an", "object"]',
+        '{"name": "Ian Wright", "city": "Denver", "age": 44, "phone_number": "054-2222222"}'])
+
+    response = client.post('/import/customers', data=upload, content_type='application/x-ndjson')
+
+    assert response.status_code == 201
+    report = response.get_json()['success']
+    assert (report['imported'], report['failed']) == (2, 2)
+    assert report['errors'][0]['row'] == 2 and report['errors'][0]['error'].startswith('invalid JSON')
+    assert report['errors'][1] == {"row": 3, "error": "each line must be a JSON object"}
+
+
+def test_import_with_only_failed_rows_answers_200(client):
+    upload = "name,city,age,phone_number\nNobody,,20,054-3333333\n"
+
+    response = client.post('/import/customers', data=upload, content_type='text/csv')
+
+    assert response.status_code == 200
+    assert response.get_json()['success']['errors'] == [{"row": 1, "error": "Missing required fields: city"}]
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import app as library
+
+
+ARCHIVED = [datetime(2020, 3, 5, 10), datetime(2020, 3, 20, 10), datetime(2020, 5, 2, 10), datetime(2020, 5, 9, 10)]
+
+
+def archive_old_entries(monkeypatch, tmp_path):
+# Old entries next to the ones of /reset_database, moved to the month files like 'flask --app app archive-logs' does:
+    monkeypatch.setitem(library.app.config, 'LOG_ARCHIVE_DIR', str(tmp_path))
+    monkeypatch.setitem(library.app.config, 'LOG_ARCHIVE_PAUSE_SECONDS', 0)
+    library.audit_log_writer.flush()
+    with library.app.app_context():
+        entries = [library.LogEntry(event=library.TEXT_EVENT, params=library.encode_params({"text": f"old {i}"}), timestamp=timestamp)
+                   for i, timestamp in enumerate(ARCHIVED)]
+        library.db.session.add_all(entries)
+        library.db.session.commit()
+        ids = [entry.id for entry in entries]
+        assert library.log_archive.archive(older_than_days=365) == len(ARCHIVED)
+        live_ids = [entry.id for entry in library.LogEntry.query.all()]
+    return ids, live_ids
+
+
+def test_end_date_only_range_reads_the_archived_months(client, monkeypatch, tmp_path):
+    ids, live_ids = archive_old_entries(monkeypatch, tmp_path)
+
+    response = client.get('/log_entries', query_string={'end_date': '2020-04-30', 'render': 'false'})
+
+    assert response.status_code == 200
+    assert [row['id'] for row in response.get_json()] == [ids[1], ids[0]]
+
+
+def test_paging_without_dates_continues_into_the_archive(client, monkeypatch, tmp_path):
+    ids, live_ids = archive_old_entries(monkeypatch, tmp_path)
+    seen = []
+    query = {'limit': '3', 'render': 'false'}
+    while True:
+        response = client.get('/log_entries', query_string=query)
+        assert response.status_code == 200
+        seen += [row['id'] for row in response.get_json()]
+        if 'X-Next-Cursor' not in response.headers:
+            break
+        query['before'] = response.headers['X-Next-Cursor']
+
+# The live rows newest first (the searches of this test came after the cursor and arent on the pages), then the archived ones:
+    assert seen == sorted(live_ids, reverse=True) + list(reversed(ids))
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+import app as library
+
+
+def add_log_row(text, timestamp):
+    with library.app.app_context():
+        entry = library.LogEntry(event=library.TEXT_EVENT, params=library.encode_params({"text": text}), timestamp=timestamp)
+        library.db.session.add(entry)
+        library.db.session.commit()
+        return entry.id
+
+
+def test_tail_gets_a_back_dated_row_committed_after_the_poll(client):
+    first = client.get('/log_entries', query_string={'render': 'false'})
+    assert first.status_code == 200
+    tail = first.headers['X-Tail-Cursor']
+
+# Another worker commits its batch late - the action happened before the newest row the client has seen:
+    late_id = add_log_row("late batch", datetime.now() - timedelta(hours=1))
+
+    response = client.get('/log_entries', query_string={'after': tail, 'render': 'false'})
+    assert response.status_code == 200
+    assert late_id in [row['id'] for row in response.get_json()]
+# And the next poll starts after it:
+    again = client.get('/log_entries', query_string={'after': response.headers['X-Tail-Cursor'], 'render': 'false'})
+    assert late_id not in [row['id'] for row in again.get_json()]
+
+
+def test_tail_pages_follow_the_ids(client):
+    tail = client.get('/log_entries').headers['X-Tail-Cursor']
+    ids = [add_log_row(f"row {i}", datetime.now() - timedelta(minutes=i)) for i in range(5)]
+    seen = []
+    while True:
+        response = client.get('/log_entries', query_string={'after': tail, 'limit': '2', 'render': 'false'})
+        rows = [row['id'] for row in response.get_json()]
+        if not rows:
+            break
+        seen += reversed(rows)
+        tail = response.headers['X-Tail-Cursor']
+    assert [row_id for row_id in seen if row_id in ids] == ids
@@ -0,0 +1,37 @@
+import json
+import os
+import subprocess
+import sys
+
+import app as library
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def metric_value(text, line_start):
+    return sum(float(line.rsplit(' ', 1)[1]) for line in text.splitlines() if line.startswith(line_start))
+
+
+def test_dead_worker_files_keep_their_counters_but_not_their_gauges(client):
+    directory = library.request_metrics.directory
+    os.makedirs(directory, exist_ok=True)
+    pid = dead_pid()
+# The last file a recycled worker wrote - 7 requests and 5 write requests it was holding when it stopped:
+    with open(os.path.join(directory, f"metrics_{pid}.json"), 'w') as f:
+        json.dump({"requests": [[["dead_route", "GET", "200"], 7]], "latency": [], "sql_statements": [], "sql_seconds": [],
+                   "commits": [], "lock_errors": [], "write_waits": [], "write_rejected": [],
+                   "gauges": [["library_write_queue_running", "Write requests holding a write place (all workers).", 5]]}, f)
+
+    for _ in range(2):
+        text = client.get('/metrics').get_data(as_text=True)
+# The counters of the dead worker stay in the totals (once, also on the next scrape):
+        assert metric_value(text, 'library_http_requests_total{endpoint="dead_route"') == 7
+# The gauge only has the live worker, which has no write request running during a GET:
+        assert metric_value(text, 'library_write_queue_running') == 0
+        names = os.listdir(directory)
+        assert f"metrics_{pid}.json" not in names
+        assert f"retired_{os.getpid()}.json" in names
@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+
+import app as library
+from conftest import sql_statements
+
+
+def make_loan_late(days=3):
+    with library.app.app_context():
+        loan = library.Loan.query.one()
+        loan.return_due_date = datetime.now() - timedelta(days=days)
+        library.db.session.commit()
+
+
+def test_late_loan_is_found_until_it_is_returned(client):
+    assert client.post('/loan_book', json={'cust_id': 1, 'book_id': 1}).status_code == 201
+    make_loan_late()
+    library.overdue_tracker.invalidate()
+    assert client.get('/search_late_loans').status_code == 200
+
+    assert client.post('/return_book', json={'cust_id': 1, 'book_id': 1}).status_code == 201
+    assert client.get('/search_late_loans').status_code == 404
+    assert client.get('/stats').get_json()['success']['total_loans_late_on_returns'] == 0
+
+
+def test_check_reads_the_earliest_due_date_once_per_refresh(client, monkeypatch):
+    monkeypatch.setitem(library.app.config, 'OVERDUE_TRACKER_REFRESH_SECONDS', 60)
+    assert client.post('/loan_book', json={'cust_id': 1, 'book_id': 1}).status_code == 201
+    make_loan_late()
+    with library.app.app_context():
+        library.overdue_tracker.invalidate()
+        with sql_statements() as statements:
+            assert library.overdue_tracker.has_overdue_loans(datetime.now())
+            assert library.overdue_tracker.has_overdue_loans(datetime.now())
+    assert len(statements) == 1
+    assert 'min(loan.return_due_date)' in statements[0]
@@ -0,0 +1,63 @@
+"""
+The query plan checks of 'check-query-plans' - every statement the search routes build has to be checked,
+and every check has to pass, so dropping or changing an index the routes depend on fails here.
+"""
+import itertools
+
+from sqlalchemy import text
+
+from conftest import library
+
+
+# The parameters every search route reads, each with no value, a value and (for the text searches) a term too short for the full text index:
+ROUTE_PARAMETERS = {
+    '/search_customers': {'id': ['1'], 'name': ['ab', 'Smith*'], 'phone_number': ['05', '0501'], 'is_deactivated': ['false']},
+    '/search_books': {'name': ['ab', 'Harry'], 'author': ['Jo', 'Rowling*'], 'category': ['FANTASY'], 'out_of_stock': ['true']},
+    '/search_loans': {'cust_id': ['1'], 'book_id': ['2'], 'start_date': ['2024-01-01'], 'end_date': ['2030-01-01']},
+    '/search_late_loans': {},
+    '/Returned_Books_list': {'name': ['Smith'], 'id': ['1']} }
+
+
+def route_requests():
+    for route, parameters in ROUTE_PARAMETERS.items():
+        names = list(parameters)
+        for values in itertools.product(*[[None] + parameters[name] for name in names]):
+            query = {name: value for name, value in zip(names, values) if value is not None}
+            for extra in ({}, {'limit': '1', 'count': 'true'}):
+                yield route, {**query, **extra}
+
+
+def test_search_routes_only_build_checked_statements(client):
+    for route, query in route_requests():
+        response = client.get(route, query_string=query)
+# A search without results is a 404, it still built its statement:
+        assert response.status_code in (200, 404), (route, query, response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor:
+            assert client.get(route, query_string={**query, 'cursor': cursor}).status_code == 200
+    checked = {}
+    for route, searches, filters, match in library.search_filter_combinations():
+        checked.setdefault(id(searches), set()).add((tuple(filters), match))
+    for route, (searches, choices, can_match) in library.SEARCH_ROUTE_FILTERS.items():
+        assert searches.combinations() <= checked[id(searches)], route
+
+
+def test_query_plans_use_the_indexes(client):
+    with library.app.app_context():
+        problems = [(name, problem, plan) for name, plan, problem in library.query_plan_problems() if problem]
+    assert problems == []
+
+
+def test_dropped_index_fails_the_plan_check(client):
+    index = next(index for index in library.Book.__table__.indexes if index.name == 'ix_book_category')
+    with library.app.app_context():
+        with library.db.engine.begin() as connection:
+            connection.execute(text('DROP INDEX ix_book_category'))
+# EXPLAIN doesnt check if the schema changed, the connections of the pool would still plan with the index:
+        library.db.engine.dispose()
+        try:
+            problems = {name: problem for name, plan, problem in library.query_plan_problems() if problem}
+        finally:
+            index.create(library.db.engine)
+            library.db.engine.dispose()
+    assert problems['/search_books category eq: first page'] == 'FULL SCAN'
@@ -0,0 +1,32 @@
+import app as library
+
+
+def test_unchanged_search_answers_304_until_the_table_changes(client):
+    first = client.get('/search_books')
+    assert first.status_code == 200
+    etag = first.headers['ETag'].strip('"')
+
+    assert client.get('/search_books', headers={'If-None-Match': f'"{etag}"'}).status_code == 304
+
+    assert client.post('/add_book', json={'name': 'Dracula', 'author': 'Bram Stoker', 'year_published': 1897, 'type': 1, 'category': 'Horror'}).status_code == 201
+    changed = client.get('/search_books', headers={'If-None-Match': f'"{etag}"'})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'].strip('"') != etag
+    assert 'Dracula' in [book['name'] for book in changed.get_json()]
+
+
+def test_reset_invalidates_the_cache_of_another_worker(client):
+# A second cache stands for another worker - the reset only clears the cache of the worker that ran it:
+    other_worker = library.ResponseCache(library.app)
+    def search_loans_in_other_worker():
+        with library.app.test_request_context('/search_loans'):
+            return other_worker.serve(library.search_loans.__wrapped__, ('loan',), (), {})
+    assert client.post('/loan_book', json={'cust_id': 1, 'book_id': 1}).status_code == 201
+    before = search_loans_in_other_worker()
+    assert before.status_code == 200
+    assert len(before.get_json()) == 1
+
+    assert client.post('/reset_database').status_code == 201
+
+# No loans after the reset - a search without results is a 404:
+    assert search_loans_in_other_worker().status_code == 404
@@ -0,0 +1,35 @@
+from sqlalchemy import event
+
+import app as library
+
+
+def test_batch_return_of_a_loan_returned_meanwhile_fails_only_its_item(client):
+    for cust_id, book_id in [(1, 1), (2, 2)]:
+        assert client.post('/loan_book', json={'cust_id': cust_id, 'book_id': book_id}).status_code == 201
+    with library.app.app_context():
+        quantity = library.db.session.get(library.Book, 1).book_quantity
+
+# Another desk returns the first loan after the batch read it - its row is gone when the batch deletes it:
+    stolen = []
+    def return_first_loan_elsewhere(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('DELETE FROM loan') and not stolen:
+            stolen.append(parameters)
+            cursor.execute(statement, parameters)
+    with library.app.app_context():
+        engine = library.db.engine
+    event.listen(engine, 'before_cursor_execute', return_first_loan_elsewhere)
+    try:
+        response = client.post('/return_books', json=[{'cust_id': 1, 'book_id': 1}, {'cust_id': 2, 'book_id': 2}])
+    finally:
+        event.remove(engine, 'before_cursor_execute', return_first_loan_elsewhere)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['returned'], body['failed']) == (1, 1)
+    assert body['results'][0] == {"index": 0, "status": 404, "result": {"error_loan": {"bookid": 1, "custid": 1}}}
+    assert body['results'][1]['status'] == 201
+    with library.app.app_context():
+# Nothing of the batch was written for the first item, the second one is returned:
+        assert library.db.session.get(library.Book, 1).book_quantity == quantity
+        assert [row.cust_id for row in library.ReturnedBooks.query.all()] == [2]
+        assert library.Loan.query.count() == 0
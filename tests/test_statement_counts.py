@@ -0,0 +1,40 @@
+"""
+The number of SQL statements of the checkout routes - the lookups of a loan or a return are one query,
+a change that adds round trips to them fails here.
+"""
+from conftest import sql_statements
+
+
+def test_loan_and_return_statements(client):
+    with sql_statements() as loan:
+        assert client.post('/loan_book', json={'cust_id': 1, 'book_id': 1}).status_code == 201
+    with sql_statements() as return_:
+        assert client.post('/return_book', json={'cust_id': 1, 'book_id': 1}).status_code == 201
+
+# Loan: the eligibility query, the stock decrement, the loan and the two activity counters:
+    assert len(loan) == 5, loan
+# Return: the lookup query, the loan delete, the stock increment, the two activity counters and the returned book:
+    assert len(return_) == 6, return_
+
+
+def test_repeated_loans_dont_add_statements(client):
+# The second round of the same customer and book runs the same statements as the first one:
+    assert client.put('/update_book_quantity', json={'book_id': 2, 'quantity': 3}).status_code == 200
+    counts = []
+    for _ in range(2):
+        with sql_statements() as loan:
+            assert client.post('/loan_book', json={'cust_id': 2, 'book_id': 2}).status_code == 201
+        with sql_statements() as return_:
+            assert client.post('/return_book', json={'cust_id': 2, 'book_id': 2}).status_code == 201
+        counts.append((len(loan), len(return_)))
+    assert counts[0] == counts[1] == (5, 6)
+
+
+def test_lookup_routes_read_the_row_once(client):
+    for method, path, body in [('PUT', '/update_book_quantity', {'book_id': 2, 'quantity': 3}),
+                               ('PUT', '/deactivate_book/4', None),
+                               ('PUT', '/remove_customer/3', None)]:
+        with sql_statements() as statements:
+            assert client.open(path, method=method, json=body).status_code == 200
+# The read of the row, its UPDATE and the read of the new values for the answer:
+        assert len(statements) == 3, (path, statements)
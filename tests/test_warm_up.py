@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+
+import app as library
+from conftest import log_rows
+
+
+def test_warm_up_writes_no_audit_rows(client):
+# A late loan, so /search_late_loans has rows to log during the warm up:
+    assert client.post('/loan_book', json={'cust_id': 1, 'book_id': 1}).status_code == 201
+    with library.app.app_context():
+        loan = library.Loan.query.one()
+        loan.return_due_date = datetime.now() - timedelta(days=3)
+        library.db.session.commit()
+        library.overdue_tracker.reload()
+    before = log_rows()
+
+    library.warm_up_worker()
+
+    assert log_rows() == before
+
+
+def test_cached_answer_of_the_warm_up_is_still_logged(client):
+    library.warm_up_worker()
+    before = log_rows()
+# Served from the response cache the warm up filled, the search is logged for the user:
+    assert client.get('/search_books').status_code == 200
+    assert log_rows() == before + 1
@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+import app as library
+
+
+NEW_BOOK = {'name': 'Dracula', 'author': 'Bram Stoker', 'year_published': 1897, 'type': 1, 'category': 'Horror'}
+
+
+@pytest.fixture
+def held_gate(client):
+# The test holds the only write place, like a long write of another request:
+    assert library.write_gate.enter(time.perf_counter() + 60) is None
+    try:
+        yield library.write_gate
+    finally:
+        library.write_gate.leave()
+
+
+def book_names():
+    with library.app.app_context():
+        return [book.name for book in library.Book.query.all()]
+
+
+def test_full_queue_answers_503_with_retry_after(client, held_gate, monkeypatch):
+    monkeypatch.setitem(library.app.config, 'WRITE_QUEUE_MAX_WAITING', 0)
+    before = book_names()
+
+    started = time.perf_counter()
+    response = client.post('/add_book', json=NEW_BOOK)
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(library.app.config['WRITE_QUEUE_RETRY_AFTER'])
+# Refused at once and nothing written, the reads still go through:
+    assert time.perf_counter() - started < 1
+    assert book_names() == before
+    assert client.get('/search_books').status_code == 200
+
+
+def test_waiting_past_the_deadline_answers_503(client, held_gate, monkeypatch):
+    monkeypatch.setitem(library.app.config, 'WRITE_QUEUE_TIMEOUT', 0.05)
+
+    response = client.post('/add_book', json=NEW_BOOK)
+
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+    assert held_gate.waiting == 0
+
+
+def test_write_goes_through_once_the_place_is_free(client):
+    assert client.post('/add_book', json=NEW_BOOK).status_code == 201
+    assert library.write_gate.running == 0
+    assert 'Dracula' in book_names()
@@ -0,0 +1,11 @@
+"""
+Production entry point of the Library server:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The database schema is prepared here once when gunicorn loads the app (in the master process, gunicorn.conf.py preloads it),
+the workers only reopen their connections and warm up - see the hooks in gunicorn.conf.py.
+"""
+from app import app, start_server
+
+start_server()